@@ -0,0 +1,338 @@
+#  Copyright (c) 2020. RoguedBear
+import argparse
+import hashlib
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import secrets
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from typing import List
+
+import checker
+import config
+import engine
+import learner
+import store
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+         'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+         'consequat').split()
+
+# The kinds of noise lines, which change on every request without the webpage actually changing
+NOISE = ('timestamp', 'counter', 'token', 'hash')
+
+
+class PageFactory:
+    """
+    Generates the synthetic webpages served by the benchmark's server.
+    Every site has its own (seeded) content of about `size` bytes, with `noise` lines which change on every request
+    (timestamps, counters, tokens, hashes) and one article line which only changes when the site's version does.
+    size : int, bytes
+    noise: int, the number of noise lines per webpage
+
+    -----------
+    Methods:
+      - get_page(): returns the html of a site at a version
+    """
+
+    def __init__(self, size: int, noise: int):
+        self.size = size
+        self.noise = noise
+        self.requests = 0
+        self._templates = {}
+
+    def get_Template(self, site: int, version: int) -> List[str]:
+        """
+        Returns the html of a site at a version split around its noise lines, cached
+        :param site: int
+        :param version: int
+        :return: list of str, noise goes between its items
+        """
+        key = (site, version)
+        if key not in self._templates:
+            if len(self._templates) > 4096:
+                self._templates.clear()
+            generator = random.Random(site)
+            lines = ['<html>', f'<head><title>Site {site}</title></head>', '<body>']
+            while sum(len(line) + 1 for line in lines) < self.size:
+                lines.append(f"<p>{' '.join(generator.choices(WORDS, k=12))}</p>")
+            # The actual change
+            article = ' '.join(random.Random(f'{site}-{version}').choices(WORDS, k=8))
+            lines.insert(len(lines) // 2, f'<h2 class="article">{article}</h2>')
+            lines.append('</body></html>')
+
+            parts = []
+            step = max(1, len(lines) // (self.noise + 1))
+            for start in range(0, step * self.noise, step):
+                parts.append('\n'.join(lines[start:start + step]) + '\n')
+            parts.append('\n'.join(lines[step * self.noise:]) + '\n')
+            self._templates[key] = parts
+        return self._templates[key]
+
+    def get_Noise(self, kind: str) -> str:
+        """
+        Returns a noise line, different on every request
+        :param kind: str, one of NOISE
+        :return: str
+        """
+        if kind == 'timestamp':
+            return f'<span class="updated">Last updated: {datetime.now():%d %b %Y %H:%M:%S.%f}</span>\n'
+        if kind == 'counter':
+            return f'<p class="visitors">Visitors: {self.requests}</p>\n'
+        if kind == 'token':
+            return f'<input type="hidden" name="csrf" value="{secrets.token_hex(16)}">\n'
+        return f'<script src="/static/app.js?v={hashlib.sha1(secrets.token_bytes(8)).hexdigest()}"></script>\n'
+
+    def get_page(self, site: int, version: int) -> bytes:
+        """
+        Returns the html of a site at a version, with new noise
+        :param site: int
+        :param version: int
+        :return: bytes
+        """
+        self.requests += 1
+        parts = self.get_Template(site, version)
+        page = [parts[0]]
+        for index, part in enumerate(parts[1:]):
+            page.append(self.get_Noise(NOISE[index % len(NOISE)]))
+            page.append(part)
+        return ''.join(page).encode()
+
+
+def serve(size: int, noise: int, versions, port_queue) -> None:
+    """
+    The benchmark's server, runs in its own process so that it doesn't compete with the checks for the GIL.
+    Serves /<site> with the site's current version (versions[site]).
+    :param size: int, bytes per webpage
+    :param noise: int, noise lines per webpage
+    :param versions: multiprocessing.Array of the sites' versions, changed by the benchmark
+    :param port_queue: multiprocessing.Queue, the port is put on it once the server is listening
+    :return: None
+    """
+    factory = PageFactory(size, noise)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            try:
+                site = int(self.path.strip('/'))
+                body = factory.get_page(site, versions[site])
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+class BenchmarkEngine(engine.CheckEngine):
+    """
+    CheckEngine which records the seconds taken by every check and find_DeltaChange()
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_times = []
+        self.baseline_times = []
+
+    def check(self, webpage):
+        started = perf_counter()
+        try:
+            return super().check(webpage)
+        finally:
+            self.check_times.append(perf_counter() - started)
+
+    def baseline(self, webpage, wait_time):
+        started = perf_counter()
+        try:
+            return super().baseline(webpage, wait_time)
+        finally:
+            self.baseline_times.append(perf_counter() - started)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Returns the value below which the fraction of the values lie (nearest rank)
+    :param values: list of float
+    :param fraction: float, eg: 0.95
+    :return: float, 0 if there are no values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_Scenario(sites: int, port: int, versions, args) -> dict:
+    """
+    Finds the deltaChange of `sites` webpages and checks them for `args.rounds` rounds, changing
+    `args.change_rate` of them before every round
+    :param sites: int
+    :param port: int, of the benchmark's server
+    :param versions: multiprocessing.Array of the sites' versions
+    :param args: the command line arguments
+    :return: dict of the results
+    """
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # Method 1 and the html files work in the current directory
+        os.chdir(directory)
+        snapshot_store = store.SnapshotStore(os.path.join(directory, 'bench.db')) if args.store else None
+        try:
+            settings = config.Settings(args.interval, stream=args.stream, store=snapshot_store, samples=args.samples,
+                                       text_only=args.method == 4)
+            checker.create_Session(pool_size=args.threads)
+            bench_engine = BenchmarkEngine(workers=args.threads, per_host=args.threads, method=args.method,
+                                           debug=False)
+            if args.memory:
+                tracemalloc.start()
+
+            # find_DeltaChange of every webpage
+            pending = [config.create_Webpage([f'site{site}', f'http://127.0.0.1:{port}/{site}', str(args.wait)],
+                                             settings) for site in range(sites)]
+            sites_of = {webpage: site for site, (webpage, _) in enumerate(pending)}
+            started = perf_counter()
+            webpages = bench_engine.run_baselines(pending)
+            baseline_seconds = perf_counter() - started
+
+            # The checks
+            changed_total = unchanged_total = false_positives = false_negatives = 0
+            check_seconds = 0.0
+            generator = random.Random(args.seed)
+            for _ in range(args.rounds):
+                changed = set()
+                for webpage in webpages:
+                    if generator.random() < args.change_rate:
+                        versions[sites_of[webpage]] += 1
+                        changed.add(webpage)
+                started = perf_counter()
+                results = bench_engine.run_cycle(webpages)
+                check_seconds += perf_counter() - started
+                for webpage, change_detected, _ in results:
+                    if webpage in changed:
+                        changed_total += 1
+                        false_negatives += not change_detected
+                    else:
+                        unchanged_total += 1
+                        false_positives += bool(change_detected)
+
+            traced_peak = None
+            if args.memory:
+                traced_peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+            bench_engine.shutdown(wait_for_checks=True)
+        finally:
+            if snapshot_store is not None:
+                snapshot_store.close()
+            os.chdir(working_directory)
+
+    checks = len(bench_engine.check_times)
+    return {
+        'sites': sites,
+        'baselines_failed': sites - len(webpages),
+        'baseline_seconds': round(baseline_seconds, 3),
+        'baseline_p50': round(percentile(bench_engine.baseline_times, 0.5), 4),
+        'baseline_p95': round(percentile(bench_engine.baseline_times, 0.95), 4),
+        'checks': checks,
+        'checks_per_second': round(checks / check_seconds, 2) if check_seconds else 0,
+        'check_p50': round(percentile(bench_engine.check_times, 0.5), 4),
+        'check_p95': round(percentile(bench_engine.check_times, 0.95), 4),
+        'check_max': round(max(bench_engine.check_times, default=0), 4),
+        'false_positive_rate': round(false_positives / unchanged_total, 4) if unchanged_total else 0,
+        'false_negative_rate': round(false_negatives / changed_total, 4) if changed_total else 0,
+        'traced_peak_mb': None if traced_peak is None else round(traced_peak, 2),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+def print_Results(results: List[dict]) -> None:
+    """
+    Prints the results as a table
+    :param results: list of dict, from run_Scenario()
+    :return: None
+    """
+    columns = [('sites', 'sites'), ('baseline_seconds', 'baseline s'), ('baseline_p95', 'base p95'),
+               ('checks_per_second', 'checks/s'), ('check_p50', 'p50 s'), ('check_p95', 'p95 s'),
+               ('check_max', 'max s'), ('false_positive_rate', 'false +'), ('false_negative_rate', 'false -'),
+               ('traced_peak_mb', 'peak MB'), ('max_rss_mb', 'rss MB')]
+    widths = [max(len(title), *(len(str(result[key])) for result in results)) for key, title in columns]
+    print('  '.join(title.rjust(width) for (_, title), width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[key]).rjust(width) for (key, _), width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks Webpage.detect() and find_DeltaChange() against a local "
+                                                 "server of synthetic webpages")
+    parser.add_argument('--sites', help="Comma separated numbers of webpages to benchmark. Defaults to 10,100,1000",
+                        default='10,100,1000', metavar='N,N')
+    parser.add_argument('--size', help="Size of every webpage, eg: 50K. Defaults to 50K", default='50K',
+                        metavar='SIZE')
+    parser.add_argument('--noise', help="Lines per webpage which change on every request (timestamps, counters, "
+                                        "tokens, hashes). Defaults to 4", type=int, default=4, metavar='N')
+    parser.add_argument('--change-rate', help="Fraction of the webpages actually changed before every round. "
+                                              "Defaults to 0.1", type=float, default=0.1, metavar='FRACTION')
+    parser.add_argument('--rounds', help="Rounds of checks per scenario. Defaults to 3", type=int, default=3,
+                        metavar='N')
+    parser.add_argument('-m', '--method', help="The detection method. Defaults to 1", type=int, choices=[1, 2, 4],
+                        default=1)
+    parser.add_argument('-j', '--threads', help="Webpages checked at the same time. Defaults to 8", type=int,
+                        default=8, metavar='N')
+    parser.add_argument('--wait', help="WAIT_TIME of find_DeltaChange(). Defaults to 0", type=int, default=0,
+                        metavar='SECONDS')
+    parser.add_argument('--samples', help="Downloads find_DeltaChange() learns from. Defaults to "
+                                          f"{learner.SAMPLES}", type=int, default=learner.SAMPLES, metavar='N')
+    parser.add_argument('--interval', help="Interval of the webpages, only affects --store. Defaults to 7200",
+                        type=float, default=7200, metavar='SECONDS')
+    parser.add_argument('-s', '--store', help="Use a snapshot store instead of html files", action='store_true')
+    parser.add_argument('--stream', help="Stream the downloads to files", action='store_true')
+    parser.add_argument('--memory', help="Trace the peak python memory (slows the benchmark down)",
+                        action='store_true')
+    parser.add_argument('--seed', help="Seed of the changes. Defaults to 0", type=int, default=0)
+    parser.add_argument('--json', help="Also write the results to this json file", metavar='filename')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)-8s: |%(name)16.15s| - %(message)s',
+                        datefmt='%d/%m/%y %H:%M:%S', level=logging.ERROR)
+    scales = [int(sites) for sites in args.sites.split(',')]
+    versions = multiprocessing.Array('i', max(scales), lock=False)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(config.size_parser(args.size), args.noise, versions,
+                                                         port_queue), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+
+    results = []
+    try:
+        for sites in scales:
+            print(f"Benchmarking {sites} site(s)...", flush=True)
+            results.append(run_Scenario(sites, port, versions, args))
+    finally:
+        server.terminate()
+    print()
+    print_Results(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#  Copyright (c) 2020. RoguedBear
+import difflib
+from html.parser import HTMLParser
+from typing import Callable, List
+
+# The elements whose text is a block of its own
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'details', 'dialog', 'div', 'dl',
+              'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+              'hr', 'li', 'main', 'nav', 'ol', 'option', 'p', 'pre', 'section', 'summary', 'table', 'td', 'th', 'title',
+              'tr', 'ul'}
+# The elements whose text is not visible
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'object'}
+
+# Limits of a change summary
+BLOCK_LIMIT = 200
+SUMMARY_ITEMS = 10
+# Unchanged words kept on each side of a changed word in a changed block
+WORD_CONTEXT = 4
+
+
+class BlockParser(HTMLParser):
+    """
+    Splits an html code into its blocks of visible text (see extract_Blocks())
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.text = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.end_Block()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.end_Block()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.end_Block()
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.text.append(data)
+
+    def end_Block(self) -> None:
+        """
+        Adds the text collected since the last block as a block, with its whitespace normalized
+        :return: None
+        """
+        text = ' '.join(''.join(self.text).split())
+        self.text = []
+        if text:
+            self.blocks.append(text)
+
+
+def extract_Blocks(code: str) -> List[str]:
+    """
+    Parses the html code into its blocks of visible text: the text of every paragraph, heading, list item, table
+    cell... with the whitespace normalized. Scripts, styles and the markup itself are left out.
+    :param code: str, html code
+    :return: list of str
+    """
+    parser = BlockParser()
+    parser.feed(code)
+    parser.close()
+    parser.end_Block()
+    return parser.blocks
+
+
+def summarize_Changes(old_blocks: List[str], new_blocks: List[str], key: Callable[[str], str] = None) -> str:
+    """
+    Compares two lists of text blocks and returns a compact summary of the blocks which were changed, added and
+    removed. eg:
+        1 changed, 1 added, 0 removed
+        ~ Price: [-₹499-] {+₹449+}
+        + Free delivery till Sunday
+    :param old_blocks: list of str
+    :param new_blocks: list of str
+    :param key: function, the blocks are compared by key(block). eg: to mask the deltaChange
+    :return: str, '' if nothing has changed
+    """
+    if key is None:
+        old_keys, new_keys = old_blocks, new_blocks
+    else:
+        old_keys, new_keys = [key(i) for i in old_blocks], [key(i) for i in new_blocks]
+
+    changed, added, removed = [], [], []
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        pairs = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        changed.extend(zip(old_blocks[i1:i1 + pairs], new_blocks[j1:j1 + pairs]))
+        removed.extend(old_blocks[i1 + pairs:i2])
+        added.extend(new_blocks[j1 + pairs:j2])
+    if not (changed or added or removed):
+        return ''
+
+    lines = [f"{len(changed)} changed, {len(added)} added, {len(removed)} removed"]
+    items = [f"~ {diff_Words(old, new)}" for old, new in changed]
+    items += [f"+ {shorten(block)}" for block in added]
+    items += [f"- {shorten(block)}" for block in removed]
+    lines.extend(items[:SUMMARY_ITEMS])
+    if len(items) > SUMMARY_ITEMS:
+        lines.append(f"... and {len(items) - SUMMARY_ITEMS} more")
+    return '\n'.join(lines) + '\n'
+
+
+def diff_Words(old: str, new: str) -> str:
+    """
+    Shows the words changed between two blocks as [-removed-]{+added+}, with only a few unchanged words around them
+    :param old: str
+    :param new: str
+    :return: str
+    """
+    old_words, new_words = old.split(), new.split()
+    parts = []
+    matcher = difflib.SequenceMatcher(None, old_words, new_words, autojunk=False)
+    opcodes = matcher.get_opcodes()
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            words = old_words[i1:i2]
+            keep_left = WORD_CONTEXT if index > 0 else 0
+            keep_right = WORD_CONTEXT if index < len(opcodes) - 1 else 0
+            if len(words) > keep_left + keep_right + 1:
+                words = words[:keep_left] + ['…'] + (words[-keep_right:] if keep_right else [])
+            parts.extend(words)
+            continue
+        if i2 > i1:
+            parts.append(f"[-{' '.join(old_words[i1:i2])}-]")
+        if j2 > j1:
+            parts.append(f"{{+{' '.join(new_words[j1:j2])}+}}")
+    return shorten(' '.join(parts))
+
+
+def shorten(text: str, limit: int = BLOCK_LIMIT) -> str:
+    """
+    Cuts the text to limit characters
+    :param text: str
+    :param limit: int
+    :return: str
+    """
+    return text if len(text) <= limit else text[:limit - 1] + '…'
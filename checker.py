@@ -1,11 +1,238 @@
 #  Copyright (c) 2020. RoguedBear
+import codecs
+import difflib
+import functools
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import random
 import os
 import re
-from time import sleep
-from typing import Tuple
+import tempfile
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Callable, List, Optional, Pattern, Tuple
 import datetime
 import requests
+from requests.adapters import HTTPAdapter
+
+import blocks
+import chunks
+import learner
+import metrics
+
+# Optional, used to compare only a part of the webpage (Webpage.set_selector()). Imported by import_Selectors() when
+# a selector is set, as they take a while to import
+bs4 = soupsieve = None
+etree = lxml_html = None
+
+# The size of the pieces in which the webpages are downloaded
+CHUNK_SIZE = 64 * 1024
+
+# A hunk header of `diff`'s output, eg: 12,14c12
+HUNK_HEADER = re.compile(r'^(\d+)(?:,(\d+))?([acd])(\d+)(?:,(\d+))?$', re.MULTILINE)
+
+# Adaptive interval: multiplied after every check without a change, divided after a detected change
+ADAPTIVE_BACKOFF = 1.25
+ADAPTIVE_SPEEDUP = 4
+
+# The keep-alive session shared by all the webpages, see get_Session()
+SESSION = None
+SESSION_LOCK = threading.Lock()
+
+# The deltaChanges of the webpages by id, interned so that webpages with the same deltaChange share it and every webpage
+# only keeps its id (see intern_DeltaChange()). They're counted by the webpages using them and forgotten when none do,
+# except the empty one (id 0). Their compiled masks (DELTA_MASKS) are kept from their first use till they're forgotten,
+# as every check needs the mask for the fingerprint.
+DELTA_CHANGES = {0: ()}
+DELTA_CHANGE_IDS = {(): 0}
+DELTA_CHANGE_USERS = {}
+DELTA_CHANGE_COUNTER = itertools.count(1)
+# Reentrant, as a Webpage may be garbage collected (see Webpage.__del__()) while its thread is interning
+DELTA_CHANGE_LOCK = threading.RLock()
+DELTA_MASKS = {}
+
+# Every webpage logs through this one logger, with its name in front of the message (see Webpage.logger)
+WEBPAGE_LOGGER = logging.getLogger("Webpage")
+
+# The downloads in flight, by fetch key (see Webpage.get_fetchKey()), so that the webpages of the same url share them.
+# While a key is held (see hold_Fetches()) its finished download is kept for the rest of the webpages too.
+FETCHES = {}
+FETCH_HOLDS = {}
+FETCHES_LOCK = threading.Lock()
+
+
+class FetchFailed(Exception):
+    """
+    Raised when a webpage could not be downloaded, even after retrying as per its FetchPolicy
+    """
+
+
+class FetchAborted(FetchFailed):
+    """
+    Raised when a download is stopped: the webpage was larger than its byte limit, took longer than its deadline,
+    or the connection broke while it was being downloaded
+    """
+
+
+class FetchPolicy:
+    """
+    How a webpage is downloaded and retried. Can be shared between webpages.
+    connect_timeout  : float, seconds to wait for the connection
+    read_timeout     : float, seconds to wait for the server to send something
+    max_attempts     : int, the number of attempts in a single check, before giving up till the next check
+    backoff          : float, seconds to wait before the 2nd attempt, doubled for every attempt after that (with jitter)
+    max_backoff      : float, the maximum seconds to wait between two attempts
+    failure_threshold: int, after these many checks failing in a row, the webpage is skipped for a cooldown
+    cooldown         : float, seconds for which the webpage is skipped, doubled for every further failed check
+    max_cooldown     : float, the maximum seconds for which the webpage is skipped
+    """
+
+    def __init__(self, connect_timeout: float = 10, read_timeout: float = 30, max_attempts: int = 3,
+                 backoff: float = 2, max_backoff: float = 30, failure_threshold: int = 3, cooldown: float = 600,
+                 max_cooldown: float = 6 * 3600):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+    def get_Backoff(self, attempt: int) -> float:
+        """
+        Returns the seconds to wait after a failed attempt: capped exponential backoff with "full jitter"
+        :param attempt: int, the number of the attempt that failed, starting from 1
+        :return: float
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def get_Cooldown(self, failures: int) -> float:
+        """
+        Returns the seconds to skip a webpage for, after its checks have failed these many times in a row
+        :param failures: int
+        :return: float, 0 if it should not be skipped
+        """
+        if failures < self.failure_threshold:
+            return 0
+        return min(self.max_cooldown, self.cooldown * 2 ** (failures - self.failure_threshold))
+
+    def get_RetryDelay(self, failures: int) -> float:
+        """
+        Returns the seconds to wait before finding the deltaChange of a webpage again, after it has failed these many
+        times in a row: max_backoff, then the cooldown once past the failure threshold
+        :param failures: int
+        :return: float
+        """
+        return max(self.max_backoff, self.get_Cooldown(failures))
+
+
+class SharedFetch:
+    """
+    A download of a url, shared by the webpages which want it at the same time (see Webpage.get_webpage())
+    validators: tuple(ETag, Last-Modified) sent with the request, None if it is not conditional
+    """
+    __slots__ = ('validators', 'done', 'users', 'body', 'size', 'etag', 'last_modified', 'error')
+
+    def __init__(self, validators: Optional[tuple]):
+        self.validators = validators
+        self.done = threading.Event()
+        # The webpages which have got this download. Asking again means they want a newer one
+        self.users = set()
+        self.body = None
+        self.size = 0
+        self.etag = None
+        self.last_modified = None
+        self.error = None
+
+
+class Watchdog:
+    """
+    Stops the downloads which go past their deadline, from a single background thread (started when first needed).
+    A deadline checked between the pieces of a download can't stop a server which sends a byte every few seconds:
+    the read of a piece only returns when the piece is full.
+
+    -----------
+    Methods:
+      - watch() : calls a function at a deadline, unless cancelled before
+      - cancel(): cancels it
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        # The entries which are neither called nor cancelled, the rest are skipped when they reach the top of the heap
+        self._pending = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, deadline: float, stop: Callable[[], None]) -> int:
+        """
+        Calls stop() at the deadline, from the watchdog's thread
+        :param deadline: float, monotonic() time
+        :param stop: function without arguments, eg: stop_Response()
+        :return: int, the id to cancel it with
+        """
+        with self._condition:
+            entry = next(self._counter)
+            self._pending.add(entry)
+            heapq.heappush(self._heap, (deadline, entry, stop))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='watchdog', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return entry
+
+    def cancel(self, entry: int) -> bool:
+        """
+        Cancels the call of watch()
+        :param entry: int, from watch()
+        :return: bool, False if it has already been called
+        """
+        with self._condition:
+            if entry in self._pending:
+                self._pending.discard(entry)
+                return True
+            return False
+
+    def run(self) -> None:
+        """
+        The watchdog's thread, calls the functions as their deadlines pass. They are called while holding the lock,
+        so once cancel() returns False the function has been called
+        :return: None
+        """
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > monotonic():
+                    self._condition.wait(self._heap[0][0] - monotonic() if self._heap else None)
+                _, entry, stop = heapq.heappop(self._heap)
+                if entry not in self._pending:
+                    continue
+                self._pending.discard(entry)
+                try:
+                    stop()
+                except Exception as error:
+                    logging.getLogger("Watchdog").debug(f"Stopping a download failed: {error!r}")
+
+
+# Stops the downloads past their deadline, see Webpage.read_Body()
+WATCHDOG = Watchdog()
+
+
+class WebpageLogger(logging.LoggerAdapter):
+    """
+    Logs for a webpage through a shared logger: puts the webpage's name in front of the message, and adds it as the
+    `site` attribute of the record (for filters and formats).
+    eg: WebpageLogger(WEBPAGE_LOGGER, {'site': 'name'})
+    """
+
+    def process(self, msg, kwargs):
+        kwargs['extra'] = dict(kwargs.get('extra') or {}, **self.extra)
+        return f"\"{self.extra['site']}\": {msg}", kwargs
 
 
 class Webpage:
@@ -19,33 +246,101 @@ class Webpage:
      #Getters:
       - get_name()       : returns the name of the website
       - get_url()        : returns the url of the website
-      - get_webpage()    : downloads the webpage from the internet and returns as string
+      - get_webpage()    : downloads the webpage from the internet and returns as string (None if not modified),
+                           sharing the download with the webpages of the same url
+      - get_fetchKey()   : returns what the webpages which can share a download have in common
+      - download()       : downloads the webpage in chunks, within the byte limit and deadline
+      - stream_webpage() : downloads the webpage straight to a file, and returns its fingerprint
       - get_filename()   : returns the appropriate filename
+      - get_compareMode(): returns what the saved html code is made of (html, text or region)
       - get_deltaChange(): returns the list containing deltachange
+      - get_mask()       : returns the compiled deltaChange
+      - get_code()       : returns the html code which was last compared
+      - get_fingerprint(): returns the hash of the normalized html code which was last compared
+      - get_interval()   : returns the seconds to wait between the checks of this webpage
+      - get_retryDelay() : returns the seconds to wait before finding the deltaChange again, after it failed
 
     #Setter:
       - set_deltaChange() : stores the list of changes
+      - set_store()       : keeps the html codes and state in a SnapshotStore instead of html files
+      - set_config()      : stores the config row this webpage was created from
+      - set_interval()    : sets the seconds to wait between the checks of this webpage
+      - set_adaptive()    : lets the interval adapt to how often the webpage changes, within the given bounds
+      - set_limits()      : sets the maximum size and time of a download, and whether to stream it to a file
+      - set_selector()    : sets the CSS selector/XPath of the only part of the webpage to compare
+      - set_textOnly()    : compares only the visible text of the webpage, block by block (method 4)
+      - set_policy()      : sets the FetchPolicy (timeouts, retries, circuit breaker) of the webpage
+      - set_samples()     : sets the number of downloads find_DeltaChange() learns the deltaChange from
 
     #Other Functions:
       - save_html(): saves the html code to a unique file
       - load_html(): loads the html code to a string in a variable
+      - load_chunks(): loads the chunk index saved with the _old.html
+      - get_changedRanges(): returns the line ranges which differ from the last html, by comparing chunk indexes
+      - save_state(): saves the state needed after a restart (fingerprint, deltaChange...) to the SnapshotStore
+      - load_state(): loads it back
+      - adapt_Interval(): lengthens/shortens the interval after a check, if adaptive
+      - extract_Region(): returns the text of the selected part of the html (or the text blocks for method 4)
+      - is_Available()  : False while the webpage is skipped after failing too many times (circuit breaker)
+      - record_Failure(): counts a failed check, and skips the webpage for a cooldown if needed
       - detect()   : the method used in main, which'll select the appropriate way to detect changes.
 
     #Detectors:
       - find_DeltaChange(): Finds the constant change that'll be present between a webpage's 2 html file
       - method1_diff()    : Method 1 for detecting change in website. Uses bash's `diff` command.
+      - method2_difflib() : Method 2 for detecting change in website. Same as method 1, but compares in memory.
+      - method3_region()  : Method 3 for detecting change in website. Same as method 2, but only compares the text of
+                            the part of the webpage selected by set_selector()
+      - method4_blocks()  : Method 4 for detecting change in website. Compares the visible text blocks of the webpage,
+                            and returns a short summary of the changed, added and removed text.
     """
 
+    # Kept small for large lists of webpages: no __dict__, no html code, no compiled deltaChange and no logger,
+    # they are loaded when needed
+    __slots__ = ('name', 'url', 'verifySSL', 'etag', 'last_modified', 'max_bytes', 'deadline', 'streaming', 'selector',
+                 'region', 'text_only', 'policy', 'failures', 'skip_until', 'delta_change_id', 'samples', 'fingerprint',
+                 'store', 'config', 'interval', 'adaptive', 'min_interval', 'max_interval')
+    sleep_time = 0.5
+
     def __init__(self, name, url):
-        self.sleep_time = 0.5
         self.name = name
         self.url = format_url(url)
         self.verifySSL = True
-        self.filename = {'old': f'{self.name}_old.html', 'new': f'{self.name}_new.html'}
-        self.deltaChange = []
-        self.logger = logging.getLogger(f"\"{name}\"")
+        self.etag = None
+        self.last_modified = None
+        self.max_bytes = None
+        self.deadline = None
+        self.streaming = False
+        self.selector = None
+        self.region = None
+        self.text_only = False
+        self.policy = FetchPolicy()
+        self.failures = 0
+        self.skip_until = 0
+        self.delta_change_id = 0
+        self.samples = learner.SAMPLES
+        self.fingerprint = None
+        self.store = None
+        self.config = None
+        self.interval = 7200
+        self.adaptive = False
+        self.min_interval = None
+        self.max_interval = None
         self.logger.debug(f"Created Class Webpage: {name}")
 
+    def __del__(self):
+        # The deltaChange is forgotten once no webpage uses it
+        release_DeltaChange(getattr(self, 'delta_change_id', 0))
+
+    @property
+    def logger(self) -> logging.LoggerAdapter:
+        """
+        The logger of the webpage: WEBPAGE_LOGGER, with the webpage's name in front of the messages and as the `site`
+        attribute of the records. Only a small adapter is created on every use, the webpages don't keep a logger
+        :return: WebpageLogger
+        """
+        return WebpageLogger(WEBPAGE_LOGGER, {'site': self.name})
+
     # =========================================
     ## Getters
     def get_name(self) -> str:
@@ -62,69 +357,263 @@ class Webpage:
         """
         return self.url
 
-    def get_webpage(self) -> str:
+    def get_fetchKey(self) -> tuple:
+        """
+        Returns the url and the SSL setting of the webpage. The webpages with the same key get the same response, so
+        they can share a download.
+        :return: tuple
+        """
+        return format_url(self.get_url()), self.verifySSL
+
+    def get_webpage(self, conditional=False) -> Optional[str]:
         """
         Downloads the webpage from the internet and returns the html string.
-        Also saves the webpage in code variable.
-        output: str
+        If another webpage with the same fetch key is downloading it at the same time, or has downloaded it while the
+        key is held (see hold_Fetches()), that download is shared instead of downloading it again.
+        :param conditional: if True, sends If-None-Match/If-Modified-Since, so the server can reply "304 Not Modified"
+        output: str, or None if the server replied that the webpage has not been modified
         """
-        # Statement to avoid "variable might be referenced before assingment"
-        html_page = ''
-        while True:
+        key = self.get_fetchKey()
+        validators = (self.etag, self.last_modified) if conditional else None
+        with FETCHES_LOCK:
+            fetch = FETCHES.get(key)
+            leading = fetch is None or self in fetch.users
+            if leading:
+                fetch = FETCHES[key] = SharedFetch(validators)
+            fetch.users.add(self)
+
+        if leading:
+            try:
+                pieces = []
+                fetch.size = self.download(pieces.append, conditional, buffered=True)
+                if fetch.size is not None:
+                    fetch.body = ''.join(pieces)
+                fetch.etag, fetch.last_modified = self.etag, self.last_modified
+                return fetch.body
+            except Exception as error:
+                fetch.error = error
+                raise
+            finally:
+                fetch.done.set()
+                with FETCHES_LOCK:
+                    if FETCHES.get(key) is fetch and not FETCH_HOLDS.get(key):
+                        del FETCHES[key]
+
+        fetch.done.wait()
+        if fetch.error is not None:
+            raise FetchFailed(f"Shared download failed: {fetch.error}")
+        if fetch.body is None:
+            # "Not modified" only holds for the same ETag/Last-Modified, otherwise downloading it on its own
+            if validators is not None and validators == fetch.validators:
+                self.logger.debug(f"{self.get_name()}'s webpage has not been modified (304, shared).")
+                return None
+            pieces = []
+            if self.download(pieces.append, conditional, buffered=True) is None:
+                return None
+            return ''.join(pieces)
+        if self.max_bytes is not None and fetch.size > self.max_bytes:
+            raise FetchAborted(f"{self.get_name()}'s webpage is larger than {self.max_bytes} bytes")
+        self.etag, self.last_modified = fetch.etag, fetch.last_modified
+        self.logger.debug(f"shared the download of {self.get_name()}'s webpage ({fetch.size} bytes).")
+        metrics.REGISTRY.increment('webpage_shared_downloads_total', site=self.get_name())
+        return fetch.body
+
+    @metrics.timed('webpage_download_seconds')
+    def download(self, write: Callable[[str], None], conditional=False, buffered=False) -> Optional[int]:
+        """
+        Downloads the webpage in chunks of CHUNK_SIZE, and gives the decoded html to write() as it arrives, so the
+        whole webpage doesn't need to be in memory. Raises FetchAborted past the byte limit or the deadline.
+        Connection errors, timeouts and empty webpages are retried as per the FetchPolicy, then FetchFailed is raised.
+        Uses the shared keep-alive session, and remembers the ETag/Last-Modified headers of the response.
+        :param write: function, called with every decoded piece of the html
+        :param conditional: if True, sends If-None-Match/If-Modified-Since, so the server can reply "304 Not Modified"
+        :param buffered: bool, decode the whole html in one go instead, see read_Body()
+        :return: int, the number of bytes downloaded. None if the server replied that the webpage is not modified
+        """
+        headers = {}
+        if conditional:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        policy = self.policy
+        for attempt in range(1, policy.max_attempts + 1):
+            started = monotonic()
             try:  # if electricity goes out, and internet is not available for the time
-                html_page = requests.get(self.get_url(), verify=self.verifySSL).text
+                with get_Session().get(self.get_url(), verify=self.verifySSL, headers=headers, stream=True,
+                                       timeout=(policy.connect_timeout, policy.read_timeout)) as response:
+                    if response.status_code == 304 and headers:
+                        self.logger.debug(f"{self.get_name()}'s webpage has not been modified (304).")
+                        return None
+                    size = self.read_Body(response, write, started, buffered)
+                    self.etag = response.headers.get('ETag')
+                    self.last_modified = response.headers.get('Last-Modified')
             except requests.exceptions.SSLError as error:
-                print(error)
                 self.logger.critical("Looks like, requests is having problems with SSL for this website.\n"
                                      "Try adding 'false' in the  4th column in csv file for this webpage" 
                                      "(Refer \"README How To Run\" 1st bullet point)")
-                # TODO: skip the current wbsite instead of quitting program.
-                quit()
-            except requests.exceptions.ConnectionError:
-                self.logger.critical("ConnectionError! Internet or Electricity has probably gone out for a while. "
-                                     "Retrying in 1minute...")
-                sleep(60)
-                continue
-
-            if len(html_page) == 0:
-                self.logger.warning(f" received webpage for \"{self.get_name()}\" of size 0! Retrying... ")
+                # Retrying won't fix the certificate, skipping the webpage for now
+                raise FetchFailed(f"SSLError: {error}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                reason = f"{type(error).__name__}! Internet or Electricity has probably gone out for a while."
             else:
-                self.logger.debug(f"successfully downloaded {self.get_name()}'s webpage.")
-                break
-        # Not required for method 1
-        # self.code = html_page
+                if size != 0:
+                    self.logger.debug(f"successfully downloaded {self.get_name()}'s webpage ({size} bytes).")
+                    metrics.REGISTRY.increment('webpage_downloaded_bytes_total', size, site=self.get_name())
+                    return size
+                reason = f"received webpage for \"{self.get_name()}\" of size 0!"
+
+            if attempt < policy.max_attempts:
+                backoff = policy.get_Backoff(attempt)
+                self.logger.warning(f"{reason} Retrying in {backoff:.1f} seconds... "
+                                    f"(attempt {attempt}/{policy.max_attempts})")
+                sleep(backoff)
         # noinspection PyUnboundLocalVariable
-        return html_page
+        raise FetchFailed(f"{reason} (after {policy.max_attempts} attempts)")
+
+    def read_Body(self, response: requests.Response, write: Callable[[str], None], started: float,
+                  buffered=False) -> int:
+        """
+        Reads the body of a streamed response chunk by chunk, decoding it incrementally. The WATCHDOG stops the
+        response at the deadline, even in the middle of reading a chunk
+        :param response: requests.Response, requested with stream=True
+        :param write: function, called with every decoded piece of the html
+        :param started: float, monotonic() time when the request was sent, for the deadline
+        :param buffered: bool, if True, the bytes are collected and decoded in one go at the end, and write() is
+        called once with the whole html. The bytes are released before it is called
+        :return: int, the number of bytes read
+        """
+        try:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        size = 0
+        buffer = bytearray() if buffered else None
+        watched = None if self.deadline is None else WATCHDOG.watch(started + self.deadline,
+                                                                     lambda: stop_Response(response))
+        timed_out = False
+        try:
+            try:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if self.max_bytes is not None and size > self.max_bytes:
+                        raise FetchAborted(f"{self.get_name()}'s webpage is larger than {self.max_bytes} bytes")
+                    if self.deadline is not None and monotonic() - started > self.deadline:
+                        raise FetchAborted(f"{self.get_name()}'s webpage took longer than {self.deadline} seconds")
+                    if buffer is None:
+                        write(decoder.decode(chunk))
+                    else:
+                        buffer += chunk
+            finally:
+                timed_out = watched is not None and not WATCHDOG.cancel(watched)
+        except requests.exceptions.RequestException as error:
+            if timed_out:
+                raise FetchAborted(f"{self.get_name()}'s webpage took longer than {self.deadline} seconds")
+            # Can't retry as a part of the webpage has already been written
+            raise FetchAborted(f"Downloading {self.get_name()}'s webpage failed midway: {error!r}")
+        # A webpage without a Content-Length just ends when it is stopped, cut short
+        if timed_out:
+            raise FetchAborted(f"{self.get_name()}'s webpage took longer than {self.deadline} seconds")
+        if buffer is None:
+            write(decoder.decode(b'', final=True))
+        else:
+            text = decoder.decode(buffer, final=True)
+            del buffer
+            write(text)
+        return size
+
+    def stream_webpage(self, file_name: str) -> Optional[str]:
+        """
+        Downloads the webpage straight into the file, calculating its fingerprint on the way, without ever keeping
+        the whole webpage in memory. Sends a conditional request.
+        :param file_name: str, the file to write the html to
+        :return: str, fingerprint of the html (see fingerprint_Code()). None if the webpage is not modified
+        """
+        fingerprint = Fingerprint(self.get_mask())
+        with open(file_name, 'w') as file:
+            def write(text):
+                file.write(text)
+                fingerprint.update(text)
+
+            if self.download(write, conditional=True) is None:
+                return None
+        return fingerprint.hexdigest()
 
     def get_filename(self, filetype) -> str:
         """
         Returns the predefined filename of the Webpage
         > Save/load is supposed to flexibly save/load files from any suffix name. Therefore no need to assert
 
-        :param filetype: old/new filename
+        :param filetype: old/new filename, or chunks for the chunk index of the old one
         :return:
         """
+        if filetype == 'chunks':
+            return f'{self.name}_old.chunks.json'
         try:
             assert filetype in ['old', 'new'], "filetype variable is not 'old' or 'new'!\nfiletype: " + str(filetype)
-            return self.filename[filetype]
+            return f'{self.name}_{filetype}.html'
         # TODO: do something about this:
         except AssertionError:
             return filetype
 
+    def get_compareMode(self) -> str:
+        """
+        Returns what the saved html code and fingerprint of the webpage are made of: 'region' for the part selected by
+        set_selector() (method 3), 'text' for the text blocks (method 4), otherwise 'html' (methods 1 and 2, which
+        save the same code)
+        :return: str
+        """
+        if self.selector is not None:
+            return 'region'
+        return 'text' if self.text_only else 'html'
+
     def get_deltaChange(self) -> list:
         """
         Returns the list of changes stored
         :return: list
         """
-        return self.deltaChange
+        return list(DELTA_CHANGES[self.delta_change_id])
 
-    """ Not required for Method 1
-    def get_code(self):
-        '''
-        Return the html code of the webpage
-        :return: str 
-        '''
-    """
+    def get_mask(self) -> Optional[Pattern]:
+        """
+        Returns the compiled deltaChange (see compile_Mask())
+        :return: compiled regex, None if there is no deltaChange
+        """
+        return load_Mask(self.delta_change_id)
+
+    def get_code(self) -> str:
+        """
+        Return the html code of the webpage which was last compared, loaded from the _old.html file (or the snapshot
+        store). It is not kept in memory, as it is only needed when the webpage's fingerprint has changed
+        :return: str
+        """
+        return self.load_html('old')
+
+    def get_fingerprint(self) -> str:
+        """
+        Returns the fingerprint (see fingerprint_Code()) of the html code which was last compared
+        :return: str
+        """
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint_Code(self.get_code(), self.get_mask())
+        return self.fingerprint
+
+    def get_interval(self) -> float:
+        """
+        Returns the seconds to wait between the checks of this webpage
+        :return: float
+        """
+        return self.interval
+
+    def get_retryDelay(self) -> float:
+        """
+        Returns the seconds to wait before finding the deltaChange again, after it has failed (see
+        FetchPolicy.get_RetryDelay())
+        :return: float
+        """
+        return self.policy.get_RetryDelay(self.failures)
 
     # ==========================================
     ## Setters
@@ -134,7 +623,9 @@ class Webpage:
         :param list_of_changes: list
         :return: None
         """
-        self.deltaChange = list_of_changes
+        self.delta_change_id = intern_DeltaChange(list_of_changes, self.delta_change_id)
+        # The fingerprint depends on the deltaChange, it'll be recalculated when needed
+        self.fingerprint = None
 
     def set_verifySSL(self, value: str):
         """
@@ -148,32 +639,155 @@ class Webpage:
         else:
             self.verifySSL = True
 
+    def set_interval(self, seconds: float) -> None:
+        """
+        Sets the seconds to wait between the checks of this webpage
+        :param seconds: float
+        :return: None
+        """
+        self.interval = seconds
+        self.logger.debug(f"Checking every {seconds / 60:.2f} minutes")
+
+    def set_adaptive(self, min_interval: float, max_interval: float) -> None:
+        """
+        Makes the interval adaptive: it is lengthened after every check that found no change and shortened after a
+        detected change (see adapt_Interval()), staying within the bounds
+        :param min_interval: float, seconds
+        :param max_interval: float, seconds
+        :return: None
+        """
+        self.adaptive = True
+        self.min_interval, self.max_interval = min_interval, max(min_interval, max_interval)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+        self.logger.debug(f"Adaptive interval between {min_interval / 60:.2f} and {max_interval / 60:.2f} minutes")
+
+    def set_limits(self, max_bytes: int = None, deadline: float = None, streaming=False) -> None:
+        """
+        Sets the limits of a download, a download going past them is aborted (FetchAborted)
+        :param max_bytes: int, the maximum size of the webpage. None for no limit
+        :param deadline: float, the maximum seconds a download can take. None for no limit
+        :param streaming: bool, if True, detect() downloads the webpage straight to a file, and only reads it back if
+        its fingerprint has changed
+        :return: None
+        """
+        self.max_bytes, self.deadline, self.streaming = max_bytes, deadline, streaming
+
+    def set_selector(self, selector: str) -> None:
+        """
+        Compares only the part of the webpage selected by a CSS selector (needs beautifulsoup4) or an XPath (starting
+        with / or (, needs lxml), instead of the whole html. The webpage is then checked with method 3.
+        :param selector: str
+        :return: None
+        """
+        import_Selectors()
+        try:
+            if selector.startswith(('/', '(')):
+                if etree is None:
+                    raise ImportError("lxml is needed for XPath selectors (pip install lxml)")
+                self.region = etree.XPath(selector)
+            else:
+                if soupsieve is None:
+                    raise ImportError("beautifulsoup4 is needed for CSS selectors (pip install beautifulsoup4)")
+                self.region = soupsieve.compile(selector)
+        except ImportError as error:
+            self.logger.critical(f"{error}. Comparing the whole webpage instead.")
+            return
+        except Exception as error:
+            self.logger.critical(f"Invalid selector \"{selector}\": {error}. Comparing the whole webpage instead.")
+            return
+        self.selector = selector
+        self.logger.debug(f"Comparing only: {selector}")
+
+    def set_textOnly(self) -> None:
+        """
+        Compares only the visible text of the webpage, block by block (paragraphs, headings, list items...), instead
+        of the html. The webpage is then checked with method 4, unless it has a selector.
+        :return: None
+        """
+        self.text_only = True
+
+    def set_policy(self, policy: FetchPolicy) -> None:
+        """
+        Sets how the webpage is downloaded and retried
+        :param policy: FetchPolicy
+        :return: None
+        """
+        self.policy = policy
+
+    def set_samples(self, samples: int) -> None:
+        """
+        Sets the number of downloads find_DeltaChange() learns the deltaChange from
+        :param samples: int, at least 2
+        :return: None
+        """
+        self.samples = max(2, samples)
+
+    def set_store(self, store) -> None:
+        """
+        Keeps the html codes and the state of this webpage in the snapshot store instead of the html files
+        :param store: store.SnapshotStore
+        :return: None
+        """
+        self.store = store
+
+    def set_config(self, row: list) -> None:
+        """
+        Stores the config (csv) row this webpage was created from, so that the saved state is only reused if the
+        row has not been changed
+        :param row: list, the csv row
+        :return: None
+        """
+        self.config = config_Signature(row)
+
     # ==========================================
     ## Other Functions
 
-    def save_html(self, save_as: str, code: str = None) -> None:
+    @metrics.timed('webpage_file_seconds', operation='save')
+    def save_html(self, save_as: str, code: str = None, chunk_index: list = None) -> None:
         """
         Save's the html code with the file name <name>_old.html
         > Save/load is supposed to flexibly save/load files from any suffix name. Therefore no need to assert
         :param code: str, html code
         :param save_as: str, [old or new  values only] the extension with which to save file
+        :param chunk_index: list, the chunk index of the old html code (see index_Code()), saved along with it
         :return: None
         """
         if code is None:
             code = self.get_webpage()
+        if self.store is not None:
+            if save_as in ['old', 'new']:
+                self.store.save_body(self.get_name(), save_as, code, chunk_index)
+            else:
+                self.store.add_history(self.get_name(), save_as, code)
+            self.logger.debug(f"Saved html in snapshot store as: {save_as}")
+            return
         file_name = self.get_filename(save_as)
         file = open(file_name, 'w')
         file.write(code)
         file.close()
+        if save_as == 'old':
+            # A chunk index left from an older _old.html would not match it
+            if chunk_index is not None:
+                with open(self.get_filename('chunks'), 'w') as file:
+                    json.dump(chunk_index, file)
+            elif os.path.exists(self.get_filename('chunks')):
+                os.remove(self.get_filename('chunks'))
         sleep(self.sleep_time)
         self.logger.debug(f"Saved html file as: {file_name}")
 
+    @metrics.timed('webpage_file_seconds', operation='load')
     def load_html(self, old_new) -> str:
         """
         Loads the html code from the file
         :param old_new: [old/new] html code
         :return: str, html code
         """
+        if self.store is not None:
+            code = self.store.load_body(self.get_name(), old_new)
+            if code is None:
+                self.logger.warning(f"{old_new} html for {self.get_name()} does not exists in snapshot store!")
+                return ''
+            return code
         try:
             file_name = self.get_filename(old_new)
             file = open(file_name, 'r')
@@ -186,61 +800,227 @@ class Webpage:
             self.logger.warning("File for " + self.get_name() + " does not exists!")
             return ''
 
+    def load_chunks(self) -> Optional[list]:
+        """
+        Loads the chunk index saved along with the old html code
+        :return: list, None if it was saved without one
+        """
+        if self.store is not None:
+            return self.store.load_chunks(self.get_name(), 'old')
+        try:
+            with open(self.get_filename('chunks'), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_changedRanges(self, old_lines: List[str], new_index: Optional[list]) -> Optional[list]:
+        """
+        Compares the chunk index of the new html code with the one saved with the old html code, and returns the line
+        ranges which differ, so that only these are diffed
+        :param old_lines: list of str, the lines of the old html code
+        :param new_index: list, the chunk index of the new html code (see index_Code())
+        :return: list of (old start, old end, new start, new end), None if there is no chunk index to compare
+        """
+        old_index = self.load_chunks() if new_index is not None else None
+        # An index which doesn't cover the old html code is from another html code
+        if old_index is None or chunks.count_Lines(old_index) != len(old_lines):
+            return None
+        ranges = chunks.changed_Ranges(old_index, new_index)
+        if ranges:
+            self.logger.debug(f"Changed {chunks.locate_Changes(ranges, new_index)}")
+        return ranges
+
+    def save_state(self) -> None:
+        """
+        Saves the state of the webpage to the snapshot store (if any), so that it doesn't have to find the
+        deltaChange and download the webpage again after a restart
+        :return: None
+        """
+        if self.store is None:
+            return
+        self.store.save_state(self.get_name(), self.get_url(), self.get_fingerprint(), self.get_deltaChange(),
+                              self.etag, self.last_modified, self.config, self.interval, self.get_compareMode())
+
+    def delete_State(self) -> None:
+        """
+        Deletes the state, html codes and snapshots of the webpage from the snapshot store (if any)
+        :return: None
+        """
+        if self.store is not None:
+            self.store.delete(self.get_name())
+            self.logger.debug(f"Deleted {self.get_name()} from snapshot store")
+
+    def load_state(self) -> bool:
+        """
+        Loads the state of the webpage from the snapshot store. The html code itself is loaded when needed.
+        :return: bool, False if there is no saved state for this webpage's url, config row and comparison mode, or its
+        html is missing
+        """
+        if self.store is None:
+            return False
+        state = self.store.load_state(self.get_name())
+        if state is None or state['url'] != self.get_url() or state['config'] != self.config:
+            return False
+        # eg: the html saved by --method 2 can't be compared with the text blocks of --method 4
+        if state['mode'] != self.get_compareMode():
+            return False
+        if not self.store.has_body(self.get_name(), 'old'):
+            return False
+        self.set_deltaChange(state['delta_change'])
+        self.fingerprint = state['fingerprint']
+        self.etag, self.last_modified = state['etag'], state['last_modified']
+        if self.adaptive and state['interval'] is not None:
+            self.interval = min(max(state['interval'], self.min_interval), self.max_interval)
+        self.logger.debug(f"Loaded state of {self.get_name()} from snapshot store")
+        return True
+
+    def adapt_Interval(self, change_detected: bool) -> None:
+        """
+        If the interval is adaptive, lengthens it by ADAPTIVE_BACKOFF after a check which found no change, and
+        divides it by ADAPTIVE_SPEEDUP after a detected change, within the min/max bounds. The learned interval is
+        saved to the snapshot store. A check which did not complete says nothing about how often the webpage changes,
+        so it leaves the interval as it is.
+        :param change_detected: bool, the result of detect(). None if the check did not complete
+        :return: None
+        """
+        if not self.adaptive or change_detected is None:
+            return
+        if change_detected:
+            interval = max(self.min_interval, self.interval / ADAPTIVE_SPEEDUP)
+        else:
+            interval = min(self.max_interval, self.interval * ADAPTIVE_BACKOFF)
+        if interval != self.interval:
+            self.interval = interval
+            self.logger.debug(f"Interval adapted to {interval / 60:.2f} minutes")
+            self.save_state()
+
+    def is_Available(self) -> bool:
+        """
+        Returns False while the webpage is being skipped because its checks have failed too many times in a row
+        :return: bool
+        """
+        return monotonic() >= self.skip_until
+
+    def record_Failure(self, error: Exception) -> None:
+        """
+        Counts a failed check, and if it has failed too many times in a row, skips the webpage for a cooldown
+        :param error: the exception which failed it
+        :return: None
+        """
+        self.failures += 1
+        metrics.REGISTRY.increment('webpage_errors_total', site=self.get_name(), kind='fetch')
+        cooldown = self.policy.get_Cooldown(self.failures)
+        self.skip_until = monotonic() + cooldown
+        if cooldown:
+            self.logger.error(f"Failed {self.failures} times in a row, skipping it for {cooldown / 60:.1f} minutes: "
+                              f"{error}")
+        else:
+            self.logger.warning(f"Check failed, will retry in the next check: {error}")
+
+    def extract_Region(self, code: str) -> str:
+        """
+        Parses the html once and returns the normalized visible text of the part selected by set_selector(),
+        one line per line of text. Without a selector, returns the text blocks of the whole webpage one per line
+        if set_textOnly(), otherwise the html as it is.
+        :param code: str, html code
+        :return: str
+        """
+        if self.selector is None:
+            if self.text_only:
+                return ''.join(block + '\n' for block in blocks.extract_Blocks(code))
+            return code
+        if etree is not None and isinstance(self.region, etree.XPath):
+            matches = self.region(lxml_html.fromstring(code)) if code.strip() else []
+            if not isinstance(matches, list):
+                matches = [matches]
+            texts = ['\n'.join(match.itertext()) if hasattr(match, 'itertext') else str(match) for match in matches]
+        else:
+            soup = bs4.BeautifulSoup(code, 'lxml' if lxml_html is not None else 'html.parser')
+            texts = [element.get_text('\n') for element in self.region.select(soup)]
+        if not texts:
+            self.logger.warning(f"Nothing on the webpage matches \"{self.selector}\"")
+
+        lines = []
+        for text in texts:
+            lines.extend(normalize_Line(line).strip() for line in text.split('\n'))
+        return '\n'.join(line for line in lines if line) + '\n'
+
     # ==========================================
     ## Detectors
 
+    @metrics.timed('webpage_baseline_seconds')
     def find_DeltaChange(self, WAIT_TIME=5, debug=False) -> None:
         """
-        Identifies the constant change that'll exist between 2 downloaded versions of the website
-        :param debug:
+        Identifies the constant change that'll exist between the downloaded versions of the website: the volatile
+        spans like dates, counters, tokens and hashes (see learner.learn_DeltaChange())
+        :param debug: if True, learns from the saved _old.html and _new.html instead of downloading
         :param WAIT_TIME: defaults to 5s. the time to wait before downloading the next page
         :return:  None. internally stores the changes
 
         # Pseudocode:
-        * download (and save) the first file
-        * download (and save) the second file after WAIT_TIME seconds
-        * use the diff command and store the output
-        * parse the output
-        * find the text that matches in both the files.
+        * download the first file
+        * download the rest of the samples WAIT_TIME seconds apart, and save the last one
+        * learn the patterns of the spans which changed between them
         * store as delta_change
+        * save the first file with its chunk index
         """
         # Since this function is meant to be run at the start, this function will download and manage the copies in
         # _old and _new html files
 
         # Downloading the webpages
         if debug is False:
-            self.save_html('old')
-            sleep(WAIT_TIME)
-            self.save_html('new')
-
-        # Getting the diff command output
-        diff_output = os.popen(f"diff {self.get_filename('old')} {self.get_filename('new')}").read()
-        diff_output = diff_output.replace(r'\/', '/')
-
-        # Filtering the output
-        filtered_diff_output = filter_DiffOutput(diff_output)
+            samples = [self.extract_Region(self.get_webpage())]
+            for _ in range(self.samples - 1):
+                sleep(WAIT_TIME)
+                samples.append(self.extract_Region(self.get_webpage()))
+            self.save_html('new', samples[-1])
+        else:
+            samples = [self.load_html('old'), self.load_html('new')]
 
-        # Finding the same elements
-        same_elements = []
-        for code_tuples in filtered_diff_output:
-            same_elements.append(find_SameElements(code_tuples[0], code_tuples[1]))
-        self.set_deltaChange(same_elements)
+        self.set_deltaChange(learner.learn_DeltaChange(samples))
+        self.fingerprint = fingerprint_Code(samples[0], self.get_mask())
+        # The chunk index depends on the deltaChange, so the first file is saved after it has been found
+        self.save_html('old', samples[0], None if self.text_only else index_Code(samples[0], self.get_mask()))
 
-        if not same_elements:
+        if not self.get_deltaChange():
             self.logger.debug(f"'{self.get_name()}': No deltaChange found")
         else:
-            self.logger.debug(f"'{self.get_name()}': DeltaChange found ({len(same_elements)})")
+            self.logger.debug(f"'{self.get_name()}': DeltaChange found ({len(self.get_deltaChange())})")
+        self.save_state()
+
+    def stream_Detect(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Streams the webpage to the _new.html file (a temporary file if using the snapshot store) for detect().
+        The html is only read back into memory if its fingerprint has changed.
+        :return: tuple(html code or None, fingerprint or None if not modified)
+        """
+        if self.store is None:
+            new_fingerprint = self.stream_webpage(self.get_filename('new'))
+            # The html is read back by detect() only when needed
+            return None, new_fingerprint
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'new.html')
+            new_fingerprint = self.stream_webpage(file_name)
+            if new_fingerprint is None or new_fingerprint == self.get_fingerprint():
+                return None, new_fingerprint
+            with open(file_name, 'r') as file:
+                return file.read(), new_fingerprint
 
-    def method1_diff(self) -> Tuple[bool, str]:
+    @metrics.timed('webpage_diff_seconds', method='1')
+    def method1_diff(self, new_code: str = None, new_index: list = None) -> Tuple[bool, str]:
         """
         This function uses bash's `diff` command to detect change in a website's HTML.
         Will return True/False value and optionally diff command's output
+        :param new_code: str, the newly downloaded html code. Needed with new_index
+        :param new_index: list, its chunk index (see index_Code()). If given, only the chunks which differ from the
+        old html code are diffed
         :return: tuple(bool, str)
 
         # Pseudocode:
         * Check if the files exist, raise error and/or skip otherwise
         * Generate the -I arguments
-        * send the diff command
+        * send the diff command, for the changed chunks only if there are chunk indexes
         * if the diff's output is '' then nothing changed
         * otherwise, return the output as well
         """
@@ -249,12 +1029,49 @@ class Webpage:
         # TODO: save this command line argument as instance variable and use that to save potentially some CPU usage.
         deltachange = self.get_deltaChange()
         args = '-I \'' + "' -I '".join(deltachange) + "'" if deltachange else ''
-        command = rf"""diff -EZBb {args} {self.get_filename('old')} {self.get_filename('new')}"""
+        old_file, new_file = self.get_filename('old'), self.get_filename('new')
+
+        ranges = None
+        if new_index is not None:
+            old_lines = split_Lines(self.get_code())
+            ranges = self.get_changedRanges(old_lines, new_index)
+        if ranges is not None:
+            # Diffing each changed range of lines on its own, and moving its hunks back to their line numbers
+            new_lines = split_Lines(new_code)
+            output = ''
+            with tempfile.TemporaryDirectory() as directory:
+                old_file, new_file = os.path.join(directory, 'old.html'), os.path.join(directory, 'new.html')
+                command = rf"""diff -EZBb {args} {old_file} {new_file}"""
+                self.logger.debug(f"sending command for {len(ranges)} changed range(s):\n{command}\n")
+                for old_start, old_end, new_start, new_end in ranges:
+                    for file_name, lines in [(old_file, old_lines[old_start:old_end]),
+                                             (new_file, new_lines[new_start:new_end])]:
+                        with open(file_name, 'w') as file:
+                            file.writelines(line + '\n' for line in lines)
+                    output += offset_Hunks(os.popen(command).read(), old_start, new_start)
+            if output != '':
+                self.logger.info("Change has been DETECTED!")
+                return True, output
+            else:
+                self.logger.debug("No change was found")
+                return False, ''
+
+        temporary = None
+        if self.store is not None:
+            # The html codes are in the snapshot store, but diff needs them as files
+            temporary = tempfile.TemporaryDirectory()
+            old_file, new_file = os.path.join(temporary.name, 'old.html'), os.path.join(temporary.name, 'new.html')
+            for file_name, code in [(old_file, self.load_html('old')), (new_file, self.load_html('new'))]:
+                with open(file_name, 'w') as file:
+                    file.write(code)
+        command = rf"""diff -EZBb {args} {old_file} {new_file}"""
 
         self.logger.debug(f"sending command:\n{command}\n")
         # Sending the command
 
         output = os.popen(command).read()
+        if temporary is not None:
+            temporary.cleanup()
 
         # Checking the output of diff
         # TODO: using beautiful soup, strip the tags and send the strings as output to be sent as alert
@@ -265,51 +1082,241 @@ class Webpage:
             self.logger.debug("No change was found")
             return False, ''
 
-    def detect(self, method: int, debug=False) -> Tuple[bool, str]:
+    @metrics.timed('webpage_diff_seconds', method='2')
+    def method2_difflib(self, new_code: str, new_index: list = None) -> Tuple[bool, str]:
+        """
+        This function compares the webpage's last html with the new one in memory, using python's difflib.
+        Same as method 1 (-EZBb whitespace rules) and gives output in the same format, but without calling `diff` or
+        reading the html files (see compute_Diff() for where they can differ). Only the parts of the lines matching the
+        deltaChange are ignored, instead of whole lines.
+        :param new_code: str, the newly downloaded html code
+        :param new_index: list, its chunk index (see index_Code()). If given, only the chunks which differ from the
+        old html code are diffed
+        :return: tuple(bool, str)
+        """
+        old_code = self.get_code()
+        ranges = self.get_changedRanges(split_Lines(old_code), new_index)
+        output = compute_Diff(old_code, new_code, self.get_mask(), ranges=ranges)
+
+        if output != '':
+            self.logger.info("Change has been DETECTED!")
+            return True, output
+        else:
+            self.logger.debug("No change was found")
+            return False, ''
+
+    def method3_region(self, new_region: str, new_index: list = None) -> Tuple[bool, str]:
+        """
+        This function compares only the text of the selected part of the webpage (see extract_Region()), so the ads,
+        tokens and scripts in the rest of the html can't cause false alerts. Compares in memory like method 2.
+        :param new_region: str, the extracted text of the newly downloaded webpage
+        :param new_index: list, its chunk index (see index_Code())
+        :return: tuple(bool, str)
+        """
+        return self.method2_difflib(new_region, new_index)
+
+    @metrics.timed('webpage_diff_seconds', method='4')
+    def method4_blocks(self, new_blocks: str) -> Tuple[bool, str]:
+        """
+        This function compares the visible text blocks of the webpage (see extract_Region()) instead of the html, so
+        changes in the markup alone are not alerted, and returns a short summary of the changed, added and removed
+        text instead of the diff. The blocks of the last check are kept, so every download is only parsed once.
+        :param new_blocks: str, the text blocks of the newly downloaded webpage, one per line
+        :return: tuple(bool, str)
+        """
+        mask = self.get_mask()
+        output = blocks.summarize_Changes(split_Lines(self.get_code()), split_Lines(new_blocks),
+                                          key=lambda block: normalize_Line(mask_Line(block, mask)))
+
+        if output != '':
+            self.logger.info("Change has been DETECTED!")
+            return True, output
+        else:
+            self.logger.debug("No change was found")
+            return False, ''
+
+    @metrics.timed('webpage_check_seconds')
+    def detect(self, method: int, debug=False) -> Tuple[Optional[bool], str]:
         """
         This method will be used by main.
         :param debug: if debug, then store the old html file when change is detected
-        :param method: the method to use to detect changes.
-        (PS: planned some more ways to detect changes using BeautifulSoup and maybe difflib)
-        :return: Tuple(bool, str)
+        :param method: the method to use to detect changes. Always 3 if the webpage has a selector, and 4 if it is
+        text only
+        :return: Tuple(bool, str). The bool is None if the check did not complete: the download failed, the webpage
+        is skipped by the circuit breaker or the method is invalid
         """
+        if self.selector is not None:
+            method = 3
+        elif self.text_only:
+            method = 4
         try:
-            assert method in [1]
+            assert method in [1, 2, 3, 4]
         except AssertionError:
             self.logger.critical("method argument not in range! Cannot detect changes for this webpage until "
                                  f"then.\nGiven 'method' argument: {method}")
+            return None, ''
+
+        # Circuit breaker, skipping the webpage while it is cooling down after failing too many times
+        if not self.is_Available():
+            self.logger.debug("Skipped, as it has failed too many times in a row")
+            return None, ''
+
+        # Downloading the new file, if the server says it has not been modified then nothing has changed
+        # With a selector or text only the whole html needs to be parsed anyway, so it isn't streamed
+        try:
+            if self.streaming and self.selector is None and not self.text_only:
+                new_code, new_fingerprint = self.stream_Detect()
+            else:
+                new_code = self.get_webpage(conditional=True)
+                if new_code is not None:
+                    new_code = self.extract_Region(new_code)
+                new_fingerprint = None if new_code is None else fingerprint_Code(new_code, self.get_mask())
+        except FetchFailed as error:
+            # Deferring this webpage to its next check, instead of blocking or stopping the others
+            self.record_Failure(error)
+            return None, ''
+        self.failures = 0
+        if new_fingerprint is None:
+            self.logger.debug("No change was found (not modified)")
             return False, ''
 
-        # Downloading the new file
-        new_code = self.get_webpage()
-        self.save_html('new', new_code)
+        # Fast path: if the normalized html is the same as last time, the diff can't find anything either
+        if new_fingerprint == self.get_fingerprint():
+            self.logger.debug("No change was found (same fingerprint)")
+            return False, ''
+        if new_code is None:
+            new_code = self.load_html('new')
+        # Chunking the new html, so that only the chunks which differ from the old one are diffed
+        new_index = None if method == 4 else index_Code(new_code, self.get_mask())
 
         # USing one of the detection methods
         if method == 1:
-            change_detected, output = self.method1_diff()
+            if not (self.streaming and self.store is None):
+                self.save_html('new', new_code)
+            change_detected, output = self.method1_diff(new_code, new_index)
+        elif method == 2:
+            change_detected, output = self.method2_difflib(new_code, new_index)
+        elif method == 3:
+            change_detected, output = self.method3_region(new_code, new_index)
+        elif method == 4:
+            change_detected, output = self.method4_blocks(new_code)
 
-        # If debug then save the file with current date.
         # noinspection PyUnboundLocalVariable
+        if change_detected:
+            metrics.REGISTRY.increment('webpage_changes_total', site=self.get_name())
+
+        # If debug then save the file with current date.
         if change_detected and debug:
             now = datetime.datetime.now()
-            webpage_old = self.load_html('old')
             self.save_html(f"{self.get_name()}{datetime.datetime.strftime(now, '_%d-%m-%y_%H:%M')}"
-                           "_old.html", webpage_old)
-            webpage_new = self.load_html('new')
+                           "_old.html", self.get_code())
             self.save_html(f"{self.get_name()}{datetime.datetime.strftime(now, '_%d-%m-%y_%H:%M')}"
-                           "_new.html", webpage_new)
+                           "_new.html", new_code)
             # noinspection PyUnboundLocalVariable
             self.logger.debug(f"\n\n{output}")
 
-        # After the checks are complete, move the _new.html file to as _old.html
-        old_code = self.load_html('new')
-        self.save_html('old', old_code)
+        # After the checks are complete, the new html becomes the _old.html
+        # It is not kept in memory, it'll be loaded back the next time the fingerprint changes
+        self.save_html('old', new_code, new_index)
+        self.fingerprint = new_fingerprint
+        self.save_state()
 
         # Finally return the output
         # noinspection PyUnboundLocalVariable
         return change_detected, output
 
 
+@functools.lru_cache(maxsize=None)
+def import_Selectors() -> None:
+    """
+    Imports the optional libraries of the selectors (beautifulsoup4, lxml), once. The ones not installed stay None
+    :return: None
+    """
+    global bs4, soupsieve, etree, lxml_html
+    try:
+        import bs4
+        import soupsieve
+    except ImportError:
+        bs4 = soupsieve = None
+    try:
+        from lxml import etree
+        from lxml import html as lxml_html
+    except ImportError:
+        etree = lxml_html = None
+
+
+@contextmanager
+def hold_Fetches(key: tuple):
+    """
+    Keeps the latest download of the fetch key while the with block runs, so that every webpage of the key which is
+    checked in it shares that download (once, asking again downloads it again)
+    :param key: tuple, from Webpage.get_fetchKey()
+    """
+    with FETCHES_LOCK:
+        FETCH_HOLDS[key] = FETCH_HOLDS.get(key, 0) + 1
+    try:
+        yield
+    finally:
+        with FETCHES_LOCK:
+            FETCH_HOLDS[key] -= 1
+            if not FETCH_HOLDS[key]:
+                del FETCH_HOLDS[key]
+                fetch = FETCHES.get(key)
+                if fetch is not None and fetch.done.is_set():
+                    del FETCHES[key]
+
+
+def stop_Response(response: requests.Response) -> None:
+    """
+    Stops a streamed response from another thread, making its read return or raise right away. Needs urllib3 2.3+,
+    otherwise it is closed, which only stops it at its next read
+    :param response: requests.Response
+    :return: None
+    """
+    shutdown = getattr(response.raw, 'shutdown', None)
+    if shutdown is not None:
+        shutdown()
+    else:
+        response.close()
+
+
+def create_Session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates the keep-alive session shared by all the webpages, so that connections (and TLS handshakes)
+    are reused between the checks
+    :param pool_size: int, the number of connections to keep open per host. Should be the number of threads
+    :return: requests.Session
+    """
+    global SESSION
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    with SESSION_LOCK:
+        SESSION = session
+    return session
+
+
+def get_Session() -> requests.Session:
+    """
+    Returns the shared session, creating it with the default pool size if needed
+    :return: requests.Session
+    """
+    with SESSION_LOCK:
+        if SESSION is not None:
+            return SESSION
+    return create_Session()
+
+
+def config_Signature(row: list) -> str:
+    """
+    Returns the config (csv) row as a string, to find out if a webpage's row has changed
+    :param row: list, the csv row
+    :return: str
+    """
+    return ','.join(item.strip() for item in row)
+
+
 def format_url(url):
     """
     formats the url with https
@@ -323,38 +1330,310 @@ def format_url(url):
     return url
 
 
-def filter_DiffOutput(output):
+def compile_DeltaChange(pattern: str) -> Pattern:
     """
-    Filters the output received from bash's diff command
-    Aiming to get mos of the text.
-    :param output: the output received from diff command
-    :return: list, a list of both code files. eg: [(code1, code2), (code1, code2)]
+    Compiles a deltaChange pattern the way `diff -I` would read it (grep's basic regex), into a python regex.
+    In basic regex `( ) { } | + ?` are plain characters unless escaped with a backslash, which is the opposite of python.
+    :param pattern: str, the deltaChange pattern
+    :return: compiled regex. If the pattern is not a valid regex, the pattern is matched as plain text
     """
-    line_regex = re.compile(r'^\d+(?:,\d+)?c\d+(?:,\d+)?|\n\d+(?:,\d+)?c\d+(?:,\d+)?')  # Regex to match 634c634 stuff to split the output
-    strip_punc = ' <>\n\t!@#$%^&*()\\[]{};:\'""?/`~=+-_'
-    changes = line_regex.split(output)[1:]  # since 0th element is ''
-    changes = [tuple(i.split('\n---\n')) for i in changes]
-    changes = [(i.strip(strip_punc), j.strip(strip_punc)) for i, j in changes]
-    return changes
-    # return [i.strip(strip_punc) for i in output[output.find('\n'):].split('\n---\n')]
+    translated = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            i += 1
+            translated += pattern[i] if pattern[i] in '(){}|+?' else '\\' + pattern[i]
+        elif char in '(){}|+?':
+            translated += '\\' + char
+        elif char == '[':
+            # Bracket expressions are copied as it is, backslash is a plain character inside them
+            start = i + 2 if pattern[i + 1:i + 2] == '^' else i + 1
+            end = pattern.find(']', start + 1 if pattern[start:start + 1] == ']' else start)
+            if end == -1:
+                translated += '\\['
+            else:
+                translated += '[' + pattern[i + 1:end].replace('\\', '\\\\').replace('[', '\\[') + ']'
+                i = end
+        else:
+            translated += char
+        i += 1
+    try:
+        return re.compile(translated)
+    except re.error:
+        return re.compile(re.escape(pattern))
 
 
-def find_SameElements(code1, code2) -> str:
+def intern_DeltaChange(patterns: List[str], previous_id: int = 0) -> int:
     """
-    Finds the same elements between two diff comparisons
-    :param code1: str, The first code
-    :param code2: str, The second code
-    :return: str, the common html
+    Adds the deltaChange to DELTA_CHANGES if it isn't there already, and counts one more webpage using it. The
+    deltaChange the webpage used before is released
+    :param patterns: list of str, deltaChange patterns
+    :param previous_id: int, the id of the deltaChange the webpage used before
+    :return: int, its id (key in DELTA_CHANGES)
     """
-    same = ''
-    for i, j in zip(code1, code2):
-        if i == j and i.isnumeric() is False and i not in ['\\', '/', '[', ']', '-']:
-            same += i
-        if i.isnumeric():
-            same += '[0-9]'
+    key = tuple(patterns)
+    with DELTA_CHANGE_LOCK:
+        delta_change_id = DELTA_CHANGE_IDS.get(key)
+        if delta_change_id is None:
+            delta_change_id = DELTA_CHANGE_IDS[key] = next(DELTA_CHANGE_COUNTER)
+            DELTA_CHANGES[delta_change_id] = key
+        if delta_change_id:
+            DELTA_CHANGE_USERS[delta_change_id] = DELTA_CHANGE_USERS.get(delta_change_id, 0) + 1
+        release_DeltaChange(previous_id)
+        return delta_change_id
+
+
+def release_DeltaChange(delta_change_id: int) -> None:
+    """
+    Counts one less webpage using the deltaChange, and forgets it (and its mask) when none do. Its id isn't used
+    again, so load_Mask() can't return its mask for another deltaChange
+    :param delta_change_id: int, from intern_DeltaChange()
+    :return: None
+    """
+    if not delta_change_id:
+        return
+    with DELTA_CHANGE_LOCK:
+        users = DELTA_CHANGE_USERS.get(delta_change_id, 0) - 1
+        if users > 0:
+            DELTA_CHANGE_USERS[delta_change_id] = users
+        elif delta_change_id in DELTA_CHANGES:
+            DELTA_CHANGE_USERS.pop(delta_change_id, None)
+            DELTA_MASKS.pop(delta_change_id, None)
+            del DELTA_CHANGE_IDS[DELTA_CHANGES.pop(delta_change_id)]
+
+
+def load_Mask(delta_change_id: int) -> Optional[Pattern]:
+    """
+    Returns the compiled mask of an interned deltaChange. It is compiled on its first use and kept in DELTA_MASKS till
+    no webpage uses the deltaChange (see release_DeltaChange())
+    :param delta_change_id: int, from intern_DeltaChange()
+    :return: compiled regex, None if there's nothing to mask
+    """
+    with DELTA_CHANGE_LOCK:
+        if delta_change_id in DELTA_MASKS:
+            return DELTA_MASKS[delta_change_id]
+        patterns = DELTA_CHANGES[delta_change_id]
+    # Compiled without the lock, the other threads don't wait for it
+    mask = compile_Mask(patterns)
+    with DELTA_CHANGE_LOCK:
+        # Unless it was released meanwhile
+        if delta_change_id in DELTA_CHANGES:
+            mask = DELTA_MASKS.setdefault(delta_change_id, mask)
+    return mask
+
+
+def compile_Mask(patterns: List[str]) -> Optional[Pattern]:
+    """
+    Compiles the deltaChange patterns into a single regex, so that all of them are masked in one pass over a line
+    (see mask_Line()). Patterns which match an empty string would mask nothing, and are left out.
+    :param patterns: list of str, deltaChange patterns
+    :return: compiled regex, None if there's nothing to mask
+    """
+    compiled = [compile_DeltaChange(i) for i in patterns]
+    alternatives = [f'(?:{i.pattern})' for i in compiled if i.fullmatch('') is None]
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives))
+
+
+def mask_Line(line: str, mask: Optional[Pattern]) -> str:
+    """
+    Replaces the parts of the line matching the deltaChange with a placeholder, so two lines which only differ in
+    them (eg: a timestamp or a token) become equal
+    :param line: str
+    :param mask: compiled regex from compile_Mask(), None to leave the line as it is
+    :return: str
+    """
+    if mask is None:
+        return line
+    return mask.sub('\0', line)
+
+
+def normalize_Line(line: str) -> str:
+    """
+    Normalizes a line the way `diff -EZb` compares them: trailing whitespace is removed and
+    every other run of whitespace (tabs included) counts as a single space
+    :param line: str
+    :return: str
+    """
+    return re.sub(r'[ \t\r\f\v]+', ' ', line.rstrip())
+
+
+class Fingerprint:
+    """
+    Calculates the fingerprint (see fingerprint_Code()) of an html code which is given piece by piece,
+    eg: while it is being downloaded
+    mask: compiled deltaChange, from compile_Mask()
+    """
+
+    def __init__(self, mask: Optional[Pattern] = None):
+        self.mask = mask
+        self.digest = hashlib.sha256()
+        self.partial_line = []
+
+    def update(self, text: str) -> None:
+        """
+        Adds the next piece of the html code
+        :param text: str
+        :return: None
+        """
+        *lines, last = text.split('\n')
+        if lines:
+            lines[0] = ''.join(self.partial_line) + lines[0]
+            self.partial_line = []
+            for line in lines:
+                self.add_Line(line)
+        if last:
+            self.partial_line.append(last)
+
+    def add_Line(self, line: str) -> None:
+        """
+        Hashes a complete line with its deltaChange masked, unless it is blank
+        :param line: str, without the '\n'
+        :return: None
+        """
+        normalized = normalize_Line(mask_Line(line, self.mask))
+        if normalized == '':
+            return
+        self.digest.update(normalized.encode('utf-8', 'surrogatepass') + b'\n')
+
+    def hexdigest(self) -> str:
+        """
+        Returns the fingerprint of the html code given so far
+        :return: str, sha256 hex digest
+        """
+        if self.partial_line:
+            self.add_Line(''.join(self.partial_line))
+            self.partial_line = []
+        return self.digest.hexdigest()
+
+
+def fingerprint_Code(code: str, mask: Optional[Pattern] = None) -> str:
+    """
+    Hashes the html code after normalizing it the same way compute_Diff() compares it: deltaChange masked
+    (mask_Line()), whitespace normalized (normalize_Line()) and blank lines removed.
+    So if two codes have the same fingerprint, the diff between them is empty.
+    :param code: str, html code
+    :param mask: compiled deltaChange, from compile_Mask()
+    :return: str, sha256 hex digest
+    """
+    fingerprint = Fingerprint(mask)
+    fingerprint.update(code)
+    return fingerprint.hexdigest()
+
+
+def compute_Diff(old_code: str, new_code: str, mask: Optional[Pattern] = None, ignore_whitespace=True,
+                 ranges: List[Tuple[int, int, int, int]] = None) -> str:
+    """
+    Compares two html codes line by line in memory, and returns the output in the format of bash's `diff` command.
+    eg: "634c634\n< old line\n---\n> new line\n"
+    With ignore_whitespace the blank lines are left out of the comparison (-B), so two codes are different exactly
+    when their fingerprints are (see fingerprint_Code()). `diff -EZBb` only drops the hunks which are all blank, and
+    can report a non-blank line moved across blank lines as a change. The hunks can also be aligned differently from
+    `diff`'s, as difflib doesn't look for the shortest diff.
+    :param old_code: str
+    :param new_code: str
+    :param mask: compiled deltaChange, from compile_Mask(). The lines are compared with it masked, so a line which
+    only differs in the deltaChange is not a change
+    :param ignore_whitespace: bool, if True behaves as `diff -EZBb`, otherwise as plain `diff`
+    :param ranges: list of (old start, old end, new start, new end), the only line ranges which need to be compared
+    (see chunks.changed_Ranges()). Defaults to the whole codes
+    :return: str, '' if nothing has changed
+    """
+    old_lines, new_lines = split_Lines(old_code), split_Lines(new_code)
+    if ranges is None:
+        ranges = [(0, len(old_lines), 0, len(new_lines))]
+
+    def key(line):
+        masked = mask_Line(line, mask)
+        return normalize_Line(masked) if ignore_whitespace else masked
+
+    def compared(lines, start, end):
+        # The line numbers of the lines to compare, and their keys
+        numbers = [number for number in range(start, end) if not ignore_whitespace or lines[number].strip() != '']
+        return numbers, [key(lines[number]) for number in numbers]
+
+    hunks = []
+    for old_start, old_end, new_start, new_end in ranges:
+        old_numbers, old_keys = compared(old_lines, old_start, old_end)
+        new_numbers, new_keys = compared(new_lines, new_start, new_end)
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            # Back to the line numbers of the codes, a hunk without lines goes after the line compared before it
+            i1, i2 = (old_numbers[i1], old_numbers[i2 - 1] + 1) if i2 > i1 else \
+                ((old_numbers[i1 - 1] + 1 if i1 else old_start),) * 2
+            j1, j2 = (new_numbers[j1], new_numbers[j2 - 1] + 1) if j2 > j1 else \
+                ((new_numbers[j1 - 1] + 1 if j1 else new_start),) * 2
+            hunks.append((tag, i1, i2, j1, j2))
+
+    output = []
+    for tag, i1, i2, j1, j2 in hunks:
+        if tag == 'replace':
+            output.append(f"{diff_Range(i1, i2)}c{diff_Range(j1, j2)}")
+        elif tag == 'delete':
+            output.append(f"{diff_Range(i1, i2)}d{j1}")
         else:
-            break
-    return same
+            output.append(f"{i1}a{diff_Range(j1, j2)}")
+        output.extend('< ' + line for line in old_lines[i1:i2])
+        if tag == 'replace':
+            output.append('---')
+        output.extend('> ' + line for line in new_lines[j1:j2])
+
+    return '\n'.join(output) + '\n' if output else ''
+
+
+def index_Code(code: str, mask: Optional[Pattern] = None) -> list:
+    """
+    Returns the chunk index (see chunks.chunk_Lines()) of the html code, with its lines as compute_Diff() compares
+    them: deltaChange masked and whitespace normalized. So the chunks with the same digest have no diff.
+    :param code: str, html code
+    :param mask: compiled deltaChange, from compile_Mask()
+    :return: list of [line count, digest]
+    """
+    return chunks.chunk_Lines([normalize_Line(mask_Line(line, mask)) for line in split_Lines(code)])
+
+
+def split_Lines(code: str) -> List[str]:
+    """
+    Splits the code into lines the way `diff` does, only on '\n'
+    :param code: str
+    :return: list of lines without the '\n'
+    """
+    lines = code.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def diff_Range(start: int, end: int) -> str:
+    """
+    Formats a range of (0 indexed, end excluded) line numbers the way `diff` prints them. eg: 633, 634 -> "634"
+    :param start: int
+    :param end: int
+    :return: str
+    """
+    if end - start > 1:
+        return f"{start + 1},{end}"
+    return str(end)
+
+
+def offset_Hunks(output: str, old_offset: int, new_offset: int) -> str:
+    """
+    Moves the hunks of a `diff` output of a part of the files to their line numbers in the whole files.
+    eg: "3c3" of the parts starting at lines 120 and 121 -> "123c124"
+    :param output: str, diff's output
+    :param old_offset: int, the lines of the old file before its part
+    :param new_offset: int, the lines of the new file before its part
+    :return: str
+    """
+    def shift(match):
+        old = [str(int(number) + old_offset) for number in match.group(1, 2) if number]
+        new = [str(int(number) + new_offset) for number in match.group(4, 5) if number]
+        return f"{','.join(old)}{match.group(3)}{','.join(new)}"
+    return HUNK_HEADER.sub(shift, output)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+#  Copyright (c) 2020. RoguedBear
+import difflib
+import hashlib
+import zlib
+from typing import List, Tuple
+
+# The lines of a webpage are split into chunks at content-defined boundaries: after a line where the rolling hash of
+# the last WINDOW lines is a multiple of CHUNK_LINES (so about every CHUNK_LINES lines), within MIN_LINES and MAX_LINES.
+# A change only moves the boundaries near it, so the chunks of the rest of the webpage stay the same.
+CHUNK_LINES = 32
+MIN_LINES = 8
+MAX_LINES = 256
+WINDOW = 4
+# The number of changed line ranges locate_Changes() lists
+LOCATE_RANGES = 5
+
+
+def chunk_Lines(lines: List[str]) -> List[list]:
+    """
+    Splits the lines into content-defined chunks, and returns the chunk index: the number of lines and a digest of
+    every chunk. Two chunks with the same digest have the same lines.
+    eg: [[31, '9f2c...'], [40, '03ab...'], ...]
+    :param lines: list of str, eg: the lines of an html code as they are compared (masked and normalized)
+    :return: list of [line count, digest]
+    """
+    index = []
+    hashes = []
+    rolling = 0
+    start = 0
+    for number, line in enumerate(lines):
+        line_hash = zlib.crc32(line.encode('utf-8', 'surrogatepass'))
+        hashes.append(line_hash)
+        rolling += line_hash
+        if number >= WINDOW:
+            rolling -= hashes[number - WINDOW]
+        size = number + 1 - start
+        if size >= MAX_LINES or size >= MIN_LINES and rolling % CHUNK_LINES == 0:
+            index.append([size, digest_Lines(lines[start:number + 1])])
+            start = number + 1
+    if start < len(lines):
+        index.append([len(lines) - start, digest_Lines(lines[start:])])
+    return index
+
+
+def digest_Lines(lines: List[str]) -> str:
+    """
+    :param lines: list of str
+    :return: str, a short digest of the lines
+    """
+    return hashlib.blake2b('\n'.join(lines).encode('utf-8', 'surrogatepass'), digest_size=8).hexdigest()
+
+
+def count_Lines(index: List[list]) -> int:
+    """
+    :param index: list of [line count, digest], from chunk_Lines()
+    :return: int, the number of lines the chunk index covers
+    """
+    return sum(size for size, _ in index)
+
+
+def changed_Ranges(old_index: List[list], new_index: List[list]) -> List[Tuple[int, int, int, int]]:
+    """
+    Compares two chunk indexes by digest, and returns the line ranges which differ. Only these need to be diffed, the
+    rest of the lines are the same.
+    :param old_index: list of [line count, digest], from chunk_Lines()
+    :param new_index: list of [line count, digest]
+    :return: list of (old start, old end, new start, new end) line numbers, 0 indexed and end excluded
+    """
+    old_starts, new_starts = line_Starts(old_index), line_Starts(new_index)
+    matcher = difflib.SequenceMatcher(None, [digest for _, digest in old_index], [digest for _, digest in new_index],
+                                      autojunk=False)
+    return [(old_starts[i1], old_starts[i2], new_starts[j1], new_starts[j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def line_Starts(index: List[list]) -> List[int]:
+    """
+    :param index: list of [line count, digest]
+    :return: list of int, the first line of every chunk, and the line count at the end
+    """
+    starts = [0]
+    for size, _ in index:
+        starts.append(starts[-1] + size)
+    return starts
+
+
+def locate_Changes(ranges: List[Tuple[int, int, int, int]], new_index: List[list]) -> str:
+    """
+    Describes where the changed ranges are in the new code. eg: 'lines 120-151, 900-931 (2 of 75 chunks changed)'
+    :param ranges: list of (old start, old end, new start, new end), from changed_Ranges()
+    :param new_index: list of [line count, digest], the new code's chunk index
+    :return: str, '' if there is no changed range
+    """
+    if not ranges:
+        return ''
+    new_starts = line_Starts(new_index)
+    changed = sum(max(1, new_starts.index(j2) - new_starts.index(j1)) for _, _, j1, j2 in ranges)
+    spans = [f"{j1 + 1}-{j2}" if j2 - j1 > 1 else str(j2 or 1) for _, _, j1, j2 in ranges[:LOCATE_RANGES]]
+    if len(ranges) > LOCATE_RANGES:
+        spans.append('...')
+    return f"lines {', '.join(spans)} ({changed} of {len(new_index)} chunks changed)"
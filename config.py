@@ -0,0 +1,217 @@
+#  Copyright (c) 2020. RoguedBear
+import csv
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import checker
+import learner
+
+logger = logging.getLogger("Config")
+
+
+class Settings:
+    """
+    The settings from the command line which apply to every webpage created from the config file, unless its row
+    overrides them.
+    interval: float, default seconds between the checks (--wait)
+    adaptive: bool, --adaptive
+    max_size: str, default maximum size of a webpage (--max-size), eg: 5M. 0 or None for no limit
+    deadline: float, --deadline
+    stream  : bool, --stream
+    policy  : checker.FetchPolicy
+    store   : store.SnapshotStore or None
+    samples : int, the number of downloads the deltaChange is learned from (--samples)
+    text_only: bool, compare only the visible text blocks of the webpages (--method 4)
+    """
+
+    def __init__(self, interval: float, adaptive=False, max_size: str = None, deadline: float = None, stream=False,
+                 policy: checker.FetchPolicy = None, store=None, samples: int = learner.SAMPLES,
+                 text_only=False):
+        self.interval = interval
+        self.adaptive = adaptive
+        self.max_size = max_size
+        self.deadline = deadline
+        self.stream = stream
+        self.policy = policy or checker.FetchPolicy()
+        self.store = store
+        self.samples = samples
+        self.text_only = text_only
+
+
+class ConfigWatcher:
+    """
+    Watches the config file for changes by polling its modification time and size
+    config_file: str
+
+    -----------
+    Methods:
+      - has_Changed(): True if the file has been modified since the last call
+    """
+
+    def __init__(self, config_file: str):
+        self.config_file = config_file
+        self.last_stat = self.get_Stat()
+
+    def get_Stat(self) -> Optional[Tuple[float, int]]:
+        """
+        Returns the modification time and size of the config file
+        :return: tuple(mtime, size), None if it does not exist
+        """
+        try:
+            stat = os.stat(self.config_file)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def has_Changed(self) -> bool:
+        """
+        Returns True if the config file has been modified (or created/deleted) since the last call
+        :return: bool
+        """
+        stat = self.get_Stat()
+        if stat == self.last_stat:
+            return False
+        self.last_stat = stat
+        return True
+
+
+def get_item(iterable, index, default='', to_type=str):
+    """
+    Safely retrieve an item from a tuple. (tuple which is retrieved from CSV parser
+    :param iterable: the tuple or list
+    :param index: the index which you want
+    :param default: the value to be used if the said stuff is not found
+    :param to_type: the data type to convert that stuff to. will output default if ValueError occurs
+    :return: to_type or str
+    """
+    try:
+        return_stuff = iterable[index].strip()
+        try:
+            return_stuff = to_type(return_stuff)
+        except ValueError:
+            return_stuff = str(return_stuff)
+    except IndexError:
+        return_stuff = default
+    return return_stuff
+
+
+# noinspection PyShadowingNames
+def time_parser(time: str) -> int:
+    """
+    Converts compound duration time to seconds
+    :param time: str of compound time
+    :return: int, seconds
+    """
+    time_search = re.compile(r"(?:(\d+)h)? ?(?:(\d+)m)? ?(?:(\d+)s)?")
+    hour, minute, second = time_search.fullmatch(time).groups(default='0')
+    return int(hour) * 3600 + int(minute) * 60 + int(second)
+
+
+def size_parser(size: str) -> int:
+    """
+    Converts size with an optional K/M suffix to bytes. eg: 512K
+    :param size: str
+    :return: int, bytes
+    """
+    size_search = re.compile(r"(\d+) ?([kKmM]?)[bB]?")
+    number, unit = size_search.fullmatch(size).groups()
+    return int(number) * {'': 1, 'k': 1024, 'm': 1024 ** 2}[unit.lower()]
+
+
+def read_Config(config_file: str) -> Dict[str, list]:
+    """
+    Reads the rows of the config file. Raises FileNotFoundError if it does not exist.
+    :param config_file: str
+    :return: dict of webpage name: row. Empty rows and rows without a url are skipped, and for repeated names the
+    last row is used
+    """
+    rows = {}
+    with open(config_file, 'r') as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or not row[0].strip():
+                continue
+            name = row[0].strip()
+            if not get_item(row, 1):
+                logger.warning(f"\"{name}\" has no url in the config file, skipping it.")
+                continue
+            if name in rows:
+                logger.warning(f"\"{name}\" is repeated in the config file, using its last row.")
+            rows[name] = row
+    return rows
+
+
+def create_Webpage(row: list, settings: Settings) -> Tuple[checker.Webpage, Optional[int]]:
+    """
+    Creates the Webpage of a config row
+    :param row: list, the csv row
+    :param settings: Settings
+    :return: tuple(Webpage, the WAIT_TIME for its find_DeltaChange(), None for the default)
+    """
+    new_class_instance = checker.Webpage(row[0].strip(), row[1].strip())
+
+    # Set verify SSL value, incase requests returns SSLError
+    new_class_instance.set_verifySSL(get_item(row, 3))
+
+    new_class_instance.set_config(row)
+
+    # Set the interval between the checks of this webpage, defaults to --wait
+    interval = get_item(row, 4)
+    try:
+        new_class_instance.set_interval(time_parser(interval) if interval else settings.interval)
+    except AttributeError:
+        logger.warning(f"Invalid interval \"{interval}\" for \"{row[0]}\", using {settings.interval} seconds")
+        new_class_instance.set_interval(settings.interval)
+
+    # --adaptive, set the bounds of the interval
+    if settings.adaptive:
+        bounds = []
+        for index, default in [(5, new_class_instance.get_interval() / 4),
+                               (6, new_class_instance.get_interval() * 16)]:
+            try:
+                bounds.append(time_parser(get_item(row, index)) or default)
+            except AttributeError:
+                logger.warning(f"Invalid interval \"{get_item(row, index)}\" for \"{row[0]}\"")
+                bounds.append(default)
+        new_class_instance.set_adaptive(*bounds)
+
+    # --max-size/--deadline/--stream, set the download limits
+    max_size = get_item(row, 7) or settings.max_size
+    try:
+        max_bytes = (size_parser(max_size) or None) if max_size else None
+    except AttributeError:
+        logger.warning(f"Invalid size \"{max_size}\" for \"{row[0]}\", not limiting its size")
+        max_bytes = None
+    new_class_instance.set_limits(max_bytes, settings.deadline, settings.stream)
+    new_class_instance.set_policy(settings.policy)
+    new_class_instance.set_samples(settings.samples)
+
+    # Compare only the part of the webpage selected by the CSS selector/XPath in the 9th column
+    if get_item(row, 8):
+        new_class_instance.set_selector(get_item(row, 8))
+    if settings.text_only:
+        new_class_instance.set_textOnly()
+
+    if settings.store is not None:
+        new_class_instance.set_store(settings.store)
+
+    try:
+        return new_class_instance, int(row[2])
+    except (ValueError, IndexError):
+        return new_class_instance, None
+
+
+def diff_Config(webpages: Dict[str, checker.Webpage], rows: Dict[str, list]) \
+        -> Tuple[List[list], List[checker.Webpage], List[Tuple[checker.Webpage, list]]]:
+    """
+    Compares the running webpages with the rows of the config file
+    :param webpages: dict of name: Webpage
+    :param rows: dict of name: row, from read_Config()
+    :return: tuple(rows to add, webpages to remove, (webpage, new row) to re-initialize)
+    """
+    added = [row for name, row in rows.items() if name not in webpages]
+    removed = [webpage for name, webpage in webpages.items() if name not in rows]
+    changed = [(webpage, rows[name]) for name, webpage in webpages.items()
+               if name in rows and webpage.config != checker.config_Signature(rows[name])]
+    return added, removed, changed
@@ -0,0 +1,365 @@
+#  Copyright (c) 2020. RoguedBear
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, InvalidStateError, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import checker
+import metrics
+
+
+class CheckEngine:
+    """
+    Runs Webpage.detect() for many webpages at once, using a bounded pool of worker threads.
+
+    workers : int, the total number of webpages that can be checked at the same time
+    per_host: int, the number of webpages of the same host that can be checked at the same time
+    retry   : bool, whether the webpages whose find_DeltaChange() failed find it again when submitted. False for a
+              single run (--once), which only reports them
+
+    -----------
+    Methods:
+      - run_cycle()    : checks every webpage once and returns the results of the ones that finished
+      - submit()       : starts checking the webpages, without waiting for them
+      - collect()      : returns the results of the checks which have finished
+      - run_baselines(): runs find_DeltaChange() of many webpages at once
+      - submit_Baselines()/collect_BaselineResults(): same, without waiting for them (eg: webpages added while
+                         running)
+      - remove()       : forgets a webpage whose find_DeltaChange() is waiting or failed
+      - is_Busy()      : True while any check or find_DeltaChange() is running
+      - wake()         : makes a waiting collect() return early
+      - shutdown()     : stops the worker threads
+
+    A webpage which is still being checked from an earlier cycle (slow or hung website) is skipped, and its result
+    is returned by the cycle in which it finishes instead of blocking the rest.
+    The webpages of the same url (see Webpage.get_fetchKey()) are checked one after another in a single worker
+    thread, sharing one download.
+    The work of a host beyond per_host waits in the host's queue (see submit_ToHost()) instead of in a worker thread,
+    so that a slow or hung host can't take up the worker threads of the other hosts.
+    A webpage whose find_DeltaChange() failed is kept, and submitting it again (after Webpage.get_retryDelay(), see
+    main.handle_Results()) finds its deltaChange again instead of checking it.
+    """
+
+    def __init__(self, workers: int = 8, per_host: int = 2, method: int = 1, debug: bool = True,
+                 retry: bool = True):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.retry = retry
+        self.method = method
+        self.debug = debug
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='checker')
+        # host -> the number of its tasks in the worker threads, and the queue of the rest
+        self._host_running = {}
+        self._host_queues = {}
+        self._host_lock = threading.Lock()
+        self._stopped = False
+        self._in_flight = {}
+        self._baselines = {}
+        # webpage -> the wait_time of its find_DeltaChange(), till it succeeds
+        self._wait_times = {}
+        # Done by wake(), collect() waits for it along with the checks
+        self._wakeup = Future()
+        self.logger = logging.getLogger("CheckEngine")
+        self.logger.debug(f"Created CheckEngine with {self.workers} worker(s), {self.per_host} per host")
+
+    def submit_ToHost(self, host: str, function: Callable, *args) -> Future:
+        """
+        Runs function(*args) in a worker thread once fewer than per_host tasks of the host are running. Till then it
+        waits in the host's queue, without taking up a worker thread.
+        :param host: str, see get_Host()
+        :param function: function
+        :param args: its arguments
+        :return: Future, of its return value
+        """
+        future = Future()
+        with self._host_lock:
+            self._host_queues.setdefault(host, deque()).append((future, function, args))
+        self.start_HostTasks(host)
+        return future
+
+    def start_HostTasks(self, host: str) -> None:
+        """
+        Hands the queued tasks of the host to the worker threads, as long as it has free slots
+        :param host: str
+        :return: None
+        """
+        with self._host_lock:
+            tasks = []
+            queued = self._host_queues.get(host)
+            while queued and not self._stopped and self._host_running.get(host, 0) < self.per_host:
+                tasks.append(queued.popleft())
+                self._host_running[host] = self._host_running.get(host, 0) + 1
+            if not queued:
+                self._host_queues.pop(host, None)
+        for future, function, args in tasks:
+            self.executor.submit(self.run_HostTask, host, future, function, args)
+
+    def run_HostTask(self, host: str, future: Future, function: Callable, args: tuple) -> None:
+        """
+        Runs a task of submit_ToHost() in a worker thread, then starts the next queued task of its host
+        :return: None
+        """
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = function(*args)
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._host_lock:
+                self._host_running[host] -= 1
+                if not self._host_running[host]:
+                    del self._host_running[host]
+            self.start_HostTasks(host)
+
+    def check(self, webpage: checker.Webpage) -> Tuple[bool, str]:
+        """
+        Checks a single webpage. Runs inside a worker thread.
+        An exception is logged and treated as a check which did not complete, so that one website cannot stop the
+        others.
+        :param webpage: Webpage
+        :return: Tuple(bool, str), same as Webpage.detect()
+        """
+        try:
+            return webpage.detect(self.method, debug=self.debug)
+        except Exception as error:
+            webpage.logger.error(f"Checking failed{', will retry in the next cycle' if self.retry else ''}: "
+                                 f"{error!r}")
+            metrics.REGISTRY.increment('webpage_errors_total', site=webpage.get_name(), kind='exception')
+            return None, ''
+
+    def check_Group(self, webpages: List[checker.Webpage]) -> Dict[checker.Webpage, Tuple[bool, str]]:
+        """
+        Checks the webpages of the same url one after another, so they share a single download. Runs inside a worker
+        thread, as a single task of their host.
+        :param webpages: list of Webpage, with the same fetch key
+        :return: dict of webpage: Tuple(bool, str)
+        """
+        if len(webpages) == 1:
+            return {webpages[0]: self.check(webpages[0])}
+        with checker.hold_Fetches(webpages[0].get_fetchKey()):
+            return {webpage: self.check(webpage) for webpage in webpages}
+
+    def run_cycle(self, webpages: List[checker.Webpage], timeout: float = None) \
+            -> List[Tuple[checker.Webpage, bool, str]]:
+        """
+        Checks all the webpages concurrently.
+        :param webpages: list of Webpage
+        :param timeout: the maximum seconds to wait for this cycle, None waits for all of them
+        :return: list of (webpage, change_detected, output) for every check that finished in this cycle
+
+        # Pseudocode:
+        * interleave the webpages by host, so that workers don't all wait on the same host
+        * submit the webpages which are not still running from the previous cycle
+        * wait for all of them or till the timeout
+        * collect the finished ones, keep the rest in flight for the next cycle
+        """
+        self.submit(webpages)
+        wait(set(self._in_flight.values()), timeout=timeout)
+
+        results = self.collect()
+        if self._in_flight:
+            self.logger.warning(f"{len(self._in_flight)} webpage(s) did not finish in this cycle: "
+                                f"{', '.join(webpage.get_name() for webpage in self._in_flight)}")
+        return results
+
+    def submit(self, webpages: List[checker.Webpage]) -> None:
+        """
+        Starts checking the webpages in the worker threads, skipping the ones which are still being checked.
+        The webpages whose find_DeltaChange() failed find it again instead
+        :param webpages: list of Webpage
+        :return: None
+        """
+        groups = {}
+        for webpage in interleave_ByHost(webpages):
+            if webpage in self._baselines:
+                continue
+            if webpage in self._wait_times:
+                self.submit_Baselines([(webpage, self._wait_times[webpage])])
+                continue
+            if webpage in self._in_flight:
+                webpage.logger.warning("Previous check is still running, skipping this cycle.")
+                continue
+            groups.setdefault(webpage.get_fetchKey(), []).append(webpage)
+        for group in groups.values():
+            future = self.submit_ToHost(get_Host(group[0]), self.check_Group, group)
+            for webpage in group:
+                self._in_flight[webpage] = future
+
+    def collect(self, timeout: float = 0) -> List[Tuple[checker.Webpage, bool, str]]:
+        """
+        Returns the results of the checks which have finished. Waits (upto timeout) for at least one of them, or a
+        find_DeltaChange(), to finish if none has. wake() stops the wait.
+        :param timeout: float, seconds. None waits for as long as it takes
+        :return: list of (webpage, change_detected, output)
+        """
+        wakeup = self._wakeup
+        wait(set(self._in_flight.values()) | set(self._baselines.values()) | {wakeup}, timeout=timeout,
+             return_when=FIRST_COMPLETED)
+        if wakeup.done():
+            self._wakeup = Future()
+
+        results = []
+        for webpage, future in list(self._in_flight.items()):
+            if future.done():
+                del self._in_flight[webpage]
+                change_detected, output = future.result()[webpage]
+                results.append((webpage, change_detected, output))
+        return results
+
+    def baseline(self, webpage: checker.Webpage, wait_time: int) -> bool:
+        """
+        Runs find_DeltaChange() of a single webpage. Runs inside a worker thread, as a task of its host.
+        :param webpage: Webpage
+        :param wait_time: int, the WAIT_TIME of find_DeltaChange(), None for its default
+        :return: bool, False if it failed
+        """
+        # The webpages of the same url finding their deltaChange at about the same time share the downloads
+        with checker.hold_Fetches(webpage.get_fetchKey()):
+            try:
+                if wait_time is None:
+                    webpage.find_DeltaChange()
+                else:
+                    webpage.find_DeltaChange(wait_time)
+                webpage.failures = 0
+                return True
+            except Exception as error:
+                webpage.failures += 1
+                if self.retry:
+                    webpage.logger.error(f"Finding deltaChange failed, retrying in "
+                                         f"{webpage.get_retryDelay() / 60:.1f} minutes: {error!r}")
+                else:
+                    webpage.logger.error(f"Finding deltaChange failed: {error!r}")
+                metrics.REGISTRY.increment('webpage_errors_total', site=webpage.get_name(), kind='baseline')
+                return False
+
+    def run_baselines(self, webpages: List[Tuple[checker.Webpage, int]]) -> List[checker.Webpage]:
+        """
+        Finds the deltaChange of all the webpages concurrently, so that the startup doesn't take
+        (number of webpages) * (2 downloads + WAIT_TIME)
+        :param webpages: list of (webpage, wait_time)
+        :return: list of the webpages whose deltaChange was found. The rest find it again when submitted (unless not
+        retry)
+        """
+        wait_times = dict(webpages)
+        futures = {webpage: self.submit_ToHost(get_Host(webpage), self.baseline, webpage, wait_times[webpage])
+                   for webpage in interleave_ByHost([webpage for webpage, _ in webpages])}
+        wait(list(futures.values()))
+        found = []
+        for webpage, wait_time in webpages:
+            if futures[webpage].result():
+                found.append(webpage)
+            elif self.retry:
+                self._wait_times[webpage] = wait_time
+        return found
+
+    def submit_Baselines(self, webpages: List[Tuple[checker.Webpage, int]]) -> None:
+        """
+        Starts finding the deltaChange of the webpages in the worker threads, without waiting for them
+        :param webpages: list of (webpage, wait_time)
+        :return: None
+        """
+        for webpage, wait_time in webpages:
+            self._wait_times[webpage] = wait_time
+            self._baselines[webpage] = self.submit_ToHost(get_Host(webpage), self.baseline, webpage, wait_time)
+
+    def collect_BaselineResults(self) -> List[Tuple[checker.Webpage, bool]]:
+        """
+        Returns the webpages whose find_DeltaChange() has finished since the last call, with whether it succeeded.
+        The failed ones find it again when they are submitted
+        :return: list of (webpage, bool)
+        """
+        finished = []
+        for webpage, future in list(self._baselines.items()):
+            if future.done():
+                del self._baselines[webpage]
+                if future.cancelled():
+                    continue
+                found = future.result()
+                if found:
+                    self._wait_times.pop(webpage, None)
+                finished.append((webpage, found))
+        return finished
+
+    def remove(self, webpage: checker.Webpage, forget=False) -> None:
+        """
+        Forgets the webpage: its find_DeltaChange() is cancelled if it is still waiting for its host, and isn't
+        retried if it failed
+        :param webpage: Webpage
+        :param forget: bool, also delete it from the snapshot store (see Webpage.delete_State()), once its running
+        check or find_DeltaChange() (if any) has finished, as that saves it again
+        :return: None
+        """
+        self._wait_times.pop(webpage, None)
+        baseline = self._baselines.get(webpage)
+        if baseline is not None:
+            baseline.cancel()
+        if not forget:
+            return
+        running = baseline if baseline is not None and not baseline.cancelled() else self._in_flight.get(webpage)
+        if running is None:
+            webpage.delete_State()
+        else:
+            running.add_done_callback(lambda _: webpage.delete_State())
+
+    def is_Busy(self) -> bool:
+        """
+        Returns True while any check or find_DeltaChange() is running (or waiting for a worker thread)
+        :return: bool
+        """
+        return bool(self._in_flight or self._baselines)
+
+    def wake(self) -> None:
+        """
+        Makes collect() return now if it is waiting, or the next time it is called. Safe to call from any thread or a
+        signal handler
+        :return: None
+        """
+        try:
+            self._wakeup.set_result(None)
+        except InvalidStateError:
+            pass
+
+    def shutdown(self, wait_for_checks: bool = False) -> None:
+        """
+        Stops the worker threads. The tasks waiting in the host queues are cancelled
+        :param wait_for_checks: whether to wait for the running checks to finish
+        :return: None
+        """
+        with self._host_lock:
+            self._stopped = True
+            queued = [future for tasks in self._host_queues.values() for future, _, _ in tasks]
+            self._host_queues.clear()
+        for future in queued:
+            future.cancel()
+        self.executor.shutdown(wait=wait_for_checks, cancel_futures=True)
+
+
+def get_Host(webpage: checker.Webpage) -> str:
+    """
+    Returns the host of the webpage, which per_host limits
+    :param webpage: Webpage
+    :return: str
+    """
+    return urlsplit(webpage.get_url()).hostname or webpage.get_url()
+
+
+def interleave_ByHost(webpages: List[checker.Webpage]) -> List[checker.Webpage]:
+    """
+    Orders the webpages round-robin by host. eg: [a1, a2, b1] -> [a1, b1, a2]
+    :param webpages: list of Webpage
+    :return: list of Webpage
+    """
+    by_host = {}
+    for webpage in webpages:
+        by_host.setdefault(urlsplit(webpage.get_url()).hostname, []).append(webpage)
+    ordered = []
+    queues = list(by_host.values())
+    while queues:
+        ordered.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return ordered
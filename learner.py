@@ -0,0 +1,225 @@
+#  Copyright (c) 2020. RoguedBear
+import difflib
+import re
+import string
+from typing import Dict, List, Set, Tuple
+
+import chunks
+
+# The number of downloads find_DeltaChange() learns from
+SAMPLES = 3
+
+# Literal characters of context kept on each side of a volatile span, so its pattern only matches that spot
+CONTEXT = 16
+# A pattern needs at least these many literal (non whitespace) characters, unless it is anchored to the line start
+MIN_LITERAL = 3
+# Separators allowed between two volatile spans for them to be joined into one pattern. eg: the ':' in 12:30
+SEPARATORS = set(' \t:/.,-')
+MAX_GAP = 2
+MAX_PATTERNS = 200
+
+TOKEN = re.compile(r'\w+|\s+|[^\w\s]')
+NAMES = {'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec', 'january',
+         'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october', 'november', 'december',
+         'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+         'saturday', 'sunday', 'am', 'pm', 'utc', 'gmt', 'ist'}
+
+
+def learn_DeltaChange(samples: List[str]) -> List[str]:
+    """
+    Learns the volatile spans of a webpage (dates, times, counters, nonces, hashes...) from several downloads of it,
+    and returns a pattern for each of them. The patterns are basic regex (like `diff -I` / grep), eg:
+    'Visitors: [0-9][0-9]*</p>' or 'value="[0-9A-Fa-f][0-9A-Fa-f]*">'
+    :param samples: list of str, the html codes downloaded a few seconds apart. The 1st one is the base
+    :return: list of str, deltaChange patterns
+
+    # Pseudocode:
+    * align the lines of every sample with the base (only in the chunks which differ), and pair up the changed lines
+    * split the paired lines into tokens, and mark the tokens of the base which changed (with what they changed to)
+    * join nearby volatile tokens (and the numbers/month names around them, for dates and times) into spans
+    * turn every span into a pattern: a character class for the volatile tokens, with some literal context around it
+    """
+    if len(samples) < 2:
+        return []
+    base_lines = samples[0].split('\n')
+    base_index = chunks.chunk_Lines(base_lines)
+    tokens = {}
+    volatile = {}
+    for sample in samples[1:]:
+        lines = sample.split('\n')
+        for base_start, base_end, start, end in chunks.changed_Ranges(base_index, chunks.chunk_Lines(lines)):
+            matcher = difflib.SequenceMatcher(None, base_lines[base_start:base_end], lines[start:end], autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag != 'replace':
+                    continue
+                for i, j in pair_Lines(base_lines, i1 + base_start, i2 + base_start, lines, j1 + start, j2 + start):
+                    if i not in tokens:
+                        tokens[i] = TOKEN.findall(base_lines[i])
+                    mark_Volatile(tokens[i], TOKEN.findall(lines[j]), volatile.setdefault(i, {}))
+
+    patterns = []
+    for i in sorted(volatile):
+        for pattern in line_Patterns(tokens[i], volatile[i]):
+            if pattern not in patterns:
+                patterns.append(pattern)
+    return patterns[:MAX_PATTERNS]
+
+
+def pair_Lines(old_lines: List[str], i1: int, i2: int, new_lines: List[str], j1: int, j2: int) \
+        -> List[Tuple[int, int]]:
+    """
+    Pairs up the lines of a changed block of the base with the lines they were changed to
+    :return: list of (base line index, sample line index)
+    """
+    if i2 - i1 == j2 - j1:
+        return list(zip(range(i1, i2), range(j1, j2)))
+    # Different number of lines, pairing every line with its most similar one (if similar enough)
+    if (i2 - i1) * (j2 - j1) > 2500:
+        return []
+    pairs = []
+    for i in range(i1, i2):
+        best, best_ratio = None, 0.6
+        for j in range(j1, j2):
+            matcher = difflib.SequenceMatcher(None, old_lines[i], new_lines[j], autojunk=False)
+            if matcher.real_quick_ratio() > best_ratio and matcher.quick_ratio() > best_ratio \
+                    and matcher.ratio() > best_ratio:
+                best, best_ratio = j, matcher.ratio()
+        if best is not None:
+            pairs.append((i, best))
+    return pairs
+
+
+def mark_Volatile(old_tokens: List[str], new_tokens: List[str], volatile: Dict[int, Set[str]]) -> None:
+    """
+    Marks the tokens of the base line which were replaced in the other sample
+    :param old_tokens: list of str, tokens of the base line
+    :param new_tokens: list of str, tokens of the same line in another sample
+    :param volatile: dict of token index: set of what it was replaced with. Updated in place
+    :return: None
+    """
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'replace':
+            continue
+        replacement = ''.join(new_tokens[j1:j2])
+        for index in range(i1, i2):
+            volatile.setdefault(index, set()).add(replacement)
+
+
+def line_Patterns(tokens: List[str], volatile: Dict[int, Set[str]]) -> List[str]:
+    """
+    Turns the volatile tokens of a line into patterns
+    :param tokens: list of str, tokens of the base line
+    :param volatile: dict of token index: set of what it was replaced with
+    :return: list of str, patterns
+    """
+    # Finding the spans: runs of volatile tokens, joined when only separators are between them
+    spans = []
+    for index in sorted(volatile):
+        if spans and index - spans[-1][1] <= MAX_GAP \
+                and all(is_Separator(token) for token in tokens[spans[-1][1]:index]):
+            spans[-1][1] = index + 1
+        else:
+            spans.append([index, index + 1])
+
+    patterns = []
+    for start, end in spans:
+        # Dates and times: the numbers and month/day names next to a volatile number are volatile too
+        if any(volatile_Class(volatile[i] | {tokens[i]}) == '[0-9]' for i in range(start, end) if i in volatile):
+            start, end = grow_Span(tokens, start, end)
+
+        body = ''
+        index = start
+        while index < end:
+            if index in volatile:
+                run = index
+                while index < end and index in volatile:
+                    index += 1
+                strings = {''.join(tokens[run:index])}
+                for i in range(run, index):
+                    strings |= volatile[i]
+                character_class = volatile_Class(strings)
+                body += character_class + character_class + '*'
+            else:
+                body += volatile_Class({tokens[index]}) * 2 + '*' if is_Variable(tokens[index]) \
+                    else escape(tokens[index])
+                index += 1
+
+        # Literal context on both sides, stopping at other volatile tokens
+        left = start
+        while left > 0 and left - 1 not in volatile and len(''.join(tokens[left:start])) < CONTEXT:
+            left -= 1
+        right = end
+        while right < len(tokens) and right not in volatile and len(''.join(tokens[end:right])) < CONTEXT:
+            right += 1
+        literal = ''.join(tokens[left:start] + tokens[end:right])
+        anchored = left == 0
+        if not anchored and len(''.join(literal.split())) < MIN_LITERAL:
+            continue
+        patterns.append(('^' if anchored else '') + escape(''.join(tokens[left:start])) + body +
+                        escape(''.join(tokens[end:right])))
+    return patterns
+
+
+def grow_Span(tokens: List[str], start: int, end: int) -> Tuple[int, int]:
+    """
+    Grows a span over the numbers and month/day names around it, joined by separators. eg: the span of the seconds
+    of '18 Oct 2026 12:00:01' grows to the whole date
+    :return: tuple(start, end)
+    """
+    while True:
+        gap = start
+        while gap > 0 and start - gap < MAX_GAP and is_Separator(tokens[gap - 1]):
+            gap -= 1
+        if gap > 0 and gap < start and is_Variable(tokens[gap - 1]):
+            start = gap - 1
+        else:
+            break
+    while True:
+        gap = end
+        while gap < len(tokens) and gap - end < MAX_GAP and is_Separator(tokens[gap]):
+            gap += 1
+        if gap < len(tokens) and gap > end and is_Variable(tokens[gap]):
+            end = gap + 1
+        else:
+            break
+    return start, end
+
+
+def is_Separator(token: str) -> bool:
+    return all(char in SEPARATORS for char in token)
+
+
+def is_Variable(token: str) -> bool:
+    """
+    True for the tokens which are a part of a date or time: numbers and month/day names
+    """
+    return token.isdigit() and token.isascii() or token.lower() in NAMES
+
+
+def volatile_Class(strings: Set[str]) -> str:
+    """
+    Returns the narrowest character class (basic regex) covering all the characters of the strings
+    :param strings: set of str, eg: the values a token had in the samples
+    :return: str, eg: '[0-9]'
+    """
+    characters = set(''.join(strings))
+    if characters <= set(string.digits):
+        return '[0-9]'
+    if characters <= set(string.hexdigits):
+        return '[0-9A-Fa-f]'
+    if characters <= set(string.ascii_letters):
+        return '[A-Za-z]'
+    if characters <= set(string.ascii_letters + string.digits + '_-'):
+        return '[0-9A-Za-z_-]'
+    return '[^ "<>]'
+
+
+def escape(text: str) -> str:
+    """
+    Escapes the text for a basic regex. A single quote is matched with '.', so the pattern can be given to `diff -I`
+    inside single quotes
+    :param text: str
+    :return: str
+    """
+    return re.sub(r'([\\.\[\]*^$])', r'\\\1', text).replace("'", '.')
@@ -1,195 +1,521 @@
 #  Copyright (c) 2020. RoguedBear
 import argparse
+import atexit
+import json
 import logging
-import requests
+import signal
+import sys
 import checker
-import re
-import csv
-import json
-from datetime import time, datetime, timedelta
-from threading import Timer
-from time import sleep
+import config
+import engine
+import learner
+import metrics
+import notifier
+import scheduler
+import store
+import workers
+from datetime import time, datetime
+from time import perf_counter, sleep
+
+LOG_FORMAT = '%(asctime)s - %(levelname)-8s: %(funcName)16s() : |%(name)16.15s| - %(message)s'
+# The snapshot store of --once, if none is given. The baselines need to be kept for the next run
+ONCE_STORE = 'snapshots.db'
+# The histograms which make the timings of a webpage in the --once report
+REPORT_TIMINGS = {'check': 'webpage_check_seconds', 'download': 'webpage_download_seconds',
+                  'diff': 'webpage_diff_seconds', 'baseline': 'webpage_baseline_seconds'}
+# Seconds between writing the --metrics-json summary and checkpointing the snapshot store
+FLUSH_TIME = 60
+# The default --max-size, so that a huge (or endless) response can't take up all the memory
+MAX_SIZE = '10M'
 
 
 # noinspection PyShadowingNames
-def alert_onTelegram(message: str):
+def alert_onTelegram(message: str, batch=False):
     """
-    This function will send an alert to telegram notifying about the change
+    This function will send an alert to telegram notifying about the change.
+    The message is only queued, the NOTIFIER's thread sends it.
     :param message: The message
+    :param batch: if True, the message is sent along with the other alerts of this cycle on NOTIFIER.flush()
+    :return: None
+    """
+    metrics.REGISTRY.increment('alerts_total', kind='change' if batch else 'status')
+    if batch:
+        NOTIFIER.add(message)
+    else:
+        NOTIFIER.send(message[:notifier.ALERT_LIMIT])
+
+
+def send_uptimealert():
+    """
+    Sends uptime alert every 24hours
+    :return:
+    """
+    alert_onTelegram("#UptimeStatus, The program is working 🤖👍")
+
+
+def handle_Results(results: list) -> None:
+    """
+    Alerts the changes found by the finished checks and schedules the webpages again. Then schedules the webpages
+    whose deltaChange has been found (added to the config file), or retries finding it later if it failed. Called by
+    the EventLoop after every wakeup.
+    :param results: list of (webpage, change_detected, output), change_detected is None if the check did not complete
+    :return: None
+    """
+    for webpage, change_detected, output in results:
+        # The webpage was removed from the config file while it was being checked
+        if MASTER_Webpages.get(webpage.get_name()) is not webpage:
+            continue
+        # If change is detected
+        if change_detected:
+            message = f"""A change on *{webpage.get_name()}* has been detected.\n\nHere is the change:\n`{output}`"""
+            alert_onTelegram(message, batch=True)
+        webpage.adapt_Interval(change_detected)
+        SCHEDULER.schedule(webpage)
+    NOTIFIER.flush()
+    for webpage, found in ENGINE.collect_BaselineResults():
+        # The webpage was removed from the config file (or its row changed) while finding its deltaChange
+        if PENDING_Webpages.get(webpage.get_name()) is not webpage:
+            continue
+        if found is None:
+            # A worker could not create it from its row (see WorkerPool.collect_BaselineResults())
+            del PENDING_Webpages[webpage.get_name()]
+        elif found:
+            logger.info(f"Added \"{webpage.get_name()}\".")
+            del PENDING_Webpages[webpage.get_name()]
+            MASTER_Webpages[webpage.get_name()] = webpage
+            SCHEDULER.schedule(webpage)
+        else:
+            # Submitting it again finds its deltaChange again, see CheckEngine.submit()
+            SCHEDULER.schedule(webpage, delay=webpage.get_retryDelay())
+
+
+def flush_State(snapshot_store) -> None:
+    """
+    Writes the --metrics-json summary, and checkpoints the snapshot store (if any) into its database file
+    :param snapshot_store: store.SnapshotStore or None
+    :return: None
+    """
+    if args.metrics_json:
+        metrics.write_Summary(args.metrics_json)
+    if snapshot_store is not None:
+        snapshot_store.checkpoint()
+
+
+# ==================================================================================
+# ------------------------Command line parsers------------------------
+def create_Parser() -> argparse.ArgumentParser:
+    """
+    :return: the parser of the command line arguments
+    """
+    parser = argparse.ArgumentParser(description="This program checks from the supplied list of webpages, that if "
+                                                 "anyone of those have changed and notifies about it.")
+    parser.add_argument('-w', '--wait', help="The duration for which the program should wait before checking the page "
+                                             "again. Defaults to 2 hours. Use compound duration say 2h",
+                        metavar='XhYmZ')
+    parser.add_argument('-c', '--config', help="use the specified file instead of default config.csv",
+                        metavar='filename')
+    parser.add_argument('-d', '--debug', help="Increase logging level of program to debug. AKA increases verbosity "
+                                              "of program", action='store_true')
+    parser.add_argument('-t', '--time', help="time to send a daily alert notifying that the program is working. Enter "
+                                             "time in HH:MM 24 hour format.\nOtherwise uses program's default time of "
+                                             "14:00 IST", metavar='HH:MM')
+    parser.add_argument('-m', '--method', help="The method used to detect changes. 1: bash's diff command, 2: compare "
+                                               "in memory (no diff process or temporary files), 4: compare only the "
+                                               "visible text and alert a short summary of it. Defaults to 1",
+                        type=int, choices=[1, 2, 4], default=1)
+    parser.add_argument('-j', '--threads', help="The number of webpages to check at the same time. Defaults to 8",
+                        type=int, default=8, metavar='N')
+    parser.add_argument('--host-limit', help="The number of webpages of the same website (host) to check at the same "
+                                             "time. Defaults to 2", type=int, default=2, metavar='N')
+    parser.add_argument('-s', '--store', help="Keep the webpages and their deltaChange in this single SQLite file "
+                                              "instead of <name>_old.html/_new.html files. The webpages are resumed "
+                                              "from it after a restart", metavar='filename')
+    parser.add_argument('--history', help="The number of debug snapshots of detected changes to keep per webpage in "
+                                          "the store. Defaults to 10", type=int, default=10, metavar='N')
+    parser.add_argument('--history-days', help="Also delete the debug snapshots older than these many days from the "
+                                               "store. Defaults to keeping them by --history only", type=float,
+                        metavar='DAYS')
+    parser.add_argument('-a', '--adaptive', help="Adapt the interval of every webpage: lengthen it while the webpage "
+                                                 "does not change and shorten it after a change, within the 6th and "
+                                                 "7th columns of the config (defaults: interval/4 and interval*16)",
+                        action='store_true')
+    parser.add_argument('--max-size', help="Abort downloading a webpage larger than this, eg: 512K or 5M. Can be set "
+                                           f"per webpage in the 8th column of the config. 0 for no limit. Defaults to "
+                                           f"{MAX_SIZE}", default=MAX_SIZE, metavar='SIZE')
+    parser.add_argument('--deadline', help="Abort downloading a webpage which takes longer than these many seconds. "
+                                           "Defaults to 120", type=float, default=120, metavar='SECONDS')
+    parser.add_argument('--stream', help="Download the webpages straight to a file instead of memory, and only read "
+                                         "them back when they have changed", action='store_true')
+    parser.add_argument('--timeout', help="Seconds to wait for a webpage's server to connect or respond, before "
+                                          "retrying. Defaults to 30", type=float, default=30, metavar='SECONDS')
+    parser.add_argument('--retries', help="The number of times a failed download is retried (with exponential "
+                                          "backoff) before trying again in the next check. A webpage failing 3 checks "
+                                          "in a row is skipped for a while. Defaults to 2",
+                        type=int, default=2, metavar='N')
+    parser.add_argument('--reload', help="Seconds between checking the config file for changes. Added, removed and "
+                                         "changed webpages are applied without restarting. 0 disables it. Defaults to "
+                                         "10", type=float, default=10, metavar='SECONDS')
+    parser.add_argument('--samples', help="The number of downloads (the 3rd column of the config seconds apart) from "
+                                          "which the changing parts of a webpage, like dates, counters and tokens, "
+                                          f"are learned. Defaults to {learner.SAMPLES}",
+                        type=int, default=learner.SAMPLES, metavar='N')
+    parser.add_argument('--metrics-port', help="Serve the timings and counters of the checks (Prometheus' text "
+                                               "format) at http://127.0.0.1:PORT/metrics", type=int, metavar='PORT')
+    parser.add_argument('--metrics-json', help="Write a json summary of the timings and counters to this file every "
+                                               "minute", metavar='filename')
+    parser.add_argument('--workers', help="Check the webpages in N processes instead of one, for very long lists of "
+                                          "webpages. Every webpage always goes to the same process, which keeps its "
+                                          "own <store>.shardK.db. --threads and --host-limit apply to each process",
+                        type=int, default=0, metavar='N')
+    parser.add_argument('--once', help="Check every webpage a single time, write a report and exit, eg: from cron. "
+                                       "The webpages are resumed from --store (defaults to snapshots.db), only the "
+                                       "new ones find their deltaChange. No Telegram alerts are sent. Exits with 1 "
+                                       "if any webpage could not be checked", action='store_true')
+    parser.add_argument('--report', help="With --once, write the report to this file instead of the standard output",
+                        default='-', metavar='filename')
+    parser.add_argument('--report-format', help="With --once, json: a single json document, ndjson: a json line per "
+                                                "webpage. Defaults to json", choices=['json', 'ndjson'],
+                        default='json')
+    return parser
+# ---------------------------------END--------------------------------
+
+
+def reload_Config():
+    """
+    Applies the changes of the config file to the running program: added rows are created and their deltaChange
+    is found in the background, removed rows are dropped and changed rows are re-created.
+    The webpages whose rows have not changed keep their state and schedule. The webpages still finding their
+    deltaChange (PENDING_Webpages) are compared with the rows too.
     :return: None
     """
     try:
-        with open('telegram_tokens.json') as tokens:
-            data = json.load(tokens)
-            CHAT_ID, TOKEN = str(data['chat_id']), str(data['bot_token'])
+        rows = config.read_Config(config_file)
     except FileNotFoundError:
-        CHAT_ID = ''
-        TOKEN = ''
+        logger.warning("Configuration file has been deleted, keeping the current webpages.")
+        return
+    webpages = dict(MASTER_Webpages)
+    webpages.update(PENDING_Webpages)
+    added, removed, changed = config.diff_Config(webpages, rows)
+    if not (added or removed or changed):
+        return
+    logger.info(f"Configuration file changed: {len(added)} added, {len(removed)} removed, {len(changed)} changed")
 
-    requests.get("https://api.telegram.org/bot" + TOKEN + "/sendMessage?chat_id=" + CHAT_ID + "&parse_mode=Markdown"
-                                                                                              "&text=" + message[:1000])
+    for webpage in removed + [webpage for webpage, _ in changed]:
+        SCHEDULER.remove(webpage)
+        if PENDING_Webpages.get(webpage.get_name()) is webpage:
+            del PENDING_Webpages[webpage.get_name()]
+        else:
+            del MASTER_Webpages[webpage.get_name()]
+        # A removed row is deleted from the store, a changed one is saved again under the same name
+        ENGINE.remove(webpage, forget=webpage.get_name() not in rows)
+    if POOL is not None:
+        for webpage in POOL.add_Rows(added + [row for _, row in changed]):
+            PENDING_Webpages[webpage.get_name()] = webpage
+        return
+    pending_baselines = []
+    for row in added + [row for _, row in changed]:
+        logger.info(f"Reading \"{row[0].strip()}\".")
+        new_class_instance, wait_time = config.create_Webpage(row, SETTINGS)
+        if new_class_instance.load_state():
+            MASTER_Webpages[new_class_instance.get_name()] = new_class_instance
+            SCHEDULER.schedule(new_class_instance)
+        else:
+            PENDING_Webpages[new_class_instance.get_name()] = new_class_instance
+            pending_baselines.append((new_class_instance, wait_time))
+    ENGINE.submit_Baselines(pending_baselines)
 
 
-# noinspection PyShadowingNames
-def time_parser(time: str) -> int:
+# ==================================================================================
+# ------------------------Single run (--once)------------------------
+def run_Once(args: argparse.Namespace, settings: config.Settings) -> int:
     """
-    Converts compound duration time to seconds
-    :param time: str of compound time
-    :return: int, seconds
+    Checks every webpage of the config file a single time and writes the report (see write_Report()).
+    The webpages saved in the store are resumed from it, the rest find their deltaChange (which is saved for the next
+    run) and are reported as 'baseline' without being checked.
+    :param args: the command line arguments
+    :param settings: config.Settings, with the store
+    :return: int, the exit code: 0, or 1 if any webpage could not be checked
     """
-    time_search = re.compile(r"(?:(\d+)h)? ?(?:(\d+)m)? ?(?:(\d+)s)?")
-    hour, minute, second = time_search.fullmatch(time).groups(default='0')
-    return int(hour) * 3600 + int(minute) * 60 + int(second)
+    logger = logging.getLogger("PHASE:Once")
+    started, started_at = perf_counter(), datetime.now()
+    try:
+        rows = config.read_Config(config_file)
+    except FileNotFoundError:
+        logger.critical(f"Configuration file {config_file} does not exists!")
+        return 1
+    checker.create_Session(pool_size=args.threads)
+    check_engine = engine.CheckEngine(workers=args.threads, per_host=args.host_limit, method=args.method, debug=True,
+                                      retry=False)
 
+    resumed, pending_baselines = [], []
+    for name, row in rows.items():
+        webpage, wait_time = config.create_Webpage(row, settings)
+        if webpage.load_state():
+            resumed.append(webpage)
+        else:
+            pending_baselines.append((webpage, wait_time))
+    logger.info(f"Checking {len(resumed)} webpage(s), finding deltaChange of {len(pending_baselines)} webpage(s)")
 
-def send_uptimealert():
+    found = set(check_engine.run_baselines(pending_baselines)) if pending_baselines else set()
+    results = check_engine.run_cycle(resumed)
+    check_engine.shutdown()
+    settings.store.close()
+
+    summary = metrics.REGISTRY.get_Summary()
+    sites = [site_Report(webpage, 'failed' if change_detected is None else 'changed' if change_detected else
+                         'unchanged', output, summary)
+             for webpage, change_detected, output in results]
+    sites += [site_Report(webpage, 'baseline' if webpage in found else 'failed', '', summary)
+              for webpage, _ in pending_baselines]
+    statuses = [site['status'] for site in sites]
+    report = {'started': started_at.isoformat(timespec='seconds'), 'seconds': round(perf_counter() - started, 3),
+              'method': args.method,
+              'summary': {status: statuses.count(status) for status in ['changed', 'unchanged', 'baseline', 'failed']},
+              'sites': sites}
+    write_Report(report, args.report, args.report_format)
+    if args.metrics_json:
+        metrics.write_Summary(args.metrics_json)
+    logger.info(f"Checked {len(results)} webpage(s) in {report['seconds']} seconds: {report['summary']}")
+    return 1 if 'failed' in statuses else 0
+
+
+def site_Report(webpage: checker.Webpage, status: str, output: str, summary: dict) -> dict:
     """
-    Sends uptime alert every 24hours
-    :return:
+    Returns the report of a webpage: its status, the diff (or summary) of the change and the seconds taken.
+    A webpage whose check logged an error (see 'webpage_errors_total') is reported as 'failed'.
+    :param webpage: Webpage
+    :param status: str, changed/unchanged/baseline/failed
+    :param output: str, the output of detect()
+    :param summary: dict, metrics.REGISTRY.get_Summary()
+    :return: dict
     """
-    alert_onTelegram("#UptimeStatus, The program is working 🤖👍")
+    name = webpage.get_name()
+    errors = sum(counter['value'] for counter in summary.get('webpage_errors_total', [])
+                 if counter['labels'].get('site') == name)
+    if errors and status == 'unchanged':
+        status = 'failed'
+    seconds = {}
+    for timing, metric in REPORT_TIMINGS.items():
+        values = [histogram['sum'] for histogram in summary.get(metric, []) if histogram['labels'].get('site') == name]
+        if values:
+            seconds[timing] = round(sum(values), 6)
+    return {'name': name, 'url': webpage.get_url(), 'status': status, 'diff': output or None, 'errors': errors,
+            'seconds': seconds}
 
 
-def get_item(iterable, index, default='', to_type=str):
+def write_Report(report: dict, file_name: str, report_format: str) -> None:
     """
-    Safely retrieve an item from a tuple. (tuple which is retrieved from CSV parser
-    :param iterable: the tuple or list
-    :param index: the index which you want
-    :param default: the value to be used if the said stuff is not found
-    :param to_type: the data type to convert that stuff to. will output default if ValueError occurs
-    :return: to_type or str
+    Writes the report of --once as a json document, or as ndjson: a json line per webpage
+    :param report: dict, from run_Once()
+    :param file_name: str, '-' for the standard output
+    :param report_format: str, json/ndjson
+    :return: None
     """
+    file = sys.stdout if file_name == '-' else open(file_name, 'w')
     try:
-        return_stuff = iterable[index].strip()
-        try:
-            return_stuff = to_type(return_stuff)
-        except ValueError:
-            return_stuff = str(return_stuff)
-    except IndexError:
-        return_stuff = default
-    return return_stuff
+        if report_format == 'ndjson':
+            for site in report['sites']:
+                file.write(json.dumps(site, ensure_ascii=False) + '\n')
+        else:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+            file.write('\n')
+    finally:
+        if file is not sys.stdout:
+            file.close()
 
 
 # ==================================================================================
-# ------------------------Command line parsers------------------------
-parser = argparse.ArgumentParser(description="This program checks from the supplied list of webpages, that if anyone "
-                                             "of those have changed and notifies about it.")
-parser.add_argument('-w', '--wait', help="The duration for which the program should wait before checking the page "
-                                         "again. Defaults to 2 hours. Use compound duration say 2h", metavar='XhYmZ')
-parser.add_argument('-c', '--config', help="use the specified file instead of default config.csv", metavar='filename')
-parser.add_argument('-d', '--debug', help="Increase logging level of program to debug. AKA increases verbosity of "
-                                          "program", action='store_true')
-parser.add_argument('-t', '--time', help="time to send a daily alert notifying that the program is working. Enter "
-                                         "time in HH:MM 24 hour format.\nOtherwise uses program's default time of "
-                                         "14:00 IST", metavar='HH:MM')
-args = parser.parse_args()
-# ---------------------------------END--------------------------------
-# --debug
-if args.debug:
-    level = logging.DEBUG
-else:
-    level = logging.INFO
-
-logging.basicConfig(format='%(asctime)s - %(levelname)-8s: %(funcName)16s() : |%(name)16.15s| - %(message)s',
-                    datefmt='%d/%m/%y %H:%M:%S', level=level)
-logger = logging.getLogger("PHASE:Startup")
-
-logger.debug("Running logging in DEBUG mode.")
-
-# --config
-config_file = 'config.csv'
-if args.config:
-    logger.info(f"Using custom file: {args.config}")
-    config_file = args.config
-else:
-    logger.info("Using default configuration file")
-
-# --wait
-SLEEP_TIME = 7200  # 2 hours
-if args.wait:
-    SLEEP_TIME = time_parser(args.wait)
-
-logger.info(f"SLEEP_TIME set to {SLEEP_TIME} seconds ({SLEEP_TIME / 3600:.2f} hrs)")
-
-# --time
-ALERT_TIME = time(hour=14)
-
-if args.time:
-    ALERT_TIME = datetime.strptime(args.time, '%H:%M').time()
-logger.info(f"Program will alert the user about program uptime on: {ALERT_TIME.strftime('%I:%M %p')}\n\n")
-
-# Sending alert:
-alert_onTelegram("Program started. 🤖")
-# ==================================================================================
+def main(argv: list = None) -> int:
+    """
+    Runs the program with the command line arguments: checks the webpages forever, or a single time with --once
+    :param argv: list of str, defaults to sys.argv
+    :return: int, the exit code
+    """
+    global args, logger, config_file, SETTINGS, POOL, NOTIFIER, ENGINE, MASTER_Webpages, PENDING_Webpages
+    global SCHEDULER
+    args = create_Parser().parse_args(argv)
+    # --debug
+    if args.debug:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
 
-# Reading from csv file.
-# For now the csv file has 2 main columns: name (of the website), url
-"""Pseudocode:
-    * have a master list
-    * while reading from csv, create and instantiate the Webpage class object
-    * If the file does not exist, create one and exit
-"""
-# TODO: if the file does not exist, prompt the user to create one from within the program
-logger = logging.getLogger("PHASE:Pre-LOOP")
-MASTER_WebpageList = []
-logger.info("Loading URLs from config file... (Expect some delay)")
-try:
-    with open(config_file, 'r') as csv_file:
-        csv_reader = csv.reader(csv_file)
-        for row in csv_reader:
-            logger.info(f"Reading \"{row[0]}\".")
-
-            new_class_instance = checker.Webpage(row[0].strip(), row[1].strip())
-
-            # Set verify SSL value, incase requests returns SSLError
-            new_class_instance.set_verifySSL(get_item(row, 3))
-            try:
-                new_class_instance.find_DeltaChange(int(row[2]))
-            except (ValueError, IndexError):
-                new_class_instance.find_DeltaChange()
-
-            MASTER_WebpageList.append(new_class_instance)
-    logger.info(f"Loading complete! Added: {len(MASTER_WebpageList)} webpage(s)\n\n")
-except FileNotFoundError:
-    logger.critical("Configuration file does not exists! Creating a default one\n\n")
-    file = open('config.csv', 'w')
-    file.close()
-
-# =======================================
-
-# The loop
-logger = logging.getLogger("PHASE:Loop")
-sleep(0.5)
-for i in range(5, -1, -1):
-    print(f"Starting main loop in {i}...", end='\r')
-    sleep(1)
-    print("                          ", end='\r')
-print()
-logger.info("Started Main loop...")
-target_time = timedelta(hours=ALERT_TIME.hour, minutes=ALERT_TIME.minute)
-"""Pseudocode:
-    * iterate through MASTER list
-    * use the detect
-    * if change_detected is True, then notify on telegram
-    * check if time is within 20 minutes of ALERT_TIME, then send a message that the program is working
-"""
-while True:
-    sleep(SLEEP_TIME)
-    # iterating through master list
-    for webpage in MASTER_WebpageList:
-        # use the detect
-        change_detected, output = webpage.detect(1, debug=True)
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%d/%m/%y %H:%M:%S', level=level)
+    logger = logging.getLogger("PHASE:Startup")
 
-        # If change is detected
-        if change_detected:
-            message = f"""A change on *{webpage.get_name()}* has been detected.\n\nHere is the change:\n`{output}`"""
-            alert_onTelegram(message)
-
-    # Checking every 2hours if the alert_time is near.
-    current_time = datetime.now()
-    current_time = timedelta(hours=current_time.hour, minutes=current_time.minute, seconds=current_time.second)
-    duration = target_time - current_time
-    if duration.seconds <= SLEEP_TIME:  # Means the alert time is well within 2hr range
-        logger.debug(
-            f"Starting UptimeThread with wait duration of: {duration.seconds / 3600:.02f} hours or {duration.seconds / 60:.02f} minutes")
-        Timer(duration.seconds, send_uptimealert).start()
+    logger.debug("Running logging in DEBUG mode.")
+
+    # --config
+    config_file = 'config.csv'
+    if args.config:
+        logger.info(f"Using custom file: {args.config}")
+        config_file = args.config
+    else:
+        logger.info("Using default configuration file")
+
+    # --wait
+    SLEEP_TIME = 7200  # 2 hours
+    if args.wait:
+        SLEEP_TIME = config.time_parser(args.wait)
+
+    # --once, the baselines are kept in a store for the next run
+    if args.once:
+        if args.workers:
+            logger.warning("--workers is not used with --once, checking in this process")
+        args.workers = 0
+        if not args.store:
+            args.store = ONCE_STORE
+    else:
+        logger.info(f"SLEEP_TIME set to {SLEEP_TIME} seconds ({SLEEP_TIME / 3600:.2f} hrs)")
+
+    # --time
+    ALERT_TIME = time(hour=14)
+
+    if args.time:
+        ALERT_TIME = datetime.strptime(args.time, '%H:%M').time()
+    if not args.once:
+        logger.info(f"Program will alert the user about program uptime on: {ALERT_TIME.strftime('%I:%M %p')}\n\n")
+
+    # --store
+    STORE = None
+    if args.store and args.workers:
+        logger.info(f"Using a snapshot store per worker: {workers.shard_Store(args.store, 0)}... "
+                    f"(keeping {args.history} snapshots per webpage)")
+    elif args.store:
+        STORE = store.SnapshotStore(args.store, history_limit=args.history, history_days=args.history_days)
+        logger.info(f"Using snapshot store: {args.store} (keeping {args.history} snapshots per webpage)")
+
+    FETCH_POLICY = checker.FetchPolicy(connect_timeout=min(10.0, args.timeout), read_timeout=args.timeout,
+                                       max_attempts=args.retries + 1)
+    SETTINGS = config.Settings(SLEEP_TIME, adaptive=args.adaptive, max_size=args.max_size, deadline=args.deadline,
+                               stream=args.stream, policy=FETCH_POLICY, store=STORE, samples=args.samples,
+                               text_only=args.method == 4)
+    if args.once:
+        return run_Once(args, SETTINGS)
+
+    # --workers, started before the other threads of this process as the workers are forked from it
+    POOL = None
+    if args.workers:
+        POOL = workers.WorkerPool(args.workers, SETTINGS, {
+            'threads': args.threads, 'host_limit': args.host_limit, 'method': args.method, 'store': args.store,
+            'history': args.history, 'history_days': args.history_days, 'log_format': LOG_FORMAT, 'log_level': level})
+        atexit.register(POOL.shutdown)
+
+    # --metrics-port
+    if args.metrics_port:
+        metrics.start_Server(args.metrics_port)
+
+    # Sending alert:
+    NOTIFIER = notifier.TelegramNotifier('telegram_tokens.json')
+    atexit.register(NOTIFIER.stop)
+    alert_onTelegram("Program started. 🤖")
+    # ==================================================================================
+
+    # Reading from csv file.
+    # For now the csv file has 2 main columns: name (of the website), url
+    """Pseudocode:
+        * have a master list
+        * while reading from csv, create and instantiate the Webpage class object
+        * If the file does not exist, create one and exit
+    """
+    # TODO: if the file does not exist, prompt the user to create one from within the program
+    logger = logging.getLogger("PHASE:Pre-LOOP")
+    # name -> the webpage being checked
+    MASTER_Webpages = {}
+    # name -> the webpage (of the current config row) which is still finding its deltaChange, or waiting to retry it
+    PENDING_Webpages = {}
+    if POOL is not None:
+        ENGINE = POOL
+    else:
+        checker.create_Session(pool_size=args.threads)
+        ENGINE = engine.CheckEngine(workers=args.threads, per_host=args.host_limit, method=args.method, debug=True)
+    logger.info(f"Checking {args.threads} webpage(s) at a time, {args.host_limit} per website")
+    logger.info("Loading URLs from config file... (Expect some delay)")
+    CONFIG_WATCHER = config.ConfigWatcher(config_file)
+    try:
+        rows = config.read_Config(config_file)
+        if POOL is not None:
+            # The workers create the webpages, resume them from their stores or find their deltaChange
+            logger.info(f"Sending {len(rows)} webpage(s) to {args.workers} worker(s)...")
+            POOL.add_Rows(list(rows.values()))
+            for webpage, found in POOL.wait_Added():
+                if found:
+                    MASTER_Webpages[webpage.get_name()] = webpage
+                elif found is not None:
+                    PENDING_Webpages[webpage.get_name()] = webpage
+        else:
+            pending_baselines = []
+            for name, row in rows.items():
+                logger.info(f"Reading \"{name}\".")
+                new_class_instance, wait_time = config.create_Webpage(row, SETTINGS)
+
+                # Resume from the snapshot store if this webpage (and its config row) was checked before
+                if new_class_instance.load_state():
+                    logger.info(f"Resumed \"{name}\" from snapshot store.")
+                    MASTER_Webpages[name] = new_class_instance
+                else:
+                    pending_baselines.append((new_class_instance, wait_time))
+
+            # Finding the deltaChange of the rest of the webpages, all at once
+            if pending_baselines:
+                logger.info(f"Finding deltaChange of {len(pending_baselines)} webpage(s)...")
+                found = set(ENGINE.run_baselines(pending_baselines))
+                for webpage, _ in pending_baselines:
+                    if webpage in found:
+                        MASTER_Webpages[webpage.get_name()] = webpage
+                    else:
+                        PENDING_Webpages[webpage.get_name()] = webpage
+        logger.info(f"Loading complete! Added: {len(MASTER_Webpages)} webpage(s)" +
+                    (f", retrying {len(PENDING_Webpages)} later\n\n" if PENDING_Webpages else "\n\n"))
+    except FileNotFoundError:
+        logger.critical("Configuration file does not exists! Creating a default one\n\n")
+        file = open('config.csv', 'w')
+        file.close()
+
+    # =======================================
+
+    # The loop
+    logger = logging.getLogger("PHASE:Loop")
+    sleep(0.5)
+    for i in range(5, -1, -1):
+        print(f"Starting main loop in {i}...", end='\r')
+        sleep(1)
+        print("                          ", end='\r')
+    print()
+    logger.info("Started Main loop...")
+    SCHEDULER = scheduler.Scheduler()
+    for webpage in MASTER_Webpages.values():
+        SCHEDULER.schedule(webpage)
+    for webpage in PENDING_Webpages.values():
+        SCHEDULER.schedule(webpage, delay=webpage.get_retryDelay())
+    """Pseudocode:
+        * start checking the webpages of the MASTER list which are due, concurrently
+        * use the detect
+        * if change_detected is True, then notify on telegram
+        * schedule the checked webpages again after their interval
+        * every --reload seconds, apply the changes of the config file
+        * every FLUSH_TIME, write the metrics and checkpoint the store
+        * every day at ALERT_TIME, send a message that the program is working
+    All of it runs in this thread, see scheduler.EventLoop
+    """
+    LOOP = scheduler.EventLoop(ENGINE, SCHEDULER, handle_Results)
+    LOOP.add_DailyJob('uptime', send_uptimealert, ALERT_TIME)
+    if args.reload:
+        LOOP.add_Job('reload', lambda: CONFIG_WATCHER.has_Changed() and reload_Config(), args.reload)
+    LOOP.add_Job('flush', lambda: flush_State(STORE), FLUSH_TIME)
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: LOOP.stop())
+    LOOP.run()
+
+    # Stopping: the running checks are let to finish, then the state is written. The alerts are sent and the
+    # workers are stopped on exit (atexit)
+    if POOL is None:
+        ENGINE.shutdown(wait_for_checks=True)
+    flush_State(STORE)
+    if STORE is not None:
+        STORE.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
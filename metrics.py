@@ -0,0 +1,240 @@
+#  Copyright (c) 2020. RoguedBear
+import functools
+import json
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Registry:
+    """
+    Keeps the counters and latency histograms of the program, labelled by site etc.
+
+    -----------
+    Methods:
+      - increment()        : adds to a counter
+      - observe()          : adds a value (eg: seconds taken) to a histogram
+      - time()             : context manager which observes the seconds taken by its block
+      - get_Snapshot()     : returns a copy of the metrics, to be sent to another process
+      - set_Remote()       : keeps the snapshot of another process, added to the metrics of this one
+      - render_Prometheus(): returns all the metrics in Prometheus' text format
+      - get_Summary()      : returns all the metrics as a dict, to be saved as json
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        # The latest snapshot of every other process (eg: --workers), by its name
+        self.remotes = {}
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        """
+        Adds the amount to a counter
+        :param name: str, metric name
+        :param amount: float
+        :param labels: the labels of the counter, eg: site='name'
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Adds a value to a histogram
+        :param name: str, metric name
+        :param value: float, eg: seconds taken
+        :param labels: the labels of the histogram, eg: site='name'
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect_left(self.buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """
+        Observes the seconds taken by the with block, even if it raises
+        :param name: str, metric name
+        :param labels: the labels of the histogram
+        """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    def get_Snapshot(self) -> dict:
+        """
+        Returns a copy of the counters and histograms of this process, without those of the remotes
+        :return: dict, {'counters': {...}, 'histograms': {...}}
+        """
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'histograms': {key: dict(value, buckets=list(value['buckets']))
+                                   for key, value in self.histograms.items()}}
+
+    def set_Remote(self, source: str, snapshot: dict) -> None:
+        """
+        Keeps the snapshot of another process, replacing its previous one. Its metrics are added to those of this
+        process when they are rendered
+        :param source: str, the name of the process, eg: worker-0
+        :param snapshot: dict, from its get_Snapshot()
+        :return: None
+        """
+        with self.lock:
+            self.remotes[source] = snapshot
+
+    def get_Merged(self):
+        """
+        Returns copies of the counters and histograms of this process, with those of the remotes added
+        :return: tuple(counters, histograms)
+        """
+        snapshot = self.get_Snapshot()
+        counters, histograms = snapshot['counters'], snapshot['histograms']
+        with self.lock:
+            remotes = list(self.remotes.values())
+        for remote in remotes:
+            for key, value in remote['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for key, value in remote['histograms'].items():
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histograms[key] = dict(value, buckets=list(value['buckets']))
+                    continue
+                histogram['buckets'] = [mine + theirs for mine, theirs in zip(histogram['buckets'], value['buckets'])]
+                histogram['sum'] += value['sum']
+                histogram['count'] += value['count']
+        return counters, histograms
+
+    def render_Prometheus(self) -> str:
+        """
+        Returns all the metrics in Prometheus' text exposition format
+        :return: str
+        """
+        lines = []
+        counters, histograms = self.get_Merged()
+        counters, histograms = sorted(counters.items()), sorted(histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_Labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_Labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_Labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_Labels(labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def get_Summary(self) -> dict:
+        """
+        Returns all the metrics as a dict: counters as values, histograms as count/sum/average
+        eg: {'webpage_changes_total': [{'labels': {'site': 'x'}, 'value': 2}], ...}
+        :return: dict
+        """
+        summary = {}
+        counters, histograms = self.get_Merged()
+        for (name, labels), value in sorted(counters.items()):
+            summary.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            summary.setdefault(name, []).append({
+                'labels': dict(labels), 'count': histogram['count'], 'sum': round(histogram['sum'], 6),
+                'average': round(histogram['sum'] / histogram['count'], 6) if histogram['count'] else 0})
+        return summary
+
+
+# The registry used by the whole program
+REGISTRY = Registry()
+logger = logging.getLogger("Metrics")
+
+
+def timed(name: str, **labels):
+    """
+    Decorator for the Webpage methods, observes the seconds they take in a histogram labelled with the site
+    (the webpage's name).
+    eg: @timed('webpage_diff_seconds', method='1')
+    :param name: str, metric name
+    :param labels: more labels of the histogram
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with REGISTRY.time(name, site=self.get_name(), **labels):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def format_Labels(labels: tuple) -> str:
+    """
+    Formats the labels the Prometheus way. eg: (('site', 'x'),) -> '{site="x"}'
+    :param labels: tuple of (name, value)
+    :return: str
+    """
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves REGISTRY at /metrics
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render_Prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_Server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Serves the metrics at http://host:port/metrics from a background thread
+    :param port: int
+    :param host: str, defaults to only this computer
+    :return: the server
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
+
+
+def write_Summary(file_name: str) -> None:
+    """
+    Writes REGISTRY's summary as json
+    :param file_name: str
+    :return: None
+    """
+    with open(file_name, 'w') as file:
+        json.dump(REGISTRY.get_Summary(), file, indent=2)
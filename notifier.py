@@ -0,0 +1,186 @@
+#  Copyright (c) 2020. RoguedBear
+import json
+import logging
+import queue
+import random
+import threading
+from collections import deque
+from time import monotonic, sleep
+from typing import List
+
+import requests
+
+import metrics
+
+# Telegram's limits: 4096 characters per message, about 1 message per second and 20 per minute in a chat
+MESSAGE_LIMIT = 4096
+ALERT_LIMIT = 1000
+
+
+class TelegramNotifier:
+    """
+    Sends the alerts to telegram from a background thread, so that checking the webpages never waits for telegram.
+    tokens_file : str, the json file with the chat_id and bot_token (see telegram_tokens.json)
+    min_interval: float, the minimum seconds between two messages
+    per_minute  : int, the maximum number of messages in a minute
+    max_retries : int, the number of times a failed message is retried (with exponential backoff) before dropping it
+
+    -----------
+    Methods:
+      - send() : queues a message to be sent on its own, eg: the startup message
+      - add()  : adds an alert to the current batch
+      - flush(): queues the current batch, joining the alerts into as few messages as possible
+      - stop() : sends the queued messages and stops the thread
+    """
+
+    def __init__(self, tokens_file: str = 'telegram_tokens.json', min_interval: float = 1.0, per_minute: int = 20,
+                 max_retries: int = 5):
+        self.logger = logging.getLogger("TelegramNotifier")
+        self.chat_id, self.token = load_Tokens(tokens_file)
+        if not self.token:
+            self.logger.warning(f"No telegram tokens in {tokens_file}, the alerts will only be logged.")
+        self.min_interval = min_interval
+        self.per_minute = per_minute
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.batch = []
+        self.batch_lock = threading.Lock()
+        self._sent_times = deque()
+        self.thread = threading.Thread(target=self.run, name='notifier', daemon=True)
+        self.thread.start()
+
+    def send(self, message: str) -> None:
+        """
+        Queues a message to be sent on its own
+        :param message: str
+        :return: None
+        """
+        self.queue.put(message[:MESSAGE_LIMIT])
+
+    def add(self, alert: str) -> None:
+        """
+        Adds an alert to the current batch, it is sent on the next flush()
+        :param alert: str, truncated to ALERT_LIMIT characters
+        :return: None
+        """
+        with self.batch_lock:
+            self.batch.append(alert[:ALERT_LIMIT])
+
+    def flush(self) -> None:
+        """
+        Queues the alerts of the current batch, joined into as few messages as possible
+        :return: None
+        """
+        with self.batch_lock:
+            alerts, self.batch = self.batch, []
+        for message in join_Alerts(alerts):
+            self.queue.put(message)
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Flushes the batch, waits (upto timeout) for the queued messages to be sent and stops the thread
+        :param timeout: float, seconds
+        :return: None
+        """
+        self.flush()
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self) -> None:
+        """
+        The background thread: sends the queued messages one by one, within the rate limits
+        :return: None
+        """
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            self.wait_RateLimit()
+            with metrics.REGISTRY.time('telegram_send_seconds'):
+                sent = self.post(message)
+            metrics.REGISTRY.increment('telegram_messages_total',
+                                       status='sent' if sent else 'dropped' if self.token else 'logged')
+
+    def wait_RateLimit(self) -> None:
+        """
+        Sleeps till another message can be sent without crossing min_interval or per_minute
+        :return: None
+        """
+        now = monotonic()
+        while self._sent_times and now - self._sent_times[0] > 60:
+            self._sent_times.popleft()
+        wait_time = 0
+        if self._sent_times:
+            wait_time = self._sent_times[-1] + self.min_interval - now
+        if len(self._sent_times) >= self.per_minute:
+            wait_time = max(wait_time, self._sent_times[0] + 60 - now)
+        if wait_time > 0:
+            sleep(wait_time)
+        self._sent_times.append(monotonic())
+
+    def post(self, message: str) -> bool:
+        """
+        Sends a message, retrying with exponential backoff. Never raises.
+        :param message: str
+        :return: bool, whether it was sent
+        """
+        if not self.token:
+            self.logger.info(f"Alert:\n{message}")
+            return False
+
+        data = {'chat_id': self.chat_id, 'parse_mode': 'Markdown', 'text': message}
+        for attempt in range(self.max_retries + 1):
+            retry_after = min(60, 2 ** attempt) * random.uniform(0.5, 1)
+            try:
+                response = self.session.post(f"https://api.telegram.org/bot{self.token}/sendMessage", data=data,
+                                             timeout=30)
+                if response.ok:
+                    return True
+                if response.status_code == 429:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', retry_after)
+                elif response.status_code == 400 and 'parse_mode' in data:
+                    # Most likely a truncated alert broke the markdown, sending it as plain text
+                    self.logger.warning(f"Telegram couldn't parse the message, resending as plain text: "
+                                        f"{response.text}")
+                    del data['parse_mode']
+                    continue
+                elif response.status_code < 500:
+                    self.logger.error(f"Telegram rejected the message ({response.status_code}): {response.text}")
+                    return False
+                self.logger.warning(f"Telegram replied {response.status_code}, retrying in {retry_after:.0f}s")
+            except (requests.exceptions.RequestException, ValueError) as error:
+                self.logger.warning(f"Sending the message failed, retrying in {retry_after:.0f}s: {error!r}")
+            sleep(retry_after)
+        self.logger.error(f"Dropping the message after {self.max_retries} retries:\n{message}")
+        return False
+
+
+def load_Tokens(tokens_file: str):
+    """
+    Loads the chat id and the bot token
+    :param tokens_file: str, the json file
+    :return: tuple(chat_id, bot_token), empty strings if the file does not exist
+    """
+    try:
+        with open(tokens_file) as tokens:
+            data = json.load(tokens)
+            return str(data['chat_id']), str(data['bot_token'])
+    except FileNotFoundError:
+        return '', ''
+
+
+def join_Alerts(alerts: List[str]) -> List[str]:
+    """
+    Joins the alerts into messages of at most MESSAGE_LIMIT characters
+    :param alerts: list of str
+    :return: list of str
+    """
+    messages = []
+    for alert in alerts:
+        if messages and len(messages[-1]) + 2 + len(alert) <= MESSAGE_LIMIT:
+            messages[-1] += '\n\n' + alert
+        else:
+            messages.append(alert)
+    return messages
@@ -0,0 +1,304 @@
+#  Copyright (c) 2020. RoguedBear
+import heapq
+import itertools
+import logging
+import random
+import threading
+from datetime import datetime, time, timedelta
+from time import monotonic
+from typing import Callable, List, Optional, Union
+
+import checker
+
+
+class Scheduler:
+    """
+    Keeps the webpages in a heap ordered by the time they are next due to be checked, so that every webpage
+    can be checked on its own interval (Webpage.get_interval()).
+    jitter: float, every interval is stretched or shrunk by up to this fraction (0.1 = ±10%), so that the webpages
+            don't all get checked in the same burst. The fraction is the same for the webpages of the same fetch key
+            (Webpage.get_fetchKey()), so that they come due together and share their download
+
+    -----------
+    Methods:
+      - schedule()       : schedules a webpage to be checked after its interval
+      - get_Jitter()     : returns the fraction an interval is stretched or shrunk by
+      - pop_due()        : removes and returns the webpages which are due to be checked, and the ones of the same
+                           fetch key which would be due within their jitter
+      - time_until_next(): seconds until the next webpage is due
+      - remove()         : stops scheduling a webpage
+    """
+
+    def __init__(self, jitter: float = 0.1):
+        self.jitter = jitter
+        self._heap = []
+        self._counter = itertools.count()
+        # webpage -> the counter of its current entry in the heap, older entries of a webpage are skipped
+        self._entries = {}
+        # fetch key -> {webpage: (due time, seconds it can be checked early)}, of the scheduled webpages
+        self._groups = {}
+        self._keys = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("Scheduler")
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
+
+    def schedule(self, webpage: checker.Webpage, delay: float = None) -> None:
+        """
+        Schedules the webpage to be checked after delay (with jitter). Replaces its earlier schedule, if any
+        :param webpage: Webpage
+        :param delay: float, seconds. Defaults to the webpage's interval
+        :return: None
+        """
+        if delay is None:
+            delay = webpage.get_interval()
+        key = webpage.get_fetchKey()
+        delay *= 1 + self.get_Jitter(key)
+        with self.lock:
+            self.drop_Entry(webpage)
+            count = next(self._counter)
+            due = monotonic() + delay
+            self._entries[webpage] = count
+            if key is not None:
+                self._keys[webpage] = key
+                self._groups.setdefault(key, {})[webpage] = (due, self.jitter * delay)
+            heapq.heappush(self._heap, (due, count, webpage))
+        webpage.logger.debug(f"Next check in {delay / 60:.2f} minutes")
+
+    def get_Jitter(self, key: Optional[tuple]) -> float:
+        """
+        Returns the fraction an interval is stretched or shrunk by: always the same for a fetch key, random without one
+        :param key: tuple, Webpage.get_fetchKey(). None if it isn't known yet
+        :return: float, between -jitter and jitter
+        """
+        if key is None:
+            return random.uniform(-self.jitter, self.jitter)
+        return random.Random(repr(key)).uniform(-self.jitter, self.jitter)
+
+    def drop_Entry(self, webpage: checker.Webpage) -> None:
+        """
+        Forgets the webpage's schedule, its entry in the heap is skipped when it reaches the top. Needs the lock
+        :param webpage: Webpage
+        :return: None
+        """
+        self._entries.pop(webpage, None)
+        key = self._keys.pop(webpage, None)
+        if key is not None:
+            group = self._groups[key]
+            del group[webpage]
+            if not group:
+                del self._groups[key]
+
+    def pop_due(self) -> List[checker.Webpage]:
+        """
+        Removes the webpages which are due to be checked from the heap. The webpages of the same fetch key as a due
+        one are removed with it if they'd be due within their jitter, so they're checked together with one download
+        (see CheckEngine.submit()) instead of each downloading it a little later
+        :return: list of Webpage
+        """
+        now = monotonic()
+        due = []
+        keys = set()
+        with self.lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, count, webpage = heapq.heappop(self._heap)
+                if self._entries.get(webpage) == count:
+                    if webpage in self._keys:
+                        keys.add(self._keys[webpage])
+                    self.drop_Entry(webpage)
+                    due.append(webpage)
+            for key in keys:
+                for webpage, (time_due, early) in list(self._groups.get(key, {}).items()):
+                    if time_due - early <= now:
+                        self.drop_Entry(webpage)
+                        due.append(webpage)
+        return due
+
+    def time_until_next(self) -> Optional[float]:
+        """
+        Returns the seconds until the next webpage is due, 0 if one already is
+        :return: float, None if nothing is scheduled
+        """
+        with self.lock:
+            # Dropping the replaced/removed entries from the top of the heap
+            while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - monotonic())
+
+    def remove(self, webpage: checker.Webpage) -> None:
+        """
+        Stops scheduling the webpage. Its entry is dropped from the heap when it reaches the top
+        :param webpage: Webpage
+        :return: None
+        """
+        with self.lock:
+            self.drop_Entry(webpage)
+
+
+class EventLoop:
+    """
+    Runs all the timed work of the program from a single thread: submits the webpages to the check engine as they
+    become due, hands over the results of the finished checks, and runs the recurring jobs (eg: the daily uptime
+    alert, config reloads, flushes) on time. It sleeps till whichever of these comes first.
+    A job is known by its name, so adding it again replaces it instead of running it twice.
+    check_engine: engine.CheckEngine or workers.WorkerPool
+    scheduler   : Scheduler, of the webpages
+    on_results  : function, called with the list of (webpage, change_detected, output) of every batch of finished
+                  checks. It is called (with an empty list) on every wakeup, eg: to pick up new webpages
+
+    -----------
+    Methods:
+      - add_Job()     : runs a function after a delay, again and again
+      - add_DailyJob(): runs a function every day at a time of the wall clock
+      - remove_Job()  : stops running a job
+      - run()         : runs the loop in the calling thread till stop()
+      - stop()        : makes run() return, can be called from any thread or a signal handler
+    """
+
+    # The longest the loop sleeps for, even if there is nothing to do
+    MAX_WAIT = 3600
+    # The longest a daily job waits before comparing the wall clock with its time again, see add_DailyJob()
+    WALL_CLOCK_CHECK = 300
+
+    def __init__(self, check_engine, scheduler: Scheduler, on_results: Callable[[list], None]):
+        self.check_engine = check_engine
+        self.scheduler = scheduler
+        self.on_results = on_results
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("EventLoop")
+
+    def add_Job(self, name: str, function: Callable[[], None], delay: Union[float, Callable[[], float]]) -> None:
+        """
+        Runs function after delay seconds, and again delay seconds after every run. Replaces the job of the same name
+        :param name: str
+        :param function: function without arguments
+        :param delay: float, seconds, or a function returning the seconds till the next run (eg: till a time of day)
+        :return: None
+        """
+        with self.lock:
+            count = next(self._counter)
+            self._jobs[name] = (count, function, delay)
+            heapq.heappush(self._heap, (monotonic() + get_Delay(delay), count, name))
+        self.check_engine.wake()
+
+    def add_DailyJob(self, name: str, function: Callable[[], None], at: time) -> None:
+        """
+        Runs function every day when the wall clock shows the time at. The loop keeps time with monotonic(), which
+        doesn't follow the wall clock when it is set (NTP, daylight saving) or while the machine is suspended, so the
+        job wakes up at least every WALL_CLOCK_CHECK seconds and only runs once the wall clock has reached its time.
+        Replaces the job of the same name
+        :param name: str
+        :param function: function without arguments
+        :param at: datetime.time
+        :return: None
+        """
+        next_run = [next_Time(at)]
+
+        def run_Daily():
+            now = datetime.now()
+            if now < next_run[0]:
+                return
+            next_run[0] = next_Time(at, now)
+            function()
+
+        def get_DailyDelay():
+            return min(self.WALL_CLOCK_CHECK, max(0.0, (next_run[0] - datetime.now()).total_seconds()))
+
+        self.add_Job(name, run_Daily, get_DailyDelay)
+
+    def remove_Job(self, name: str) -> None:
+        """
+        Stops running the job. Its entry is dropped from the heap when it reaches the top
+        :param name: str
+        :return: None
+        """
+        with self.lock:
+            self._jobs.pop(name, None)
+
+    def run_DueJobs(self) -> Optional[float]:
+        """
+        Runs the jobs which are due, and schedules their next run. A failing job is logged and runs again next time.
+        Every job runs at most once per call, even if it is due again right away
+        :return: float, the seconds till the next job, None if there is none
+        """
+        ran = set()
+        while True:
+            with self.lock:
+                # Dropping the replaced/removed entries from the top of the heap
+                while self._heap and self._jobs.get(self._heap[0][2], (None,))[0] != self._heap[0][1]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    return None
+                due, _, name = self._heap[0]
+                if due > monotonic() or name in ran:
+                    return max(0.0, due - monotonic())
+                ran.add(name)
+                heapq.heappop(self._heap)
+                count, function, delay = self._jobs[name]
+            try:
+                function()
+            except Exception as error:
+                self.logger.error(f"Job \"{name}\" failed: {error!r}")
+            with self.lock:
+                if self._jobs.get(name, (None,))[0] == count:
+                    heapq.heappush(self._heap, (monotonic() + get_Delay(delay), count, name))
+
+    def run(self) -> None:
+        """
+        Runs the loop till stop() is called
+        :return: None
+
+        # Pseudocode:
+        * submit the webpages which are due
+        * run the jobs which are due
+        * sleep till a check finishes, the next webpage or job is due, or stop()
+        * hand over the finished checks
+        """
+        while not self._stopping.is_set():
+            self.check_engine.submit(self.scheduler.pop_due())
+            wait_time = self.MAX_WAIT
+            for time_until in (self.run_DueJobs(), self.scheduler.time_until_next()):
+                if time_until is not None:
+                    wait_time = min(wait_time, time_until)
+            if self._stopping.is_set():
+                break
+            self.on_results(self.check_engine.collect(timeout=max(0.0, wait_time)))
+        self.logger.info("Stopped")
+
+    def stop(self) -> None:
+        """
+        Makes run() return after what it is doing
+        :return: None
+        """
+        self._stopping.set()
+        self.check_engine.wake()
+
+
+def get_Delay(delay: Union[float, Callable[[], float]]) -> float:
+    """
+    :param delay: float, or a function returning it
+    :return: float, seconds
+    """
+    return delay() if callable(delay) else delay
+
+
+def next_Time(at: time, now: datetime = None) -> datetime:
+    """
+    Returns the next time the wall clock shows at, today or tomorrow
+    :param at: datetime.time
+    :param now: datetime, defaults to datetime.now()
+    :return: datetime
+    """
+    now = now or datetime.now()
+    target = datetime.combine(now.date(), at)
+    if target <= now:
+        target += timedelta(days=1)
+    return target
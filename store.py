@@ -0,0 +1,200 @@
+#  Copyright (c) 2020. RoguedBear
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+
+class SnapshotStore:
+    """
+    A single SQLite file which keeps the state of every webpage, instead of the <name>_old.html/_new.html files.
+    filename     : str, the database file
+    history_limit: int, the number of debug snapshots to keep per webpage (the oldest ones are deleted)
+    history_days : float, snapshots older than these many days are deleted. None keeps them by count only
+
+    -----------
+    Methods:
+      - save_body()  : saves a (compressed) html code of a webpage, eg: the 'old' one, with its chunk index
+      - load_body()  : loads it back
+      - has_body()   : whether a html code of a webpage is saved, without loading it
+      - load_chunks(): loads the chunk index saved with it
+      - add_history(): saves a timestamped snapshot (debug copies of a detected change) and applies the retention
+      - save_state() : saves the webpage's url, config row, comparison mode, fingerprint, deltaChange, ETag,
+                       Last-Modified and interval
+      - load_state() : loads them back as a dict
+      - delete()     : deletes everything saved of a webpage
+      - checkpoint() : writes the write-ahead log into the database file
+      - close()      : closes the database
+    """
+
+    def __init__(self, filename: str, history_limit: int = 10, history_days: float = None):
+        self.filename = filename
+        self.history_limit = history_limit
+        self.history_days = history_days
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("SnapshotStore")
+
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS sites (name TEXT PRIMARY KEY, url TEXT, "
+                                    "fingerprint TEXT, delta_change TEXT, etag TEXT, last_modified TEXT, "
+                                    "updated REAL)")
+            # Stores created before the config row/interval were saved
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sites)")]
+            if 'config' not in columns:
+                self.connection.execute("ALTER TABLE sites ADD COLUMN config TEXT")
+            if 'interval' not in columns:
+                self.connection.execute("ALTER TABLE sites ADD COLUMN interval REAL")
+            if 'mode' not in columns:
+                self.connection.execute("ALTER TABLE sites ADD COLUMN mode TEXT")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS bodies (name TEXT, kind TEXT, body BLOB, "
+                                    "PRIMARY KEY (name, kind))")
+            if 'chunks' not in [row[1] for row in self.connection.execute("PRAGMA table_info(bodies)")]:
+                self.connection.execute("ALTER TABLE bodies ADD COLUMN chunks TEXT")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                    "name TEXT, label TEXT, taken REAL, body BLOB)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS history_name ON history (name, id)")
+        self.logger.debug(f"Opened snapshot store: {filename}")
+
+    def save_body(self, name: str, kind: str, code: str, chunks: list = None) -> None:
+        """
+        Saves the html code of a webpage
+        :param name: str, the webpage's name
+        :param kind: str, old/new
+        :param code: str, html code
+        :param chunks: list, its chunk index (see chunks.chunk_Lines()), if any
+        :return: None
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO bodies (name, kind, body, chunks) VALUES (?, ?, ?, ?)",
+                                    (name, kind, compress(code), None if chunks is None else json.dumps(chunks)))
+
+    def load_body(self, name: str, kind: str) -> Optional[str]:
+        """
+        Loads the html code of a webpage
+        :param name: str, the webpage's name
+        :param kind: str, old/new
+        :return: str, or None if it was never saved
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM bodies WHERE name = ? AND kind = ?",
+                                          (name, kind)).fetchone()
+        return decompress(row[0]) if row else None
+
+    def has_body(self, name: str, kind: str) -> bool:
+        """
+        Returns whether the html code of a webpage is saved, without reading or decompressing it
+        :param name: str, the webpage's name
+        :param kind: str, old/new
+        :return: bool
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM bodies WHERE name = ? AND kind = ? LIMIT 1",
+                                          (name, kind)).fetchone()
+        return row is not None
+
+    def load_chunks(self, name: str, kind: str) -> Optional[list]:
+        """
+        Loads the chunk index saved along with the html code of a webpage
+        :param name: str, the webpage's name
+        :param kind: str, old/new
+        :return: list, or None if it was saved without one
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT chunks FROM bodies WHERE name = ? AND kind = ?",
+                                          (name, kind)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def add_history(self, name: str, label: str, code: str) -> None:
+        """
+        Saves a timestamped snapshot of a webpage, then deletes the snapshots which are not to be retained.
+        :param name: str, the webpage's name
+        :param label: str, what would have been the filename of the snapshot
+        :param code: str, html code
+        :return: None
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO history (name, label, taken, body) VALUES (?, ?, ?, ?)",
+                                    (name, label, now, compress(code)))
+            self.connection.execute("DELETE FROM history WHERE name = ? AND id NOT IN "
+                                    "(SELECT id FROM history WHERE name = ? ORDER BY id DESC LIMIT ?)",
+                                    (name, name, self.history_limit))
+            if self.history_days is not None:
+                self.connection.execute("DELETE FROM history WHERE taken < ?", (now - self.history_days * 86400,))
+
+    def save_state(self, name: str, url: str, fingerprint: str, delta_change: list, etag: str = None,
+                   last_modified: str = None, config: str = None, interval: float = None, mode: str = None) -> None:
+        """
+        Saves the state of a webpage, which is needed to resume checking it after a restart
+        :return: None
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO sites (name, url, fingerprint, delta_change, etag, "
+                                    "last_modified, updated, config, interval, mode) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (name, url, fingerprint, json.dumps(delta_change), etag, last_modified,
+                                     time.time(), config, interval, mode))
+
+    def load_state(self, name: str) -> Optional[dict]:
+        """
+        Loads the state of a webpage
+        :param name: str, the webpage's name
+        :return: dict with the same keys as save_state()'s arguments, or None if it was never saved
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT name, url, fingerprint, delta_change, etag, last_modified, "
+                                          "config, interval, mode FROM sites WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'url': row[1], 'fingerprint': row[2], 'delta_change': json.loads(row[3]),
+                'etag': row[4], 'last_modified': row[5], 'config': row[6], 'interval': row[7], 'mode': row[8]}
+
+    def delete(self, name: str) -> None:
+        """
+        Deletes the state, html codes and snapshots of a webpage, eg: when it is removed from the config file
+        :param name: str, the webpage's name
+        :return: None
+        """
+        with self.lock, self.connection:
+            for table in ['sites', 'bodies', 'history']:
+                self.connection.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+    def checkpoint(self) -> None:
+        """
+        Writes the changes kept in the write-ahead log into the database file, without waiting for the readers
+        :return: None
+        """
+        with self.lock:
+            self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        """
+        Closes the database
+        :return: None
+        """
+        with self.lock:
+            self.connection.close()
+
+
+def compress(code: str) -> bytes:
+    """
+    Compresses the html code to be saved in the database
+    :param code: str
+    :return: bytes
+    """
+    return zlib.compress(code.encode('utf-8', 'surrogatepass'))
+
+
+def decompress(data: bytes) -> str:
+    """
+    Decompresses the html code saved in the database
+    :param data: bytes
+    :return: str
+    """
+    return zlib.decompress(data).decode('utf-8', 'surrogatepass')
@@ -0,0 +1,6 @@
+#  Copyright (c) 2020. RoguedBear
+import os
+import sys
+
+# The modules of the program are at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
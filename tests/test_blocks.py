@@ -0,0 +1,65 @@
+#  Copyright (c) 2020. RoguedBear
+import blocks
+import checker
+
+PAGE = """<html><head><title>Shop</title><style>p { color: red }</style></head>
+<body>
+  <nav>Home | Deals</nav>
+  <div class="ad">Buy   now!</div>
+  <table id="results"><tr><td>Price:</td><td>₹499</td></tr></table>
+  <p id="stock">In <b>stock</b></p>
+  <script>var token = "a1b2c3";</script>
+</body></html>
+"""
+
+
+def test_extract_Blocks_keeps_only_the_visible_text():
+    assert blocks.extract_Blocks(PAGE) == ['Shop', 'Home | Deals', 'Buy now!', 'Price:', '₹499', 'In stock']
+    assert blocks.extract_Blocks('') == []
+
+
+def test_summarize_Changes_of_changed_added_and_removed_blocks():
+    old = ['Shop', 'Price: ₹499', 'Out of stock', 'Reviews']
+    new = ['Shop', 'Price: ₹449', 'Reviews', 'Free delivery till Sunday']
+    assert blocks.summarize_Changes(old, new) == ('1 changed, 1 added, 1 removed\n'
+                                                  '~ Price: [-₹499-] {+₹449+}\n'
+                                                  '+ Free delivery till Sunday\n'
+                                                  '- Out of stock\n')
+    assert blocks.summarize_Changes(old, old) == ''
+    assert blocks.summarize_Changes(['Shop', 'Sale'], ['Shop']) == '0 changed, 0 added, 1 removed\n- Sale\n'
+
+
+def test_summarize_Changes_compares_by_the_key():
+    key = lambda block: block.split(' at ')[0]
+    assert blocks.summarize_Changes(['Updated at 10:00'], ['Updated at 10:05'], key=key) == ''
+
+
+def test_summarize_Changes_is_short():
+    old = [f'block {number}' for number in range(30)]
+    new = [f'changed {number}' for number in range(30)]
+    summary = blocks.summarize_Changes(old, new).splitlines()
+    assert summary[0] == '30 changed, 0 added, 0 removed'
+    assert len(summary) == 1 + blocks.SUMMARY_ITEMS + 1 and summary[-1] == '... and 20 more'
+
+    words = [f'word{number}' for number in range(100)]
+    changed = list(words)
+    changed[50] = 'CHANGED'
+    assert blocks.diff_Words(' '.join(words), ' '.join(changed)) == \
+        '… word46 word47 word48 word49 [-word50-] {+CHANGED+} word51 word52 word53 word54 …'
+    assert len(blocks.diff_Words('a' * 500, 'b' * 500)) == blocks.BLOCK_LIMIT
+
+
+def test_method4_alerts_a_summary_of_the_text(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    webpage = checker.Webpage('shop', 'http://127.0.0.1/')
+    webpage.set_textOnly()
+    webpage.set_deltaChange(['token=[a-z0-9]*'])
+    webpage.save_html('old', webpage.extract_Region('<p>Price: ₹499</p><p>token=abc</p><p>Out of stock</p>'))
+
+    new_code = ['<div>Price:  <b>₹449</b></div><p>token=xyz</p><p>Out of stock</p><script>changed()</script>']
+    monkeypatch.setattr(checker.Webpage, 'get_webpage', lambda self, conditional=False: new_code[0])
+    assert webpage.detect(2) == (True, '1 changed, 0 added, 0 removed\n~ Price: [-₹499-] {+₹449+}\n')
+
+    # Only the markup, the scripts and the deltaChange differ
+    new_code[0] = '<p>Price: ₹449</p>\n<span>token=123</span><p>Out of   stock</p>'
+    assert webpage.detect(2) == (False, '')
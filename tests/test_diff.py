@@ -0,0 +1,127 @@
+#  Copyright (c) 2020. RoguedBear
+import random
+import shutil
+import subprocess
+
+import pytest
+
+import checker
+import chunks
+
+needs_diff = pytest.mark.skipif(shutil.which('diff') is None, reason="needs the diff command")
+LINES = ['a', 'b', 'c', '', '  ', 'a ', ' b', '\t', 'x  y', 'x y']
+
+
+def run_Diff(tmp_path, old_code: str, new_code: str) -> str:
+    """
+    :return: str, the output of `diff -EZBb` of the two codes
+    """
+    (tmp_path / 'old.html').write_text(old_code)
+    (tmp_path / 'new.html').write_text(new_code)
+    return subprocess.run(['diff', '-EZBb', str(tmp_path / 'old.html'), str(tmp_path / 'new.html')],
+                          capture_output=True, text=True).stdout
+
+
+def join_Lines(lines: list) -> str:
+    return ''.join(line + '\n' for line in lines)
+
+
+def make_Page(lines: int, seed: int = 0) -> list:
+    """
+    :return: list of str, the lines of a large webpage with no two lines alike
+    """
+    generator = random.Random(seed)
+    return [f'<p id="{number}">{generator.getrandbits(48):x} text {number}</p>' for number in range(lines)]
+
+
+@needs_diff
+@pytest.mark.parametrize('seed', range(5))
+def test_compute_Diff_finds_a_change_when_diff_does(tmp_path, seed):
+    generator = random.Random(seed)
+    for _ in range(100):
+        old = [generator.choice(LINES) for _ in range(generator.randint(0, 10))]
+        new = [generator.choice(LINES) for _ in range(generator.randint(0, 10))]
+        # The blank lines are left out, as diff -B can report a line moved across blank lines as a change
+        expected = run_Diff(tmp_path, join_Lines(line for line in old if line.strip()),
+                            join_Lines(line for line in new if line.strip()))
+        assert bool(checker.compute_Diff(join_Lines(old), join_Lines(new))) == bool(expected), (old, new)
+
+
+@needs_diff
+@pytest.mark.parametrize('old, new', [
+    (['a', 'b', 'c'], ['a', 'B', 'c']),
+    (['a', 'b', 'c'], ['a', 'c']),
+    (['a', 'c'], ['a', 'b', 'c']),
+    (['a', 'b', 'c', 'd'], ['x', 'b', 'c', 'y', 'z']),
+    (['a', '', 'b'], ['a', '', 'c']),
+    (['a   b', 'c\t'], ['a b', 'c']),
+])
+def test_compute_Diff_gives_the_output_of_diff(tmp_path, old, new):
+    assert checker.compute_Diff(join_Lines(old), join_Lines(new)) == run_Diff(tmp_path, join_Lines(old),
+                                                                             join_Lines(new))
+
+
+def test_compute_Diff_ignores_blank_lines():
+    assert checker.compute_Diff(join_Lines([' b', '', '\t', '']), join_Lines(['\t', ' b', '\t'])) == ''
+    assert checker.compute_Diff('a\n\n\nb\n', 'a\nb\n\n') == ''
+    assert checker.compute_Diff('a\n\nb\n', 'a\nb\n', ignore_whitespace=False) == '2d1\n< \n'
+
+
+def test_compute_Diff_masks_the_deltaChange():
+    mask = checker.compile_Mask(['Visitors: [0-9][0-9]*'])
+    assert checker.compute_Diff('<p>Visitors: 10</p>\n', '<p>Visitors: 12</p>\n', mask) == ''
+    assert checker.compute_Diff('<p>Visitors: 10</p>\n', '<p>Viewers: 12</p>\n', mask) != ''
+
+
+def test_compute_Diff_of_the_changed_ranges():
+    old = make_Page(2000)
+    new = list(old)
+    new[150] = '<p>changed</p>'
+    del new[1200:1203]
+    new.insert(1700, '<p>added</p>')
+    old_code, new_code = join_Lines(old), join_Lines(new)
+    ranges = chunks.changed_Ranges(checker.index_Code(old_code), checker.index_Code(new_code))
+    assert sum(old_end - old_start for old_start, old_end, _, _ in ranges) < len(old) / 4
+    assert checker.compute_Diff(old_code, new_code, ranges=ranges) == checker.compute_Diff(old_code, new_code)
+
+
+@needs_diff
+def test_method1_diff_of_the_changed_chunks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(checker.Webpage, 'sleep_time', 0)
+    old = make_Page(3000, seed=1)
+    new = list(old)
+    new[10] = '<p>changed at the top</p>'
+    del new[1500:1510]
+    new[2980] = new[2980].replace('text', 'TEXT')
+    old_code, new_code = join_Lines(old), join_Lines(new)
+
+    webpage = checker.Webpage('page', 'http://127.0.0.1')
+    webpage.save_html('old', old_code, checker.index_Code(old_code))
+    webpage.save_html('new', new_code)
+    new_index = checker.index_Code(new_code)
+    assert webpage.get_changedRanges(checker.split_Lines(old_code), new_index)
+
+    change_detected, output = webpage.method1_diff(new_code, new_index)
+    assert change_detected
+    assert output == run_Diff(tmp_path, old_code, new_code)
+    assert webpage.method1_diff(old_code, checker.index_Code(old_code)) == (False, '')
+
+
+def test_offset_Hunks():
+    output = '3c3\n< a\n---\n> b\n5,6d4\n< c\n< d\n7a6,8\n> e\n'
+    assert checker.offset_Hunks(output, 120, 121) == \
+        '123c124\n< a\n---\n> b\n125,126d125\n< c\n< d\n127a127,129\n> e\n'
+
+
+def test_chunk_Lines_keeps_the_chunks_away_from_a_change():
+    lines = make_Page(5000, seed=2)
+    index = chunks.chunk_Lines(lines)
+    assert chunks.count_Lines(index) == len(lines)
+    assert all(chunks.MIN_LINES <= size <= chunks.MAX_LINES for size, _ in index[:-1])
+
+    changed = lines[:2500] + ['<p>inserted</p>'] + lines[2500:]
+    ranges = chunks.changed_Ranges(index, chunks.chunk_Lines(changed))
+    assert len(ranges) == 1
+    old_start, old_end, new_start, new_end = ranges[0]
+    assert old_start <= 2500 < new_end and new_end - new_start == old_end - old_start + 1
@@ -0,0 +1,212 @@
+#  Copyright (c) 2020. RoguedBear
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import checker
+import config
+import main
+
+
+class DripHandler(BaseHTTPRequestHandler):
+    """
+    Sends a byte every 0.2 seconds: /length with a Content-Length, /close ending the body by closing the connection
+    """
+
+    def do_GET(self):
+        self.send_response(200)
+        if self.path == '/length':
+            self.send_header('Content-Length', '1000')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for _ in range(1000):
+                self.wfile.write(b'a')
+                self.wfile.flush()
+                sleep(0.2)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSession:
+    """
+    Stands in for the shared requests.Session: get() returns (or raises) the next of the outcomes, and records the
+    headers of every request
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_Response(body: str = '', status: int = 200, **headers) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict({name.replace('_', '-'): value for name, value in headers.items()})
+    response.encoding = 'utf-8'
+    response.raw = io.BytesIO(body.encode('utf-8'))
+    return response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """
+    Replaces the shared session with a StubSession (given its outcomes with session.outcomes), and the sleeps
+    between the attempts with a list of their seconds
+    """
+    stub = StubSession()
+    stub.sleeps = []
+    monkeypatch.setattr(checker, 'SESSION', stub)
+    monkeypatch.setattr(checker, 'sleep', stub.sleeps.append)
+    return stub
+
+
+@pytest.fixture
+def drip_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DripHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('path', ['/length', '/close'])
+def test_deadline_stops_a_slow_drip(drip_server, path):
+    webpage = checker.Webpage('drip', drip_server + path)
+    webpage.set_limits(deadline=1)
+    webpage.set_policy(checker.FetchPolicy(read_timeout=3, max_attempts=1))
+
+    started = monotonic()
+    with pytest.raises(checker.FetchAborted, match='took longer than 1 seconds'):
+        webpage.get_webpage()
+    assert monotonic() - started < 2
+
+
+def test_watchdog_calls_only_what_is_not_cancelled():
+    called = []
+    watchdog = checker.Watchdog()
+    kept = watchdog.watch(monotonic() + 0.1, lambda: called.append('kept'))
+    cancelled = watchdog.watch(monotonic() + 0.1, lambda: called.append('cancelled'))
+    assert watchdog.cancel(cancelled)
+    sleep(0.3)
+    assert called == ['kept']
+    assert not watchdog.cancel(kept)
+
+
+def test_attempts_are_capped_with_a_capped_backoff(session, monkeypatch):
+    monkeypatch.setattr(checker.random, 'uniform', lambda low, high: high)
+    session.outcomes = [requests.exceptions.ConnectionError("refused")] * 5
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_policy(checker.FetchPolicy(max_attempts=4, backoff=2, max_backoff=5))
+
+    with pytest.raises(checker.FetchFailed, match='after 4 attempts'):
+        webpage.get_webpage()
+    assert len(session.requests) == 4
+    # Doubled after every attempt, upto max_backoff, and no sleep after the last attempt
+    assert session.sleeps == [2, 4, 5]
+
+
+def test_an_attempt_after_a_failure_recovers(session):
+    session.outcomes = [requests.exceptions.Timeout("slow"), make_Response(''), make_Response('<p>page</p>')]
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    assert webpage.get_webpage() == '<p>page</p>'
+    assert len(session.requests) == 3 and len(session.sleeps) == 2
+
+
+def test_cooldown_and_retry_delay_grow_upto_their_maximum():
+    policy = checker.FetchPolicy(max_backoff=30, failure_threshold=3, cooldown=600, max_cooldown=2000)
+    assert [policy.get_Cooldown(failures) for failures in range(1, 7)] == [0, 0, 600, 1200, 2000, 2000]
+    assert [policy.get_RetryDelay(failures) for failures in [1, 3, 4]] == [30, 600, 1200]
+
+
+def test_circuit_breaker_skips_a_failing_webpage_till_its_cooldown(session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    now = [1000.0]
+    monkeypatch.setattr(checker, 'monotonic', lambda: now[0])
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_policy(checker.FetchPolicy(max_attempts=1, failure_threshold=2, cooldown=600))
+    webpage.save_html('old', '<p>page</p>\n')
+
+    session.outcomes = [requests.exceptions.ConnectionError("refused")] * 2
+    assert webpage.detect(2) == (None, '')
+    assert webpage.is_Available()
+    assert webpage.detect(2) == (None, '')
+    assert not webpage.is_Available()
+
+    # Skipped without a request while it is open
+    now[0] += 599
+    assert webpage.detect(2) == (None, '')
+    assert len(session.requests) == 2
+
+    now[0] += 1
+    session.outcomes = [make_Response('<p>page</p>\n')]
+    assert webpage.detect(2) == (False, '')
+    assert len(session.requests) == 3 and webpage.failures == 0
+
+
+def test_conditional_request_sends_the_validators_and_keeps_the_new_ones(session):
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    session.outcomes = [make_Response('<p>page</p>', ETag='"v1"', Last_Modified='Mon, 05 Oct 2020 10:00:00 GMT')]
+    assert webpage.get_webpage(conditional=True) == '<p>page</p>'
+    # Nothing to send the first time
+    assert session.requests[0] == {}
+    assert (webpage.etag, webpage.last_modified) == ('"v1"', 'Mon, 05 Oct 2020 10:00:00 GMT')
+
+    session.outcomes = [make_Response('<p>page 2</p>', ETag='"v2"', Last_Modified='Tue, 06 Oct 2020 10:00:00 GMT')]
+    assert webpage.get_webpage(conditional=True) == '<p>page 2</p>'
+    assert session.requests[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 05 Oct 2020 10:00:00 GMT'}
+    assert (webpage.etag, webpage.last_modified) == ('"v2"', 'Tue, 06 Oct 2020 10:00:00 GMT')
+
+
+def test_not_modified_is_no_change_without_diffing(session, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.save_html('old', '<p>page</p>\n')
+    webpage.etag = '"v1"'
+    monkeypatch.setattr(checker.Webpage, 'method2_difflib', None)
+    monkeypatch.setattr(checker.Webpage, 'save_html', None)
+
+    session.outcomes = [make_Response(status=304)]
+    assert webpage.detect(2) == (False, '')
+    assert session.requests == [{'If-None-Match': '"v1"'}]
+    assert webpage.etag == '"v1"' and webpage.failures == 0
+
+
+def test_body_is_decoded_whole_and_limited_in_size(session, monkeypatch):
+    monkeypatch.setattr(checker, 'CHUNK_SIZE', 1000)
+    body = '<p>₹499</p>\n' * 500
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_limits(max_bytes=len(body.encode('utf-8')))
+    session.outcomes = [make_Response(body)]
+    # The multibyte characters split between the chunks are decoded as they are
+    assert webpage.get_webpage() == body
+
+    webpage.set_limits(max_bytes=len(body.encode('utf-8')) - 1)
+    session.outcomes = [make_Response(body)]
+    with pytest.raises(checker.FetchAborted, match='larger than'):
+        webpage.get_webpage()
+
+
+def test_webpages_are_limited_in_size_by_default():
+    parser = main.create_Parser()
+    settings = config.Settings(60, max_size=parser.parse_args([]).max_size)
+    webpage, _ = config.create_Webpage(['site', 'http://127.0.0.1/'], settings)
+    assert webpage.max_bytes == config.size_parser(main.MAX_SIZE)
+    webpage, _ = config.create_Webpage(['site', 'http://127.0.0.1/', '', '', '', '', '', '0'], settings)
+    assert webpage.max_bytes is None
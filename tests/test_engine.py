@@ -0,0 +1,53 @@
+#  Copyright (c) 2020. RoguedBear
+import threading
+from collections import Counter
+from time import monotonic, sleep
+
+import checker
+import engine
+
+
+def wait_Until(condition, timeout: float = 5) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+def test_per_host_limits_the_checks_of_a_host_at_the_same_time(monkeypatch):
+    release = threading.Event()
+    lock = threading.Lock()
+    running, most = Counter(), Counter()
+
+    def detect(self, method, debug=False):
+        host = engine.get_Host(self)
+        with lock:
+            running[host] += 1
+            most[host] = max(most[host], running[host])
+        release.wait(5)
+        with lock:
+            running[host] -= 1
+        return False, ''
+
+    monkeypatch.setattr(checker.Webpage, 'detect', detect)
+    webpages = [checker.Webpage(f'a{number}', f'http://a.test/{number}') for number in range(6)]
+    webpages += [checker.Webpage(f'b{number}', f'http://b.test/{number}') for number in range(2)]
+    check_engine = engine.CheckEngine(workers=4, per_host=2)
+    try:
+        check_engine.submit(webpages)
+        # The blocked checks of a.test wait in its queue, leaving the other worker threads to b.test
+        assert wait_Until(lambda: running['a.test'] == 2 and running['b.test'] == 2)
+        sleep(0.1)
+        assert running['a.test'] == 2
+
+        release.set()
+        results = check_engine.run_cycle([])
+        while len(results) < len(webpages):
+            results += check_engine.collect(timeout=5)
+    finally:
+        release.set()
+        check_engine.shutdown()
+    assert sorted(webpage.get_name() for webpage, _, _ in results) == sorted(webpage.get_name() for webpage in webpages)
+    assert most == {'a.test': 2, 'b.test': 2}
@@ -0,0 +1,46 @@
+#  Copyright (c) 2020. RoguedBear
+import random
+
+import checker
+import learner
+
+
+def make_Sample(seed: int, price: int = 10) -> str:
+    """
+    :return: str, an html code whose date, time, counter and token change on every download
+    """
+    token = random.Random(seed).getrandbits(64)
+    return '\n'.join([
+        '<html>',
+        f'<p>Updated on {seed % 28 + 1}/10/2020 {seed % 24}:{seed % 60:02d}:{seed * 7 % 60:02d}</p>',
+        f'<p>Last seen: Oct {seed % 28 + 1}, 2020</p>',
+        f'<span>Visitors: {1000 + seed * 137}</span>',
+        f'<input name="csrf" value="{token:016x}">',
+        f'<p>price {price}</p>',
+        '</html>',
+    ]) + '\n'
+
+
+def test_learn_DeltaChange_masks_dates_counters_and_tokens():
+    patterns = learner.learn_DeltaChange([make_Sample(seed) for seed in range(1, 4)])
+    mask = checker.compile_Mask(patterns)
+    assert len(patterns) == 4
+    assert not any('price' in pattern for pattern in patterns)
+
+    # The values of a later download are masked too, but not a change of the rest of the webpage
+    assert checker.compute_Diff(make_Sample(1), make_Sample(17), mask) == ''
+    assert checker.compute_Diff(make_Sample(1), make_Sample(17, price=12), mask) == \
+        '6c6\n< <p>price 10</p>\n---\n> <p>price 12</p>\n'
+    assert checker.fingerprint_Code(make_Sample(1), mask) == checker.fingerprint_Code(make_Sample(17), mask)
+
+
+def test_learn_DeltaChange_of_a_static_webpage():
+    assert learner.learn_DeltaChange([make_Sample(1)] * 3) == []
+    assert learner.learn_DeltaChange([make_Sample(1)]) == []
+
+
+def test_learned_patterns_are_anchored_to_their_context():
+    patterns = learner.learn_DeltaChange([make_Sample(seed) for seed in range(1, 4)])
+    mask = checker.compile_Mask(patterns)
+    # A number elsewhere on the webpage is not masked by the counter's pattern
+    assert checker.compute_Diff('<p>Stock: 10</p>\n', '<p>Stock: 11</p>\n', mask) != ''
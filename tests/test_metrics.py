@@ -0,0 +1,27 @@
+#  Copyright (c) 2020. RoguedBear
+import metrics
+
+
+def test_remote_snapshots_are_added_to_the_local_metrics():
+    local, remote = metrics.Registry(), metrics.Registry()
+    local.increment('alerts_total', kind='change')
+    local.observe('webpage_check_seconds', 0.2, site='a')
+    remote.increment('webpage_changes_total', site='a')
+    remote.observe('webpage_check_seconds', 0.4, site='a')
+    remote.observe('webpage_check_seconds', 3, site='b')
+
+    local.set_Remote('worker-0', remote.get_Snapshot())
+    # A newer snapshot replaces the previous one instead of being added again
+    local.set_Remote('worker-0', remote.get_Snapshot())
+    summary = local.get_Summary()
+    assert summary['alerts_total'] == [{'labels': {'kind': 'change'}, 'value': 1}]
+    assert summary['webpage_changes_total'] == [{'labels': {'site': 'a'}, 'value': 1}]
+    checks = {entry['labels']['site']: entry for entry in summary['webpage_check_seconds']}
+    assert checks['a']['count'] == 2 and checks['a']['sum'] == 0.6
+    assert checks['b']['count'] == 1
+
+    text = local.render_Prometheus()
+    assert 'webpage_check_seconds_count{site="a"} 2' in text
+    assert 'webpage_check_seconds_bucket{site="a",le="0.5"} 2' in text
+    # The local metrics are not changed by rendering
+    assert local.histograms[('webpage_check_seconds', (('site', 'a'),))]['count'] == 1
@@ -0,0 +1,106 @@
+#  Copyright (c) 2020. RoguedBear
+import io
+import json
+
+import pytest
+import requests
+
+import notifier
+
+
+class StubSession:
+    """
+    Stands in for the notifier's requests.Session: post() returns (or raises) the next of the outcomes, and records
+    the data of every message
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.posts = []
+
+    def post(self, url, data=None, **kwargs):
+        self.posts.append(dict(data))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_Response(status: int = 200, body: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.encoding = 'utf-8'
+    response.raw = io.BytesIO(json.dumps(body or {}).encode('utf-8'))
+    return response
+
+
+@pytest.fixture
+def make_Notifier(tmp_path, monkeypatch):
+    """
+    Makes a TelegramNotifier with tokens, no rate limit and a StubSession, the sleeps between the attempts are
+    recorded in session.sleeps instead
+    """
+    tokens_file = tmp_path / 'telegram_tokens.json'
+    tokens_file.write_text(json.dumps({'chat_id': 1, 'bot_token': 'token'}))
+    sleeps = []
+    monkeypatch.setattr(notifier, 'sleep', sleeps.append)
+    notifiers = []
+
+    def make(*outcomes, **kwargs):
+        telegram = notifier.TelegramNotifier(str(tokens_file), min_interval=0, **kwargs)
+        telegram.session = StubSession(*outcomes)
+        telegram.session.sleeps = sleeps
+        notifiers.append(telegram)
+        return telegram
+
+    yield make
+    for telegram in notifiers:
+        telegram.stop(timeout=5)
+
+
+def test_join_Alerts_within_the_message_limit():
+    alerts = ['a' * 1000, 'b' * 1000, 'c' * 1000, 'd' * 1000, 'e' * 1000]
+    messages = notifier.join_Alerts(alerts)
+    assert messages == ['\n\n'.join(alerts[:4]), alerts[4]]
+    assert all(len(message) <= notifier.MESSAGE_LIMIT for message in messages)
+    assert notifier.join_Alerts([]) == []
+
+
+def test_stop_flushes_the_batch(make_Notifier):
+    telegram = make_Notifier(make_Response(), make_Response())
+    telegram.send('started')
+    telegram.add('first')
+    telegram.add('second' * 1000)
+    telegram.stop(timeout=5)
+
+    assert not telegram.thread.is_alive()
+    assert [data['text'] for data in telegram.session.posts] == \
+        ['started', 'first\n\n' + ('second' * 1000)[:notifier.ALERT_LIMIT]]
+    assert telegram.batch == [] and telegram.queue.empty()
+
+
+def test_post_retries_with_backoff(make_Notifier):
+    telegram = make_Notifier(requests.exceptions.ConnectionError("refused"), make_Response(502),
+                             make_Response(429, {'parameters': {'retry_after': 7}}), make_Response())
+    assert telegram.post('alert')
+    assert len(telegram.session.posts) == 4
+    assert len(telegram.session.sleeps) == 3
+    assert 0.5 <= telegram.session.sleeps[0] <= 1 and 1 <= telegram.session.sleeps[1] <= 2
+    assert telegram.session.sleeps[2] == 7
+
+
+def test_post_drops_the_message_after_the_retries(make_Notifier):
+    telegram = make_Notifier(*[make_Response(500)] * 3, max_retries=2)
+    assert not telegram.post('alert')
+    assert len(telegram.session.posts) == 3 and len(telegram.session.sleeps) == 3
+
+    telegram = make_Notifier(make_Response(403))
+    assert not telegram.post('alert')
+    assert len(telegram.session.posts) == 1
+
+
+def test_post_resends_unparsable_markdown_as_plain_text(make_Notifier):
+    telegram = make_Notifier(make_Response(400), make_Response())
+    assert telegram.post('*broken')
+    assert [data.get('parse_mode') for data in telegram.session.posts] == ['Markdown', None]
+    assert telegram.session.sleeps == []
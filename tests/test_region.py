@@ -0,0 +1,61 @@
+#  Copyright (c) 2020. RoguedBear
+import importlib.util
+import logging
+
+import pytest
+
+import blocks
+import checker
+
+needs_bs4 = pytest.mark.skipif(importlib.util.find_spec('bs4') is None, reason="needs beautifulsoup4")
+needs_lxml = pytest.mark.skipif(importlib.util.find_spec('lxml') is None, reason="needs lxml")
+
+PAGE = """<html><head><title>Shop</title><style>p { color: red }</style></head>
+<body>
+  <nav>Home | Deals</nav>
+  <div class="ad">Buy   now!</div>
+  <table id="results"><tr><td>Price:</td><td>₹499</td></tr></table>
+  <p id="stock">In <b>stock</b></p>
+  <script>var token = "a1b2c3";</script>
+</body></html>
+"""
+
+
+def make_Webpage(selector: str = None) -> checker.Webpage:
+    webpage = checker.Webpage('shop', 'http://127.0.0.1/')
+    if selector is not None:
+        webpage.set_selector(selector)
+    return webpage
+
+
+@needs_bs4
+def test_css_selector_extracts_the_text_of_the_matches():
+    webpage = make_Webpage('#results td, p#stock')
+    assert webpage.selector == '#results td, p#stock'
+    assert webpage.extract_Region(PAGE) == 'Price:\n₹499\nIn\nstock\n'
+
+
+@needs_lxml
+def test_xpath_selector_extracts_the_text_of_the_matches():
+    webpage = make_Webpage("//table[@id='results']//td")
+    assert webpage.extract_Region(PAGE) == 'Price:\n₹499\n'
+    # Text and attribute results of an XPath are compared as they are
+    assert make_Webpage("//p[@id='stock']/@id").extract_Region(PAGE) == 'stock\n'
+
+
+@needs_bs4
+@pytest.mark.parametrize('selector', ['#missing', "//div[@id='missing']"])
+def test_selector_matching_nothing_is_an_empty_region(selector, caplog):
+    if selector.startswith('/'):
+        pytest.importorskip('lxml')
+    webpage = make_Webpage(selector)
+    with caplog.at_level(logging.WARNING, logger="Webpage"):
+        assert webpage.extract_Region(PAGE) == '\n'
+    assert 'Nothing on the webpage matches' in caplog.text
+
+
+@needs_bs4
+def test_invalid_selector_compares_the_whole_webpage():
+    webpage = make_Webpage('div[')
+    assert webpage.selector is None and webpage.get_compareMode() == 'html'
+    assert webpage.extract_Region(PAGE) == PAGE
@@ -0,0 +1,127 @@
+#  Copyright (c) 2020. RoguedBear
+import logging
+
+import pytest
+
+import config
+import main
+import scheduler
+
+
+class FakeEngine:
+    """
+    Stands in for engine.CheckEngine: the deltaChange of the submitted webpages is found when the test says so
+    """
+
+    def __init__(self):
+        self.submitted = []
+        self.finished = []
+        self.removed = []
+        self.forgotten = []
+
+    def submit_Baselines(self, webpages):
+        self.submitted.extend(webpage for webpage, _ in webpages)
+
+    def collect_BaselineResults(self):
+        finished, self.finished = self.finished, []
+        return finished
+
+    def remove(self, webpage, forget=False):
+        self.removed.append(webpage)
+        self.forgotten += [webpage] if forget else []
+
+
+class FakeNotifier:
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def program(tmp_path, monkeypatch):
+    """
+    Sets up main's globals the way main() does, without a snapshot store
+    """
+    monkeypatch.chdir(tmp_path)
+    check_engine = FakeEngine()
+    for name, value in [('logger', logging.getLogger("test")), ('config_file', 'config.csv'),
+                        ('SETTINGS', config.Settings(60)), ('POOL', None), ('NOTIFIER', FakeNotifier()),
+                        ('ENGINE', check_engine), ('MASTER_Webpages', {}), ('PENDING_Webpages', {}),
+                        ('SCHEDULER', scheduler.Scheduler())]:
+        monkeypatch.setattr(main, name, value, raising=False)
+    return check_engine
+
+
+def write_Config(*names: str) -> None:
+    with open('config.csv', 'w') as file:
+        file.writelines(f'{name},http://127.0.0.1/{name}\n' for name in names)
+
+
+def get_Names() -> list:
+    return sorted(webpage.get_name() for webpage in main.MASTER_Webpages.values())
+
+
+def test_reload_while_finding_the_deltaChange_does_not_add_it_twice(program):
+    write_Config('a')
+    main.reload_Config()
+    write_Config('a', 'b')
+    main.reload_Config()
+    assert [webpage.get_name() for webpage in program.submitted] == ['a', 'b']
+
+    program.finished = [(webpage, True) for webpage in program.submitted]
+    main.handle_Results([])
+    assert get_Names() == ['a', 'b'] and main.PENDING_Webpages == {}
+
+
+def test_removed_while_finding_the_deltaChange_is_not_added(program):
+    write_Config('a', 'c')
+    main.reload_Config()
+    removed = main.PENDING_Webpages['c']
+    write_Config('a')
+    main.reload_Config()
+    assert program.removed == [removed] and program.forgotten == [removed]
+
+    program.finished = [(webpage, True) for webpage in program.submitted]
+    main.handle_Results([])
+    assert get_Names() == ['a']
+
+
+def test_changed_while_finding_the_deltaChange_keeps_the_new_row(program):
+    write_Config('a')
+    main.reload_Config()
+    with open('config.csv', 'w') as file:
+        file.write('a,http://127.0.0.1/other\n')
+    main.reload_Config()
+    old, new = program.submitted
+
+    program.finished = [(old, True), (new, True)]
+    main.handle_Results([])
+    assert main.MASTER_Webpages == {'a': new}
+    assert program.removed == [old] and program.forgotten == []
+
+
+def test_failed_deltaChange_is_retried_later(program):
+    write_Config('a')
+    main.reload_Config()
+    webpage = main.PENDING_Webpages['a']
+
+    program.finished = [(webpage, False)]
+    main.handle_Results([])
+    assert main.MASTER_Webpages == {} and main.PENDING_Webpages == {'a': webpage}
+    assert main.SCHEDULER.time_until_next() > 0.5 * webpage.get_retryDelay()
+
+
+def test_invalid_row_is_not_pending(program):
+    write_Config('a')
+    main.reload_Config()
+    webpage = main.PENDING_Webpages['a']
+
+    program.finished = [(webpage, None)]
+    main.handle_Results([])
+    assert main.MASTER_Webpages == {} and main.PENDING_Webpages == {}
+    assert len(main.SCHEDULER) == 0
+
+
+def test_rows_without_url_are_skipped(tmp_path):
+    config_file = tmp_path / 'config.csv'
+    config_file.write_text('onlyname\nblank, \na,http://127.0.0.1/a\n')
+    assert list(config.read_Config(str(config_file))) == ['a']
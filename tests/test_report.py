@@ -0,0 +1,43 @@
+#  Copyright (c) 2020. RoguedBear
+import json
+import logging
+
+import checker
+import main
+
+SITE_KEYS = {'name', 'url', 'status', 'diff', 'errors', 'seconds'}
+
+
+def test_once_reports_every_webpage(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'config.csv').write_text('report_ok,http://127.0.0.1/ok,0\nreport_bad,http://127.0.0.1/bad,0\n')
+    pages = {'http://127.0.0.1/ok': '<p>Price: 499</p>\n'}
+
+    def get_webpage(self, conditional=False):
+        if self.get_url() not in pages:
+            raise checker.FetchFailed("refused")
+        return pages[self.get_url()]
+
+    monkeypatch.setattr(checker.Webpage, 'get_webpage', get_webpage)
+    once = ['--once', '-m', '2', '--samples', '2', '--retries', '0', '--report', 'report.json']
+
+    with caplog.at_level(logging.INFO):
+        assert main.main(once) == 1
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert set(report) == {'started', 'seconds', 'method', 'summary', 'sites'}
+    assert report['method'] == 2
+    assert report['summary'] == {'changed': 0, 'unchanged': 0, 'baseline': 1, 'failed': 1}
+    assert {site['name']: site['status'] for site in report['sites']} == {'report_ok': 'baseline',
+                                                                          'report_bad': 'failed'}
+    assert all(set(site) == SITE_KEYS for site in report['sites'])
+    # A single run does not retry the failed baselines
+    assert 'retrying in' not in caplog.text
+
+    # The next run resumes the baseline from the store
+    pages['http://127.0.0.1/ok'] = '<p>Price: 449</p>\n'
+    assert main.main(once[:-1] + ['report.ndjson', '--report-format', 'ndjson']) == 1
+    sites = [json.loads(line) for line in (tmp_path / 'report.ndjson').read_text().splitlines()]
+    assert [(site['name'], site['status']) for site in sites] == [('report_ok', 'changed'), ('report_bad', 'failed')]
+    assert all(set(site) == SITE_KEYS for site in sites)
+    assert '449' in sites[0]['diff'] and sites[1]['diff'] is None
+    assert sites[0]['url'] == 'http://127.0.0.1/ok' and 'check' in sites[0]['seconds']
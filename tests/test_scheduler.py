@@ -0,0 +1,185 @@
+#  Copyright (c) 2020. RoguedBear
+from datetime import datetime, time, timedelta
+from time import monotonic
+
+import checker
+import scheduler
+
+
+class FakeEngine:
+    """
+    Stands in for engine.CheckEngine, without checking anything
+    """
+
+    def __init__(self):
+        self.submitted = []
+        self.wakes = 0
+
+    def submit(self, webpages):
+        self.submitted.extend(webpages)
+
+    def collect(self, timeout=0):
+        return []
+
+    def wake(self):
+        self.wakes += 1
+
+
+def make_Webpage(name: str, interval: float, url: str = None) -> checker.Webpage:
+    webpage = checker.Webpage(name, url or f'http://127.0.0.1/{name}')
+    webpage.set_interval(interval)
+    return webpage
+
+
+def test_pop_due_in_order_of_the_intervals(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    webpages = [make_Webpage(name, interval) for name, interval in [('c', 30), ('a', 10), ('b', 20)]]
+    schedule = scheduler.Scheduler(jitter=0)
+    for webpage in webpages:
+        schedule.schedule(webpage)
+
+    assert schedule.time_until_next() == 10
+    assert schedule.pop_due() == []
+    now[0] += 25
+    assert [webpage.get_name() for webpage in schedule.pop_due()] == ['a', 'b']
+    now[0] += 5
+    assert [webpage.get_name() for webpage in schedule.pop_due()] == ['c']
+    assert schedule.time_until_next() is None and len(schedule) == 0
+
+
+def test_schedule_replaces_and_remove_drops(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    first, second = make_Webpage('first', 10), make_Webpage('second', 10)
+    schedule = scheduler.Scheduler(jitter=0)
+    schedule.schedule(first)
+    schedule.schedule(second)
+    schedule.schedule(first, delay=50)
+    schedule.remove(second)
+
+    assert len(schedule) == 1
+    assert schedule.time_until_next() == 50
+    now[0] += 20
+    assert schedule.pop_due() == []
+    now[0] += 30
+    assert schedule.pop_due() == [first]
+    assert schedule.pop_due() == []
+
+
+def test_jitter_stays_within_its_bounds(monkeypatch):
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: 0.0)
+    schedule = scheduler.Scheduler(jitter=0.1)
+    for number in range(50):
+        schedule.schedule(make_Webpage(str(number), 100))
+    assert all(90 <= due <= 110 for due, _, _ in schedule._heap)
+
+
+def test_event_loop_replaces_a_job_of_the_same_name(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    runs = []
+    loop = scheduler.EventLoop(FakeEngine(), scheduler.Scheduler(), lambda results: None)
+    loop.add_Job('flush', lambda: runs.append('old'), 10)
+    loop.add_Job('flush', lambda: runs.append('new'), 20)
+    loop.add_Job('uptime', lambda: runs.append('uptime'), lambda: 15)
+
+    assert loop.run_DueJobs() == 15
+    now[0] += 15
+    assert loop.run_DueJobs() == 5
+    now[0] += 5
+    assert loop.run_DueJobs() == 10
+    assert runs == ['uptime', 'new']
+
+    loop.remove_Job('uptime')
+    now[0] += 20
+    loop.run_DueJobs()
+    assert runs == ['uptime', 'new', 'new']
+
+
+def test_event_loop_keeps_running_a_failing_job(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    runs = []
+
+    def job():
+        runs.append(now[0])
+        raise ValueError("failed")
+
+    loop = scheduler.EventLoop(FakeEngine(), scheduler.Scheduler(), lambda results: None)
+    loop.add_Job('failing', job, 10)
+    for _ in range(3):
+        now[0] += 10
+        loop.run_DueJobs()
+    assert runs == [1010.0, 1020.0, 1030.0]
+
+
+def test_event_loop_runs_till_stopped():
+    check_engine = FakeEngine()
+    webpage = make_Webpage('due', 0)
+    schedule = scheduler.Scheduler(jitter=0)
+    schedule.schedule(webpage)
+    wakeups = []
+    loop = scheduler.EventLoop(check_engine, schedule, wakeups.append)
+    loop.add_Job('stop', loop.stop, 0)
+
+    started = monotonic()
+    loop.run()
+    assert monotonic() - started < 1
+    assert check_engine.submitted == [webpage]
+    assert check_engine.wakes >= 2
+
+
+def test_webpages_of_the_same_url_come_due_together(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    schedule = scheduler.Scheduler(jitter=0.1)
+    same = [make_Webpage(name, 100, url='http://127.0.0.1/same') for name in ['a', 'b']]
+    later = make_Webpage('c', 105, url='http://127.0.0.1/same')
+    other = make_Webpage('d', 200, url='http://127.0.0.1/other')
+    assert schedule.get_Jitter(same[0].get_fetchKey()) == schedule.get_Jitter(later.get_fetchKey())
+
+    for webpage in same + [later, other]:
+        schedule.schedule(webpage)
+        # Scheduled a little apart, eg: as their checks finished
+        now[0] += 1
+    due = {webpage: time for time, _, webpage in schedule._heap}
+    assert due[same[1]] - due[same[0]] == 1
+
+    now[0] = due[same[1]]
+    popped = schedule.pop_due()
+    # c isn't due for another ~5 seconds, but is within its jitter so it shares the download
+    assert set(popped) == set(same + [later])
+    assert schedule.pop_due() == [] and len(schedule) == 1
+
+
+def test_daily_job_follows_the_wall_clock(monkeypatch):
+    now, wall_clock = [1000.0], [datetime(2020, 10, 5, 13, 59)]
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return wall_clock[0]
+
+    monkeypatch.setattr(scheduler, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(scheduler, 'datetime', FakeDatetime)
+    runs = []
+    loop = scheduler.EventLoop(FakeEngine(), scheduler.Scheduler(), lambda results: None)
+    loop.add_DailyJob('uptime', lambda: runs.append(wall_clock[0]), time(14))
+
+    assert loop.run_DueJobs() == 60
+    now[0] += 60
+    wall_clock[0] += timedelta(seconds=60)
+    assert loop.run_DueJobs() == loop.WALL_CLOCK_CHECK
+    assert runs == [datetime(2020, 10, 5, 14)]
+
+    # The clock is set back an hour: the job is not run again that day
+    now[0] += loop.WALL_CLOCK_CHECK
+    wall_clock[0] = datetime(2020, 10, 5, 13, 5)
+    loop.run_DueJobs()
+    # Suspended till the next afternoon, which the monotonic clock doesn't count
+    now[0] += loop.WALL_CLOCK_CHECK
+    wall_clock[0] = datetime(2020, 10, 6, 15, 30)
+    loop.run_DueJobs()
+    assert runs == [datetime(2020, 10, 5, 14), datetime(2020, 10, 6, 15, 30)]
+    assert scheduler.next_Time(time(14), wall_clock[0]) == datetime(2020, 10, 7, 14)
@@ -0,0 +1,104 @@
+#  Copyright (c) 2020. RoguedBear
+import threading
+
+import pytest
+
+import checker
+import engine
+import store
+
+
+@pytest.fixture
+def snapshot_store(tmp_path):
+    snapshot_store = store.SnapshotStore(str(tmp_path / 'snapshots.db'), history_limit=3)
+    yield snapshot_store
+    snapshot_store.close()
+
+
+def test_state_round_trip(snapshot_store):
+    assert snapshot_store.load_state('site') is None
+    snapshot_store.save_state('site', 'https://example.com', 'abc', ['a*', 'b'], etag='"v1"',
+                              last_modified='Mon, 05 Oct 2020 10:00:00 GMT', config='site,example.com',
+                              interval=600, mode='html')
+    assert snapshot_store.load_state('site') == {
+        'name': 'site', 'url': 'https://example.com', 'fingerprint': 'abc', 'delta_change': ['a*', 'b'],
+        'etag': '"v1"', 'last_modified': 'Mon, 05 Oct 2020 10:00:00 GMT', 'config': 'site,example.com',
+        'interval': 600, 'mode': 'html'}
+
+
+def test_bodies_are_compressed(snapshot_store):
+    code = '<p>the same line again</p>\n' * 1000 + '\udc80 surrogate\n'
+    snapshot_store.save_body('site', 'old', code, chunks=[[10, 'abc']])
+    stored = snapshot_store.connection.execute("SELECT body FROM bodies").fetchone()[0]
+    assert len(stored) < len(code) / 10
+    assert snapshot_store.load_body('site', 'old') == code
+    assert snapshot_store.load_chunks('site', 'old') == [[10, 'abc']]
+    assert snapshot_store.has_body('site', 'old') and not snapshot_store.has_body('site', 'new')
+    assert snapshot_store.load_body('site', 'new') is None
+
+
+def get_Labels(snapshot_store, name: str) -> list:
+    return [row[0] for row in snapshot_store.connection.execute("SELECT label FROM history WHERE name = ? ORDER BY id",
+                                                                (name,))]
+
+
+def test_history_keeps_the_latest_snapshots(snapshot_store):
+    for number in range(5):
+        snapshot_store.add_history('site', f'snapshot{number}', '<p>code</p>')
+    snapshot_store.add_history('other', 'other0', '<p>code</p>')
+    assert get_Labels(snapshot_store, 'site') == ['snapshot2', 'snapshot3', 'snapshot4']
+    assert get_Labels(snapshot_store, 'other') == ['other0']
+
+
+def test_history_days_deletes_the_old_snapshots(tmp_path, monkeypatch):
+    now = [1_600_000_000.0]
+    monkeypatch.setattr(store.time, 'time', lambda: now[0])
+    snapshot_store = store.SnapshotStore(str(tmp_path / 'snapshots.db'), history_limit=10, history_days=2)
+    snapshot_store.add_history('site', 'old', '<p>code</p>')
+    now[0] += 86400
+    snapshot_store.add_history('other', 'newer', '<p>code</p>')
+    now[0] += 1.5 * 86400
+    snapshot_store.add_history('site', 'newest', '<p>code</p>')
+    assert get_Labels(snapshot_store, 'site') == ['newest']
+    assert get_Labels(snapshot_store, 'other') == ['newer']
+    snapshot_store.close()
+
+
+def test_removed_webpage_is_deleted_from_the_store(snapshot_store):
+    webpages = []
+    for name in ['removed', 'kept']:
+        webpage = checker.Webpage(name, 'http://127.0.0.1/')
+        webpage.set_store(snapshot_store)
+        webpage.save_html('old', '<p>code</p>')
+        webpage.save_state()
+        snapshot_store.add_history(name, 'snapshot', '<p>code</p>')
+        webpages.append(webpage)
+
+    check_engine = engine.CheckEngine(workers=1)
+    check_engine.remove(webpages[0], forget=True)
+    check_engine.remove(webpages[1])
+    check_engine.shutdown()
+    assert snapshot_store.load_state('removed') is None and not snapshot_store.has_body('removed', 'old')
+    assert get_Labels(snapshot_store, 'removed') == []
+    assert webpages[1].load_state() and get_Labels(snapshot_store, 'kept') == ['snapshot']
+
+
+def test_webpage_removed_while_running_is_deleted_after_it_saves(snapshot_store, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def find_DeltaChange(self, wait_time=None):
+        started.set()
+        release.wait(5)
+        self.save_html('old', '<p>code</p>')
+        self.save_state()
+    monkeypatch.setattr(checker.Webpage, 'find_DeltaChange', find_DeltaChange)
+    webpage = checker.Webpage('removed', 'http://127.0.0.1/')
+    webpage.set_store(snapshot_store)
+
+    check_engine = engine.CheckEngine(workers=1)
+    check_engine.submit_Baselines([(webpage, None)])
+    assert started.wait(5)
+    check_engine.remove(webpage, forget=True)
+    release.set()
+    check_engine.shutdown(wait_for_checks=True)
+    assert snapshot_store.load_state('removed') is None and not snapshot_store.has_body('removed', 'old')
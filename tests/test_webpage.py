@@ -0,0 +1,136 @@
+#  Copyright (c) 2020. RoguedBear
+import gc
+import logging
+
+import pytest
+
+import checker
+import store
+
+
+def test_webpages_log_through_the_shared_logger(caplog):
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    logging.getLogger("Webpage").setLevel(logging.WARNING)
+    try:
+        with caplog.at_level(logging.DEBUG, logger="Webpage"):
+            webpage.logger.info("checked")
+            logging.getLogger("Webpage").setLevel(logging.ERROR)
+            webpage.logger.warning("filtered by the Webpage logger's level")
+    finally:
+        logging.getLogger("Webpage").setLevel(logging.NOTSET)
+    assert [(record.name, record.site, record.getMessage()) for record in caplog.records] == \
+           [("Webpage", 'site', '"site": checked')]
+    assert '"site"' not in logging.Logger.manager.loggerDict
+
+
+def test_deltaChange_is_forgotten_when_no_webpage_uses_it():
+    patterns = ['token=(.*?)"', 'unused pattern 42']
+    first, second = checker.Webpage('a', 'http://127.0.0.1/'), checker.Webpage('b', 'http://127.0.0.1/')
+    first.set_deltaChange(patterns)
+    second.set_deltaChange(patterns)
+    delta_change_id = first.delta_change_id
+    assert second.delta_change_id == delta_change_id
+    assert first.get_mask() is not None
+
+    del first
+    gc.collect()
+    assert second.get_deltaChange() == patterns
+
+    # Replacing it releases it too
+    second.set_deltaChange([])
+    assert delta_change_id not in checker.DELTA_CHANGES
+    assert tuple(patterns) not in checker.DELTA_CHANGE_IDS
+
+    # Interning it again gives a new id, so the cached mask of the old one is never used for another deltaChange
+    second.set_deltaChange(patterns)
+    assert second.delta_change_id > delta_change_id
+    del second
+    gc.collect()
+    assert tuple(patterns) not in checker.DELTA_CHANGE_IDS
+
+
+def test_saved_state_is_not_reused_by_another_comparison_mode(tmp_path):
+    snapshot_store = store.SnapshotStore(str(tmp_path / 'snapshots.db'))
+    row = ['site', 'http://127.0.0.1/']
+
+    def make_Webpage(text_only: bool) -> checker.Webpage:
+        webpage = checker.Webpage('site', 'http://127.0.0.1/')
+        webpage.set_config(row)
+        webpage.set_store(snapshot_store)
+        if text_only:
+            webpage.set_textOnly()
+        return webpage
+
+    html = make_Webpage(False)
+    html.save_html('old', '<p>text</p>\n')
+    html.save_state()
+    assert make_Webpage(False).load_state()
+    # The html saved by --method 2 would be diffed against the text blocks of --method 4
+    assert not make_Webpage(True).load_state()
+    snapshot_store.close()
+
+
+def test_mask_is_compiled_once_and_dropped_with_its_deltaChange(monkeypatch):
+    compiled = []
+    compile_Mask = checker.compile_Mask
+    monkeypatch.setattr(checker, 'compile_Mask', lambda patterns: compiled.append(patterns) or compile_Mask(patterns))
+    webpage = checker.Webpage('a', 'http://127.0.0.1/')
+    webpage.set_deltaChange(['session=[0-9][0-9]*', 'only in this test'])
+    delta_change_id = webpage.delta_change_id
+    for _ in range(3):
+        checker.fingerprint_Code('<p>session=123</p>\n', webpage.get_mask())
+    assert len(compiled) == 1
+
+    del webpage
+    gc.collect()
+    assert delta_change_id not in checker.DELTA_MASKS
+
+
+def test_load_state_does_not_load_the_html(tmp_path, monkeypatch):
+    snapshot_store = store.SnapshotStore(str(tmp_path / 'snapshots.db'))
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_store(snapshot_store)
+    webpage.save_state()
+    # Without its html the state can't be resumed
+    assert not webpage.load_state()
+
+    webpage.save_html('old', '<p>text</p>\n')
+    monkeypatch.setattr(snapshot_store, 'load_body', None)
+    assert webpage.load_state()
+    snapshot_store.close()
+
+
+def test_failed_and_skipped_checks_leave_the_adaptive_interval(monkeypatch):
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_interval(600)
+    webpage.set_adaptive(60, 6000)
+
+    def get_webpage(self, conditional=False):
+        raise checker.FetchFailed("refused")
+    monkeypatch.setattr(checker.Webpage, 'get_webpage', get_webpage)
+    for _ in range(5):
+        # Failing, then skipped by the circuit breaker
+        change_detected, output = webpage.detect(2)
+        assert (change_detected, output) == (None, '')
+        webpage.adapt_Interval(change_detected)
+    assert webpage.get_interval() == 600
+
+    webpage.adapt_Interval(False)
+    assert webpage.get_interval() == 600 * checker.ADAPTIVE_BACKOFF
+
+
+@pytest.mark.parametrize('method', [1, 2])
+def test_same_fingerprint_is_no_change_without_diffing_or_writing(method, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    webpage = checker.Webpage('site', 'http://127.0.0.1/')
+    webpage.set_deltaChange(['Visitors: [0-9][0-9]*'])
+    webpage.save_html('old', '<p>Visitors: 10</p>\n<p>some text</p>\n')
+    files = sorted(tmp_path.iterdir())
+
+    # Only the amount of whitespace, the blank lines and the deltaChange differ
+    new_code = '<p>Visitors: 12</p>\n\n<p>some   text</p>\t\n'
+    monkeypatch.setattr(checker.Webpage, 'get_webpage', lambda self, conditional=False: new_code)
+    for name in ['method1_diff', 'method2_difflib', 'save_html', 'save_state']:
+        monkeypatch.setattr(checker.Webpage, name, None)
+    assert webpage.detect(method) == (False, '')
+    assert sorted(tmp_path.iterdir()) == files
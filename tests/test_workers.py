@@ -0,0 +1,43 @@
+#  Copyright (c) 2020. RoguedBear
+import logging
+
+import pytest
+
+import config
+import metrics
+import workers
+
+OPTIONS = {'threads': 2, 'host_limit': 1, 'method': 1, 'store': None, 'history': 0,
+           'log_format': '%(name)s: %(message)s', 'log_level': logging.WARNING}
+
+
+@pytest.fixture
+def pool():
+    worker_pool = workers.WorkerPool(1, config.Settings(60), OPTIONS)
+    yield worker_pool
+    worker_pool.shutdown(timeout=2)
+
+
+def test_bad_row_does_not_kill_the_worker(pool):
+    webpage, = pool.add_Rows([['onlyname']])
+    assert pool.wait_Added() == [(webpage, None)]
+    assert pool.webpages == {}
+    assert pool.processes[0].is_alive()
+
+
+def test_wait_Added_returns_when_a_worker_died(pool):
+    pool.processes[0].terminate()
+    pool.processes[0].join()
+    pool.add_Rows([['a', 'http://127.0.0.1:1/']])
+    assert pool.wait_Added() == []
+
+
+def test_worker_metrics_reach_the_coordinator(pool, monkeypatch):
+    monkeypatch.setattr(metrics, 'REGISTRY', metrics.Registry())
+    pool.add_Rows([['a', 'http://127.0.0.1:1/', '', 'False']])
+    pool.wait_Added()
+    for _ in range(50):
+        if 'worker-0' in metrics.REGISTRY.remotes:
+            break
+        pool.collect(timeout=0.1)
+    assert 'webpage_baseline_seconds' in metrics.REGISTRY.get_Summary()
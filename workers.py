@@ -0,0 +1,382 @@
+#  Copyright (c) 2020. RoguedBear
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+import checker
+import config
+import engine
+import metrics
+import store
+
+# The workers are forked from main.py, so they start with its modules and settings instead of importing them afresh
+CONTEXT = multiprocessing.get_context('fork')
+# Seconds between the metrics snapshots a busy worker sends to the coordinator
+METRICS_INTERVAL = 5
+
+
+class RemoteWebpage:
+    """
+    Stands in the coordinator (main process) for a Webpage which lives in a worker process. It has what the
+    Scheduler and the main loop need: the name, the config row, the interval, the fetch key and the delay to retry
+    finding its deltaChange after it failed.
+    key  : int, unique for every row added, so that the results of a removed webpage can't be mistaken for those of
+           the webpage which replaced it
+    row  : list, the csv row
+    shard: int, the worker process which owns the webpage
+    """
+
+    __slots__ = ('key', 'name', 'config', 'shard', 'interval', 'fetch_key', 'retry_delay')
+
+    def __init__(self, key: int, row: list, shard: int):
+        self.key = key
+        self.name = row[0].strip()
+        self.config = checker.config_Signature(row)
+        self.shard = shard
+        self.interval = None
+        self.fetch_key = None
+        self.retry_delay = None
+
+    # Logs through WEBPAGE_LOGGER, like the Webpage's
+    logger = checker.Webpage.logger
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_interval(self) -> float:
+        return self.interval
+
+    def get_fetchKey(self) -> tuple:
+        """
+        Returns the fetch key of the webpage in its worker (see Webpage.get_fetchKey()), None till it's created there
+        """
+        return self.fetch_key
+
+    def get_retryDelay(self) -> float:
+        return self.retry_delay
+
+    def adapt_Interval(self, change_detected: bool) -> None:
+        """
+        Does nothing, the worker adapts the interval and sends it with the result of the check
+        """
+
+
+class WorkerPool:
+    """
+    Checks the webpages in `workers` processes instead of threads of the main process, so that parsing and diffing
+    thousands of webpages is not limited to a single core by the GIL. Every webpage is owned by the same worker
+    (shard_Of()) across restarts, along with its snapshot store file (shard_Store()).
+    Has the same methods as CheckEngine, working with RemoteWebpage instead of Webpage.
+    workers : int, the number of processes
+    settings: config.Settings, its store is replaced by each worker's own store
+    options : dict, 'threads', 'host_limit', 'method', 'store', 'history', 'history_days', 'log_format', 'log_level'
+
+    -----------
+    Methods:
+      - add_Rows()         : sends the config rows to their workers, which create the webpages and find their
+                             deltaChange (or resume them from their store)
+      - wait_Added()       : waits till all the added rows have been created (or failed)
+      - check_Workers()    : logs the workers which have died, and stops waiting for their rows
+      - collect_BaselineResults(): returns the webpages created (or failed) since the last call, without waiting
+      - remove()           : removes a webpage from its worker
+      - submit()           : starts checking the webpages in their workers
+      - collect()          : returns the results of the checks which have finished
+      - wake()             : makes a waiting collect() return early
+      - shutdown()         : stops the workers
+    """
+
+    def __init__(self, workers: int, settings: config.Settings, options: dict):
+        self.workers = max(1, workers)
+        self.events = CONTEXT.Queue()
+        self.commands = [CONTEXT.Queue() for _ in range(self.workers)]
+        self.processes = [CONTEXT.Process(target=run_Worker, name=f'worker-{shard}', daemon=True,
+                                          args=(shard, settings, options, self.commands[shard], self.events))
+                          for shard in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        self._keys = itertools.count()
+        self.webpages = {}
+        self._pending = set()
+        self._dead = set()
+        self._baseline_results = []
+        self._results = []
+        self.logger = logging.getLogger("WorkerPool")
+        self.logger.info(f"Started {self.workers} worker processes")
+
+    def add_Rows(self, rows: List[list]) -> List[RemoteWebpage]:
+        """
+        Sends the config rows to their workers
+        :param rows: list of csv rows
+        :return: list of RemoteWebpage, the webpages of the rows, ready once they come back from
+        collect_BaselineResults()
+        """
+        added = []
+        for row in rows:
+            url = row[1].strip() if len(row) > 1 else ''
+            webpage = RemoteWebpage(next(self._keys), row, shard_Of(checker.format_url(url) if url else url,
+                                                                      self.workers))
+            self.webpages[webpage.key] = webpage
+            self._pending.add(webpage.key)
+            self.commands[webpage.shard].put(('add', webpage.key, row))
+            added.append(webpage)
+        return added
+
+    def wait_Added(self) -> List[Tuple[RemoteWebpage, bool]]:
+        """
+        Waits till all the rows sent by add_Rows() have been created and have found their deltaChange, or failed to
+        :return: list of (RemoteWebpage, bool), same as collect_BaselineResults()
+        """
+        while self._pending:
+            try:
+                self.handle_Event(self.events.get(timeout=1))
+            except queue.Empty:
+                self.check_Workers()
+        return self.collect_BaselineResults()
+
+    def check_Workers(self) -> None:
+        """
+        Logs the workers which have died since the last call. The rows they were creating are not waited for, and
+        their webpages aren't checked anymore
+        :return: None
+        """
+        for shard, process in enumerate(self.processes):
+            if shard in self._dead or process.is_alive():
+                continue
+            self._dead.add(shard)
+            lost = [webpage for webpage in self.webpages.values() if webpage.shard == shard]
+            self.logger.error(f"Worker {shard} died (exit code {process.exitcode}), {len(lost)} webpage(s) it "
+                              f"owned are not checked anymore")
+            self._pending.difference_update(webpage.key for webpage in lost)
+
+    def collect_BaselineResults(self) -> List[Tuple[RemoteWebpage, bool]]:
+        """
+        Returns the webpages which have been created since the last call, with whether their deltaChange was found.
+        The failed ones find it again when they are submitted (after their retry delay)
+        :return: list of (RemoteWebpage, bool), None instead of the bool if the worker could not create the webpage
+        from its row
+        """
+        self.drain_Events()
+        results, self._baseline_results = self._baseline_results, []
+        return results
+
+    def remove(self, webpage: RemoteWebpage, forget=False) -> None:
+        """
+        Removes the webpage from its worker
+        :param webpage: RemoteWebpage
+        :param forget: bool, also delete it from the worker's snapshot store, see CheckEngine.remove()
+        :return: None
+        """
+        self.webpages.pop(webpage.key, None)
+        self._pending.discard(webpage.key)
+        self.commands[webpage.shard].put(('remove', webpage.key, forget))
+
+    def submit(self, webpages: List[RemoteWebpage]) -> None:
+        """
+        Starts checking the webpages in their workers. The ones whose deltaChange could not be found find it again
+        :param webpages: list of RemoteWebpage
+        :return: None
+        """
+        by_shard = {}
+        for webpage in webpages:
+            by_shard.setdefault(webpage.shard, []).append(webpage.key)
+        for shard, keys in by_shard.items():
+            self.commands[shard].put(('check', keys))
+
+    def collect(self, timeout: float = 0) -> List[Tuple[RemoteWebpage, bool, str]]:
+        """
+        Returns the results of the checks which have finished. Waits (upto timeout) for at least one event from the
+        workers if there's none.
+        :param timeout: float, seconds
+        :return: list of (webpage, change_detected, output)
+        """
+        if not self._results and not self._baseline_results:
+            try:
+                self.handle_Event(self.events.get(timeout=timeout) if timeout else self.events.get_nowait())
+            except queue.Empty:
+                self.check_Workers()
+        self.drain_Events()
+        results, self._results = self._results, []
+        return results
+
+    def drain_Events(self) -> None:
+        """
+        Handles all the events the workers have sent, without waiting
+        :return: None
+        """
+        while True:
+            try:
+                self.handle_Event(self.events.get_nowait())
+            except queue.Empty:
+                return
+
+    def handle_Event(self, event: tuple) -> None:
+        """
+        Handles an event sent by a worker: ('added', key, interval, fetch key), ('failed', key, retry delay, fetch key),
+        ('invalid', key), ('checked', key, change_detected, output, interval) or ('metrics', shard, snapshot).
+        Or ('wake', None) from wake()
+        :param event: tuple
+        :return: None
+        """
+        kind, key = event[0], event[1]
+        if kind == 'wake':
+            return
+        if kind == 'metrics':
+            # Served with the coordinator's own metrics (--metrics-port/--metrics-json)
+            metrics.REGISTRY.set_Remote(f'worker-{key}', event[2])
+            return
+        self._pending.discard(key)
+        webpage = self.webpages.get(key)
+        if webpage is None:
+            # Removed while the worker was busy with it
+            return
+        if kind == 'invalid':
+            # The worker could not create it from its row, it's dropped till the config file changes
+            del self.webpages[key]
+            self._baseline_results.append((webpage, None))
+        elif kind == 'added':
+            webpage.interval, webpage.fetch_key = event[2], event[3]
+            self._baseline_results.append((webpage, True))
+        elif kind == 'failed':
+            webpage.retry_delay, webpage.fetch_key = event[2], event[3]
+            self._baseline_results.append((webpage, False))
+        elif kind == 'checked':
+            webpage.interval = event[4]
+            self._results.append((webpage, event[2], event[3]))
+
+    def wake(self) -> None:
+        """
+        Makes collect() return now if it is waiting, or the next time it is called
+        :return: None
+        """
+        self.events.put(('wake', None))
+
+    def shutdown(self, timeout: float = 10) -> None:
+        """
+        Stops the workers, waiting upto timeout seconds for them to close their stores
+        :param timeout: float
+        :return: None
+        """
+        for commands in self.commands:
+            commands.put(('stop',))
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def shard_Of(url: str, workers: int) -> int:
+    """
+    Returns the worker which owns the webpage. Stable across restarts (unlike hash()), as long as the number of
+    workers is the same. The webpages of the same url go to the same worker, so that they can share its downloads
+    :param url: str, the webpage's url, formatted by checker.format_url()
+    :param workers: int
+    :return: int
+    """
+    return zlib.crc32(url.encode('utf-8')) % workers
+
+
+def shard_Store(filename: str, shard: int) -> str:
+    """
+    Returns the snapshot store file of a worker. eg: snapshots.db -> snapshots.shard0.db
+    :param filename: str, --store
+    :param shard: int
+    :return: str
+    """
+    root, extension = os.path.splitext(filename)
+    return f"{root}.shard{shard}{extension}"
+
+
+def run_Worker(shard: int, settings: config.Settings, options: dict, commands: multiprocessing.Queue,
+               events: multiprocessing.Queue) -> None:
+    """
+    A worker process: creates and checks its webpages with its own CheckEngine and snapshot store, as the
+    coordinator commands: ('add', key, row), ('remove', key, forget), ('check', [keys]) and ('stop',).
+    The results are sent back as events, see WorkerPool.handle_Event(). So are the worker's metrics, every
+    METRICS_INTERVAL seconds while it is busy and whenever it goes idle.
+    :return: None
+    """
+    logging.basicConfig(format=options['log_format'], datefmt='%d/%m/%y %H:%M:%S', level=options['log_level'])
+    # Only this worker's metrics, not the ones forked from the coordinator
+    metrics.REGISTRY = metrics.Registry()
+    sent_snapshot, sent_at = None, time.monotonic()
+    logger = logging.getLogger(f"Worker-{shard}")
+    if options['store']:
+        settings.store = store.SnapshotStore(shard_Store(options['store'], shard), history_limit=options['history'],
+                                             history_days=options['history_days'])
+    checker.create_Session(pool_size=options['threads'])
+    check_engine = engine.CheckEngine(workers=options['threads'], per_host=options['host_limit'],
+                                      method=options['method'], debug=True)
+    # Every webpage created, the check engine knows which ones still need their deltaChange
+    webpages: Dict[int, checker.Webpage] = {}
+    keys: Dict[checker.Webpage, int] = {}
+
+    running = True
+    while running:
+        # Waiting for a command, or just a moment if something is running
+        try:
+            command = commands.get(timeout=0.05) if check_engine.is_Busy() else commands.get()
+        except queue.Empty:
+            command = None
+        while command is not None:
+            if command[0] == 'stop':
+                running = False
+                break
+            if command[0] == 'add':
+                key, row = command[1], command[2]
+                # A bad row must not take down the worker, along with every other webpage it owns
+                try:
+                    webpage, wait_time = config.create_Webpage(row, settings)
+                    resumed = webpage.load_state()
+                except Exception:
+                    logger.exception(f"Could not create a webpage from the row {row}")
+                    events.put(('invalid', key))
+                else:
+                    webpages[key], keys[webpage] = webpage, key
+                    if resumed:
+                        logger.info(f"Resumed \"{webpage.get_name()}\" from snapshot store.")
+                        events.put(('added', key, webpage.get_interval(), webpage.get_fetchKey()))
+                    else:
+                        check_engine.submit_Baselines([(webpage, wait_time)])
+            elif command[0] == 'remove':
+                webpage = webpages.pop(command[1], None)
+                if webpage is not None:
+                    del keys[webpage]
+                    check_engine.remove(webpage, forget=command[2])
+            elif command[0] == 'check':
+                # The webpages whose deltaChange could not be found try again
+                check_engine.submit([webpages[key] for key in command[1] if key in webpages])
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                command = None
+
+        # Results of the webpages removed meanwhile are dropped
+        for webpage, found in check_engine.collect_BaselineResults():
+            key = keys.get(webpage)
+            if key is None:
+                continue
+            if found:
+                events.put(('added', key, webpage.get_interval(), webpage.get_fetchKey()))
+            else:
+                events.put(('failed', key, webpage.get_retryDelay(), webpage.get_fetchKey()))
+        for webpage, change_detected, output in check_engine.collect():
+            key = keys.get(webpage)
+            if key is None:
+                continue
+            webpage.adapt_Interval(change_detected)
+            events.put(('checked', key, change_detected, output, webpage.get_interval()))
+
+        if not check_engine.is_Busy() or time.monotonic() - sent_at >= METRICS_INTERVAL:
+            snapshot = metrics.REGISTRY.get_Snapshot()
+            if snapshot != sent_snapshot:
+                events.put(('metrics', shard, snapshot))
+                sent_snapshot, sent_at = snapshot, time.monotonic()
+
+    check_engine.shutdown()
+    if settings.store is not None:
+        settings.store.close()